@@ -20,9 +20,6 @@ print(secrets.token_hex(32)) #set SECRET_KEY in .env = to this
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Database connection
-conn = get_connection()
-
 # Mock database
 users_db = {
   "m@example.com": {
@@ -62,13 +59,17 @@ async def login(login_input: LoginInput):
   Returns:
     Token: A response containing the email, JWT token, and expiry.
   """
-  with conn.cursor() as cursor:
-    # Query the database for the user
-    cursor.execute("SELECT password_hash FROM users WHERE email = %s;", (login_input.email,))
-    user = cursor.fetchone()
+  conn = get_connection()
+  try:
+    with conn.cursor() as cursor:
+      # Query the database for the user
+      cursor.execute("SELECT password_hash FROM users WHERE email = %s;", (login_input.email,))
+      user = cursor.fetchone()
     
-    cursor.execute("SELECT user_id FROM users WHERE email = %s;", (login_input.email,))
-    user_id_result = cursor.fetchone()
+      cursor.execute("SELECT user_id FROM users WHERE email = %s;", (login_input.email,))
+      user_id_result = cursor.fetchone()
+  finally:
+    conn.close()
 
   if not user or not verify_password(login_input.password, user["password_hash"]):
     raise HTTPException(status_code=401, detail="Invalid email or password")
@@ -93,17 +94,21 @@ def add_user(username: str, email: str, password: str):
   # Hash the password
   password_hash = bcrypt.hash(password)
 
-  with conn.cursor() as cursor:
-    try:
-      cursor.execute("""
-      INSERT INTO users (username, email, password_hash)
-      VALUES (%s, %s, %s);
-      """, (username, email, password_hash))
-      conn.commit()
-      print("User added successfully!")
-    except Exception as e:
-      print(f"Error: {e}")
-      conn.rollback()
+  conn = get_connection()
+  try:
+    with conn.cursor() as cursor:
+      try:
+        cursor.execute("""
+        INSERT INTO users (username, email, password_hash)
+        VALUES (%s, %s, %s);
+        """, (username, email, password_hash))
+        conn.commit()
+        print("User added successfully!")
+      except Exception as e:
+        print(f"Error: {e}")
+        conn.rollback()
+  finally:
+    conn.close()
 
 
 # add_user("example_user", "m@example.com", "securepassword")
@@ -122,23 +127,27 @@ async def signup(login_input: LoginInput):
   # Hash the password
   password_hash = bcrypt.hash(login_input.password)
 
-  with conn.cursor() as cursor:
-    try:
-      # Insert the new user into the database
-      cursor.execute("""
-      INSERT INTO users (username, email, password_hash)
-      VALUES (%s, %s, %s);
-      """, (login_input.email.split('@')[0], login_input.email, password_hash))
-      conn.commit()
-
-      cursor.execute("SELECT user_id FROM users WHERE email = %s;", (login_input.email,))
-      user_id = cursor.fetchone()
-
-    except Exception as e:
-      # Check for duplicate email or username
-      if "unique constraint" in str(e).lower():
-        raise HTTPException(status_code=400, detail="Email already in use.")
-      raise HTTPException(status_code=500, detail="An error occurred while signing up.")
+  conn = get_connection()
+  try:
+    with conn.cursor() as cursor:
+      try:
+        # Insert the new user into the database
+        cursor.execute("""
+        INSERT INTO users (username, email, password_hash)
+        VALUES (%s, %s, %s);
+        """, (login_input.email.split('@')[0], login_input.email, password_hash))
+        conn.commit()
+
+        cursor.execute("SELECT user_id FROM users WHERE email = %s;", (login_input.email,))
+        user_id = cursor.fetchone()
+
+      except Exception as e:
+        # Check for duplicate email or username
+        if "unique constraint" in str(e).lower():
+          raise HTTPException(status_code=400, detail="Email already in use.")
+        raise HTTPException(status_code=500, detail="An error occurred while signing up.")
+  finally:
+    conn.close()
 
   # Create a token for the new user
   token = create_access_token(email=login_input.email)
@@ -1,7 +1,9 @@
 from typing import Dict
 from fastapi import APIRouter, Body, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from utils.pinecone_db import extract_insights_from_chatlog, generate_embeddings, store_embeddings_in_pinecone, generate_query_embedding, search_in_pinecone
 from database.database import get_connection
+from utils.job_queue import report_progress
 from datetime import datetime
 import re
 
@@ -17,50 +19,90 @@ async def process_chatlog(file: UploadFile = File(...), user_id: int = Body(...)
     if not file.content_type.startswith("text/"):
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload a valid text file.")
     
+    # Read and decode the uploaded file
+    chatlog_content = await file.read()
     try:
-        # Read and decode the uploaded file
-        chatlog_content = await file.read()
-        try:
-            chatlog_content = chatlog_content.decode('utf-8')
-        except UnicodeDecodeError:
-            raise HTTPException(status_code=400, detail="Failed to decode the file. Ensure it is UTF-8 encoded.")
-        
-        # Extract insights using the Llama model
-        dict_item_context = extract_insights_from_chatlog(chatlog_content)
+        chatlog_content = chatlog_content.decode('utf-8')
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Failed to decode the file. Ensure it is UTF-8 encoded.")
 
-        # Check if insights were extracted successfully
-        if not dict_item_context.get("items"):
-            raise HTTPException(status_code=400, detail="No insights extracted from the chat log.")
+    try:
+        dict_item_context = await run_in_threadpool(process_chatlog_content, user_id, file.filename, chatlog_content)
+    except HTTPException:
+        raise
+    except Exception as e:
+        # Catch and log unexpected errors
+        print(f"Error processing chat log: {e}")
+        raise HTTPException(status_code=500, detail="An error occurred while processing the chat log.")
+
+    # Return a success response
+    return {
+        "message": "Chat log processed successfully",
+        "items": dict_item_context["items"],
+        "context": dict_item_context["context"],
+        "messages": dict_item_context["messages"],
+    }
 
-        # Generate embeddings
-        embeddings = generate_embeddings(dict_item_context)
 
-        # Save chat log to the database
-        chat_id = save_chatlog_to_db(user_id=user_id, chat_title=file.filename)
+def process_chatlog_content(user_id, filename, chatlog_content, job=None):
+    """
+    Extracts insights from a chat log, saves it and its messages and indexes
+    the message embeddings. Shared by /process_chatlog and the job worker.
+
+    When `job` is set, progress is reported per stage and the LLM output,
+    chat_id and message ids are checkpointed, so a retried job neither calls
+    the LLM again nor inserts the chat log twice.
+    """
+    checkpoint = job.checkpoint if job is not None else {}
+
+    # Extract insights using the Llama model
+    report_progress(job, "extract")
+    dict_item_context = checkpoint.get("insights")
+    if dict_item_context is None:
+        dict_item_context = extract_insights_from_chatlog(chatlog_content)
+        if job is not None:
+            job.save_checkpoint(insights=dict_item_context)
+    report_progress(job, "extract", "done")
+
+    # Check if insights were extracted successfully
+    if not dict_item_context.get("items"):
+        raise HTTPException(status_code=400, detail="No insights extracted from the chat log.")
+
+    # Generate embeddings
+    report_progress(job, "embed", total=len(dict_item_context["items"]))
+    embeddings = generate_embeddings(dict_item_context)
+    report_progress(job, "embed", "done", done=len(dict_item_context["items"]), total=len(dict_item_context["items"]))
+
+    # Save chat log to the database
+    report_progress(job, "save")
+    chat_id = checkpoint.get("chat_id")
+    if chat_id is None:
+        chat_id = save_chatlog_to_db(user_id=user_id, chat_title=filename)
         if not chat_id:
             raise HTTPException(status_code=500, detail="Error saving chat log to the database.")
-
-        # Save messages and store embeddings if present
-        if dict_item_context.get("messages", []) and chat_id:
+        if job is not None:
+            job.save_checkpoint(chat_id=chat_id)
+
+    # Save messages and store embeddings if present
+    if dict_item_context.get("messages", []) and chat_id:
+        if "message_ids" in checkpoint:
+            dict_item_context["ids"] = checkpoint["message_ids"]
+        else:
             dict_item_context = save_message_to_db(dict_item_context, chat_id=chat_id)
-            store_embeddings_in_pinecone(
-                dict_item_context, embeddings, chat_id=chat_id,
-                file=file.filename, user_id=user_id, image_id=0, type="message"
-            )
-
-        # Return a success response
-        return {
-            "message": "Chat log processed successfully",
-            "items": dict_item_context["items"],
-            "context": dict_item_context["context"],
-            "messages": dict_item_context["messages"],
-        }
+            if job is not None:
+                job.save_checkpoint(message_ids=dict_item_context["ids"])
+        report_progress(job, "save", "done")
 
-    except Exception as e:
-        # Catch and log unexpected errors
-        print(f"Error processing chat log: {e}")
-        raise HTTPException(status_code=500, detail="An error occurred while processing the chat log.")
+        report_progress(job, "index", total=len(dict_item_context["ids"]))
+        store_embeddings_in_pinecone(
+            dict_item_context, embeddings, chat_id=chat_id,
+            file=filename, user_id=user_id, image_id=0, type="message"
+        )
+        report_progress(job, "index", "done", done=len(dict_item_context["ids"]), total=len(dict_item_context["ids"]))
+    else:
+        report_progress(job, "save", "done")
 
+    return dict_item_context
 
 
 def save_chatlog_to_db(user_id, chat_title):
@@ -104,11 +146,11 @@ def save_message_to_db(dict_item_context, chat_id):
 
         # Prepare SQL query to insert the message data
         query = """
-            INSERT INTO messages (chat_id, sender, receiver, message, timestamp)
-            VALUES (%s, %s, %s, %s, %s) RETURNING message_id
+            INSERT INTO messages (chat_id, sender, receiver, message, timestamp, item, context)
+            VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING message_id
         """
 
-        for message in messages:
+        for i, message in enumerate(messages):
             # Attempt to parse the message
             parsed_message = parse_message(message)
             if parsed_message:
@@ -117,7 +159,10 @@ def save_message_to_db(dict_item_context, chat_id):
                     parsed_message["sender"],
                     parsed_message.get("receiver", None),
                     parsed_message["message"],
-                    parsed_message["timestamp"]
+                    parsed_message["timestamp"],
+                    # Kept so the message can be re-embedded without the LLM
+                    dict_item_context["items"][i],
+                    dict_item_context["context"][i],
                 ))
 
                 dict_item_context["ids"].append(cursor.fetchone()["message_id"])
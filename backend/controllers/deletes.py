@@ -0,0 +1,181 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from utils import metrics
+from utils.blob_store import get_blob_store
+from utils.pinecone_db import delete_chat_vectors, delete_image_vectors, delete_user_vectors
+from database.database import get_connection
+
+router = APIRouter()
+
+'''
+Deletes of a user's photos, chat logs or all of their data.
+
+Vectors are deleted first, by id or by dropping the user's namespace
+(utils/pinecone_db.py), and the Postgres rows only once that succeeded: the
+vector ids are derived from those rows, so a failed delete can simply be
+retried.
+'''
+
+
+def fetch_owner(table, id_column, row_id):
+  conn = get_connection()
+  cursor = None
+
+  try:
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT user_id FROM {table} WHERE {id_column} = %s", (row_id,))
+    row = cursor.fetchone()
+    return row["user_id"] if row else None
+
+  finally:
+    if cursor:
+      cursor.close()
+    if conn:
+      conn.close()
+
+
+def delete_image_row(image_id):
+  """Deletes an image row; returns its blob key when no other row shares the blob."""
+  conn = get_connection()
+  cursor = None
+
+  try:
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM images WHERE image_id = %s RETURNING blob_key", (image_id,))
+    row = cursor.fetchone()
+    blob_key = row["blob_key"] if row else None
+    if blob_key:
+      # Identical uploads share one blob
+      cursor.execute("SELECT 1 FROM images WHERE blob_key = %s LIMIT 1", (blob_key,))
+      if cursor.fetchone():
+        blob_key = None
+    conn.commit()
+    return blob_key
+
+  except Exception:
+    conn.rollback()
+    raise
+
+  finally:
+    if cursor:
+      cursor.close()
+    if conn:
+      conn.close()
+
+
+def delete_chatlog_rows(chat_id):
+  conn = get_connection()
+  cursor = None
+
+  try:
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM messages WHERE chat_id = %s", (chat_id,))
+    messages = cursor.rowcount
+    cursor.execute("DELETE FROM chat_logs WHERE chat_id = %s", (chat_id,))
+    conn.commit()
+    return messages
+
+  except Exception:
+    conn.rollback()
+    raise
+
+  finally:
+    if cursor:
+      cursor.close()
+    if conn:
+      conn.close()
+
+
+def delete_user_rows(user_id):
+  """Deletes every chat log, message and image of a user; returns counts and the orphaned blob keys."""
+  conn = get_connection()
+  cursor = None
+
+  try:
+    cursor = conn.cursor()
+    cursor.execute("""
+      DELETE FROM messages
+      WHERE chat_id IN (SELECT chat_id FROM chat_logs WHERE user_id = %s)
+    """, (user_id,))
+    messages = cursor.rowcount
+    cursor.execute("DELETE FROM chat_logs WHERE user_id = %s", (user_id,))
+    chat_logs = cursor.rowcount
+    cursor.execute("DELETE FROM images WHERE user_id = %s RETURNING blob_key", (user_id,))
+    blob_keys = {row["blob_key"] for row in cursor.fetchall() if row["blob_key"]}
+    images = cursor.rowcount
+    if blob_keys:
+      cursor.execute("SELECT DISTINCT blob_key FROM images WHERE blob_key = ANY(%s)", (list(blob_keys),))
+      blob_keys -= {row["blob_key"] for row in cursor.fetchall()}
+    conn.commit()
+    return {"chat_logs": chat_logs, "messages": messages, "images": images}, blob_keys
+
+  except Exception:
+    conn.rollback()
+    raise
+
+  finally:
+    if cursor:
+      cursor.close()
+    if conn:
+      conn.close()
+
+
+def delete_blobs(blob_keys):
+  store = get_blob_store()
+  for key in blob_keys:
+    try:
+      store.delete(key)
+    except Exception as e:
+      # The row is gone already; an orphaned blob only costs storage
+      print(f"Error deleting blob {key}: {e}")
+      metrics.increment("deletes.blob_failed")
+
+
+def check_owner(table, id_column, row_id, user_id, name):
+  owner = fetch_owner(table, id_column, row_id)
+  if owner is None or owner != user_id:
+    raise HTTPException(status_code=404, detail=f"{name} not found.")
+
+
+@router.delete("/images/{image_id}")
+async def delete_image(image_id: int, user_id: int):
+  """Deletes a photo: its vectors, its row and, unless another row shares it, its blob."""
+  await run_in_threadpool(check_owner, "images", "image_id", image_id, user_id, "Image")
+  try:
+    vectors = await run_in_threadpool(delete_image_vectors, image_id, user_id)
+    blob_key = await run_in_threadpool(delete_image_row, image_id)
+  except Exception as e:
+    print(f"Error deleting image {image_id}: {e}")
+    raise HTTPException(status_code=500, detail=f"Error deleting image: {e}")
+  if blob_key:
+    await run_in_threadpool(delete_blobs, [blob_key])
+  metrics.increment("deletes.image")
+  return {"image_id": image_id, "vectors": vectors}
+
+
+@router.delete("/chatlogs/{chat_id}")
+async def delete_chatlog(chat_id: int, user_id: int):
+  """Deletes a chat log with its messages and their vectors."""
+  await run_in_threadpool(check_owner, "chat_logs", "chat_id", chat_id, user_id, "Chat log")
+  try:
+    vectors = await run_in_threadpool(delete_chat_vectors, chat_id, user_id)
+    messages = await run_in_threadpool(delete_chatlog_rows, chat_id)
+  except Exception as e:
+    print(f"Error deleting chat log {chat_id}: {e}")
+    raise HTTPException(status_code=500, detail=f"Error deleting chat log: {e}")
+  metrics.increment("deletes.chatlog")
+  return {"chat_id": chat_id, "messages": messages, "vectors": vectors}
+
+
+@router.delete("/users/{user_id}/data")
+async def delete_user_data(user_id: int):
+  """Deletes every photo, chat log and vector of a user; the account itself stays."""
+  try:
+    await run_in_threadpool(delete_user_vectors, user_id)
+    counts, blob_keys = await run_in_threadpool(delete_user_rows, user_id)
+  except Exception as e:
+    print(f"Error deleting data of user {user_id}: {e}")
+    raise HTTPException(status_code=500, detail=f"Error deleting user data: {e}")
+  await run_in_threadpool(delete_blobs, blob_keys)
+  metrics.increment("deletes.user")
+  return {"user_id": user_id, **counts}
@@ -1,71 +1,505 @@
 import os
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile
-from fastapi.responses import StreamingResponse
+import tempfile
 from io import BytesIO
+from typing import List, Optional
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
 import torch
 import numpy as np
-from detectron2.engine import DefaultPredictor
-from detectron2.config import get_cfg
-from detectron2 import model_zoo
-from PIL import Image, ImageDraw
-from detectron2.data import MetadataCatalog
-from transformers import CLIPProcessor, CLIPModel
-from utils.pinecone_db import query_index, store_embeddings_in_pinecone
+from utils import metrics
+from utils.model_registry import DETECTION_SCORE_THRESHOLD, get_clip, get_predictor, get_coco_classes, inference_context
+from utils.detections import pack_detections, put_detections, get_detections, get_user_detections, filter_detections, count_labels, draw_overlay
+from utils.pinecone_db import build_image_vector, store_image_embeddings_in_pinecone
+from utils.inference_executor import submit_inference
+from utils.image_preprocessing import IMAGE_MAX_SIDE, load_image
+from utils.video import collapse_regions, sample_keyframes
+from utils.blob_store import get_blob_store
+from utils.image_derivatives import pick_width, make_etag, etag_matches, sniff_media_type, get_derivative
+from utils.job_queue import report_progress
+from utils.image_cache import image_content_hash, find_user_images, get_cached_inferences, put_cached_inferences, get_cache_stats
 from database.database import get_connection
 from datetime import datetime
 
-# Access COCO metadata
-metadata = MetadataCatalog.get("coco_2017_val")
-COCO_CLASSES = metadata.thing_classes
+# Number of photos sent through CLIP / Faster R-CNN in a single forward pass
+DETECTION_BATCH_SIZE = int(os.getenv("DETECTION_BATCH_SIZE", 8))
 
-# print(torch.__version__)
-# print(torch.cuda.is_available())  # Should print False if it's CPU-only
-# #print(torch.device(get_cfg.MODEL.DEVICE))
-# print(torch.device)
+# Detected objects get their own CLIP embedding; tiny boxes are skipped
+MAX_REGIONS_PER_IMAGE = int(os.getenv("MAX_REGIONS_PER_IMAGE", 20))
+MIN_REGION_SIDE = 16
 
+router = APIRouter()
 
-# Initialize the Detectron2 model
-cfg = get_cfg()
-cfg.merge_from_file(model_zoo.get_config_file("COCO-Detection/faster_rcnn_R_50_FPN_3x.yaml"))
-cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url("COCO-Detection/faster_rcnn_R_50_FPN_3x.yaml")
-cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.5  # Set threshold for detection
-cfg.MODEL.DEVICE = "cpu"# Explicitly set the device to CPU
-predictor = DefaultPredictor(cfg)
-
-# Initialize CLIP for embeddings
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+def save_images_to_db(user_id, rows):
+  """
+  Inserts several images in a single transaction. The photo bytes go to the
+  blob store first and the row only keeps their key.
 
-router = APIRouter()
+  Args:
+    user_id (int): Owner of the images.
+    rows (list of dict): Each with "filename", "items", "image_data" and "content_hash".
 
-def save_image_to_db(user_id, filename, items, image_data):
+  Returns:
+    list: image_id for each row, or None for rows that failed to insert.
+  """
   conn = get_connection()
   cursor = None
+  image_ids = [None] * len(rows)
 
   try:
-    query = f"""
-      INSERT INTO images (user_id, filename, items, image_data, uploaded_at)
-      VALUES (%s, %s, %s, %s, %s) RETURNING image_id
+    query = """
+      INSERT INTO images (user_id, filename, items, blob_key, content_hash, uploaded_at)
+      VALUES (%s, %s, %s, %s, %s, %s) RETURNING image_id
     """
+    store = get_blob_store()
     cursor = conn.cursor()
-    cursor.execute(query, (user_id, filename, items, image_data, datetime.now()))
-    image_id = cursor.fetchone()['image_id']
+    for i, row in enumerate(rows):
+      # A savepoint per row keeps one bad row from rolling back the whole batch
+      cursor.execute("SAVEPOINT image_row")
+      try:
+        key = store.put(row["image_data"])
+        cursor.execute(query, (user_id, row["filename"], row["items"], key, row["content_hash"], datetime.now()))
+        image_ids[i] = cursor.fetchone()['image_id']
+        cursor.execute("RELEASE SAVEPOINT image_row")
+      except Exception as e:
+        print(f"Error saving image {row['filename']} to DB:", e)
+        cursor.execute("ROLLBACK TO SAVEPOINT image_row")
     conn.commit()
-    cursor.close()
-    conn.close()
-
-    return image_id
 
   except Exception as e:
-    print("Error saving image to DB:", e)
-    return None
-  
+    print("Error saving image batch to DB:", e)
+    conn.rollback()
+    image_ids = [None] * len(rows)
+
   finally:
     if cursor:
       cursor.close()
     if conn:
       conn.close()
 
+  return image_ids
+
+
+def labels_from_instances(instances):
+  """Unique COCO labels for a Detectron2 `Instances` object."""
+  coco_classes = get_coco_classes()
+  classes = instances.pred_classes.numpy()[instances.scores.numpy() >= DETECTION_SCORE_THRESHOLD]
+  detected_labels = [coco_classes[cls] for cls in classes if cls < len(coco_classes)]
+  return list(set(detected_labels))
+
+
+def embed_images(images):
+  """
+  Runs CLIP on a list of images (PIL or HWC RGB arrays) as one tensor batch.
+
+  Returns:
+    numpy.ndarray: [len(images), 512] image embeddings.
+  """
+  clip_model, clip_processor = get_clip()
+  image_inputs = clip_processor(images=images, return_tensors="pt")
+  with inference_context():
+    image_embeddings = clip_model.get_image_features(**image_inputs)
+  return image_embeddings.cpu().numpy()
+
+
+def detect_images(images_np):
+  """
+  Batched version of `DefaultPredictor.__call__`: applies the same resize
+  transform to every image and runs Faster R-CNN on all of them at once.
+
+  Returns:
+    list: Detectron2 `Instances`, one per input image.
+  """
+  predictor = get_predictor()
+  inputs = []
+  for original_image in images_np:
+    if predictor.input_format == "RGB":
+      original_image = original_image[:, :, ::-1]
+    height, width = original_image.shape[:2]
+    image = predictor.aug.get_transform(original_image).apply_image(original_image)
+    image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
+    inputs.append({"image": image, "height": height, "width": width})
+
+  with inference_context():
+    outputs = predictor.model(inputs)
+  return [output["instances"].to("cpu") for output in outputs]
+
+
+def regions_from_instances(instances, image_np):
+  """
+  Crops every detected instance out of the image.
+
+  Boxes are stored normalized to [0, 1] so they stay valid whatever
+  resolution the photo is later displayed at.
+
+  Returns:
+    tuple: (regions, crops) where regions are dicts with "label", "score"
+    and "box" ([x1, y1, x2, y2]) and crops the matching HWC arrays.
+  """
+  return regions_from_boxes(instances.pred_boxes.tensor.numpy(), instances.scores.numpy(), instances.pred_classes.numpy(), image_np)
+
+
+def regions_from_detections(detections, image_np):
+  """`regions_from_instances` for packed detections stored by utils/detections.py."""
+  height, width = image_np.shape[:2]
+  order = np.argsort(-detections["scores"], kind="stable")
+  boxes = detections["boxes"][order] * np.array([width, height, width, height], dtype=np.float32)
+  return regions_from_boxes(boxes, detections["scores"][order], detections["classes"][order], image_np)
+
+
+def regions_from_boxes(boxes, scores, classes, image_np):
+  coco_classes = get_coco_classes()
+  height, width = image_np.shape[:2]
+  regions = []
+  crops = []
+
+  # Detections come sorted by score, so the cap keeps the most confident ones
+  for box, score, cls in zip(boxes, scores, classes):
+    if len(regions) >= MAX_REGIONS_PER_IMAGE or score < DETECTION_SCORE_THRESHOLD:
+      break
+    if cls >= len(coco_classes):
+      continue
+    x1, y1, x2, y2 = box
+    left, top = max(int(x1), 0), max(int(y1), 0)
+    right, bottom = min(int(np.ceil(x2)), width), min(int(np.ceil(y2)), height)
+    if right - left < MIN_REGION_SIDE or bottom - top < MIN_REGION_SIDE:
+      continue
+
+    crops.append(image_np[top:bottom, left:right])
+    regions.append({
+      "label": coco_classes[cls],
+      "score": round(float(score), 4),
+      "box": [round(float(x1) / width, 4), round(float(y1) / height, 4), round(float(x2) / width, 4), round(float(y2) / height, 4)],
+    })
+
+  return regions, crops
+
+
+def process_image_batch(images):
+  """
+  Runs Faster R-CNN and CLIP over a batch of RGB PIL images.
+
+  Each image is converted to an array once and that buffer feeds both models.
+  The whole photos and the crops of every detected object are embedded in a
+  single batched CLIP call.
+
+  Returns:
+    list of dict: "labels", "embedding", "regions" (each region with its
+    own "embedding") and the packed raw "detections" per image, in input order.
+  """
+  images_np = [np.asarray(image) for image in images]
+  instances = detect_images(images_np)
+
+  per_image_regions = []
+  crops = []
+  for inst, image_np in zip(instances, images_np):
+    regions, image_crops = regions_from_instances(inst, image_np)
+    per_image_regions.append(regions)
+    crops.extend(image_crops)
+
+  embeddings = embed_images(images_np + crops)
+  region_embeddings = iter(embeddings[len(images_np):])
+
+  outputs = []
+  for i, (inst, regions) in enumerate(zip(instances, per_image_regions)):
+    for region in regions:
+      region["embedding"] = next(region_embeddings)
+    height, width = images_np[i].shape[:2]
+    outputs.append({
+      "labels": labels_from_instances(inst),
+      "embedding": embeddings[i],
+      "regions": regions,
+      "detections": pack_detections(inst, width, height),
+    })
+  return outputs
+
+
+async def ingest_images(user_id, uploads, job=None):
+  """
+  Shared pipeline behind /detect_objects and /detect_objects_batch.
+
+  Photos the user already stored (same SHA-256) reuse their image_id, photos
+  seen before by anyone reuse the cached inference results, and only the
+  rest go through CLIP and Faster R-CNN in batches of DETECTION_BATCH_SIZE.
+  New rows are written in one transaction and their image and region vectors
+  upserted in chunks.
+
+  Args:
+    user_id (int): Owner of the photos.
+    uploads (list of tuple): (filename, image_bytes) pairs in input order.
+    job (JobContext): Set when running in the job worker, for per-stage
+      progress and so a retried job re-indexes rows its previous attempt saved.
+
+  Returns:
+    list of dict: One result per upload, in input order. A photo that fails
+    has status "error" and does not abort the others.
+  """
+  results = [
+    {"filename": filename, "status": "error", "image_id": None, "items": [], "duplicate": False, "vectors": [], "error": None}
+    for filename, _ in uploads
+  ]
+  hashes = [image_content_hash(image_bytes) for _, image_bytes in uploads]
+
+  # Each distinct photo is handled once, repeats within the upload copy its result
+  first_index = {}
+  for i, content_hash in enumerate(hashes):
+    first_index.setdefault(content_hash, i)
+
+  report_progress(job, "dedup", done=0, total=len(first_index))
+  existing = await run_in_threadpool(find_user_images, user_id, list(first_index))
+  cached = await run_in_threadpool(get_cached_inferences, list(first_index))
+
+  # Rows a previous attempt of this job saved but may not have indexed yet
+  resume_hashes = set()
+  if job is not None and not job.checkpoint.get("indexed"):
+    resume_hashes = set(job.checkpoint.get("saved", []))
+
+  entries = []
+  to_infer = []
+  reindex = []
+  for content_hash, i in first_index.items():
+    if content_hash in existing:
+      row = existing[content_hash]
+      labels = [item.strip() for item in row["items"].split(",") if item.strip()] if row["items"] else []
+      embedding = cached[content_hash]["embedding"] if content_hash in cached else None
+      results[i].update({
+        "status": "ok",
+        "duplicate": True,
+        "image_id": row["image_id"],
+        "items": labels,
+        "vectors": [build_image_vector(row["image_id"], row["filename"], labels, embedding, user_id)],
+      })
+      if content_hash in resume_hashes and content_hash in cached:
+        reindex.append({"index": i, "content_hash": content_hash, "image_id": row["image_id"], "inference": cached[content_hash]})
+      continue
+
+    entry = {"index": i, "content_hash": content_hash}
+    if content_hash in cached:
+      entry["inference"] = cached[content_hash]
+    else:
+      try:
+        entry["image"] = load_image(uploads[i][1])
+      except Exception as e:
+        print(f"Error decoding {uploads[i][0]}:", e)
+        results[i]["error"] = f"Could not decode image: {e}"
+        continue
+      to_infer.append(entry)
+    entries.append(entry)
+  report_progress(job, "dedup", "done", done=len(first_index), total=len(first_index))
+
+  # Run inference batch by batch; if a batch fails retry its photos one at a time
+  report_progress(job, "inference", done=0, total=len(to_infer))
+  for start in range(0, len(to_infer), DETECTION_BATCH_SIZE):
+    batch = to_infer[start:start + DETECTION_BATCH_SIZE]
+    try:
+      outputs = await submit_inference(process_image_batch, [entry["image"] for entry in batch])
+    except HTTPException:
+      raise
+    except Exception as e:
+      print("Error running batch inference, falling back to single images:", e)
+      outputs = []
+      for entry in batch:
+        try:
+          outputs.append((await submit_inference(process_image_batch, [entry["image"]]))[0])
+        except HTTPException:
+          raise
+        except Exception as single_error:
+          print(f"Error running inference on {uploads[entry['index']][0]}:", single_error)
+          outputs.append(single_error)
+
+    for entry, output in zip(batch, outputs):
+      if isinstance(output, Exception):
+        results[entry["index"]]["error"] = f"Inference failed: {output}"
+        continue
+      entry["inference"] = output
+    report_progress(job, "inference", done=min(start + DETECTION_BATCH_SIZE, len(to_infer)), total=len(to_infer))
+  report_progress(job, "inference", "done", done=len(to_infer), total=len(to_infer))
+
+  await run_in_threadpool(put_cached_inferences, [
+    (entry["content_hash"], entry["inference"])
+    for entry in to_infer if "inference" in entry
+  ])
+  await run_in_threadpool(put_detections, [
+    (entry["content_hash"], entry["inference"]["detections"])
+    for entry in to_infer if "inference" in entry
+  ])
+
+  # One transaction for all new rows
+  processed = [entry for entry in entries if "inference" in entry]
+  report_progress(job, "store", done=0, total=len(processed))
+  image_ids = await run_in_threadpool(save_images_to_db, user_id, [
+    {
+      "filename": uploads[entry["index"]][0],
+      "items": ", ".join(entry["inference"]["labels"]),
+      "image_data": uploads[entry["index"]][1],
+      "content_hash": entry["content_hash"],
+    }
+    for entry in processed
+  ])
+
+  saved = []
+  for entry, image_id in zip(processed, image_ids):
+    if image_id is None:
+      results[entry["index"]]["error"] = "Error saving image to the database."
+      continue
+    entry["image_id"] = image_id
+    saved.append(entry)
+  report_progress(job, "store", "done", done=len(saved), total=len(processed))
+  if job is not None:
+    job.save_checkpoint(saved=sorted(resume_hashes | {entry["content_hash"] for entry in saved}), indexed=False)
+  saved.extend(reindex)
+
+  # One chunked upsert for all new vectors
+  report_progress(job, "index", done=0, total=len(saved))
+  vectors, failed_ids = await run_in_threadpool(store_image_embeddings_in_pinecone, [
+    {
+      "image_id": entry["image_id"],
+      "file": uploads[entry["index"]][0],
+      "items": entry["inference"]["labels"],
+      "embedding": entry["inference"]["embedding"],
+      "regions": entry["inference"]["regions"],
+    }
+    for entry in saved
+  ], user_id=user_id)
+
+  for entry, image_vectors in zip(saved, vectors):
+    result = results[entry["index"]]
+    result["image_id"] = entry["image_id"]
+    result["items"] = entry["inference"]["labels"]
+    result["vectors"] = image_vectors
+    if entry["image_id"] in failed_ids:
+      result["error"] = "Error storing image embedding."
+    else:
+      result["status"] = "ok"
+  report_progress(job, "index", "done", done=len(saved) - len(failed_ids), total=len(saved))
+  if job is not None and not failed_ids:
+    job.save_checkpoint(indexed=True)
+
+  for i, content_hash in enumerate(hashes):
+    first = first_index[content_hash]
+    if first != i:
+      results[i] = {**results[first], "filename": uploads[i][0], "duplicate": results[first]["status"] == "ok"}
+
+  return results
+
+
+async def ingest_video(user_id, filename, video_bytes, job=None):
+  """
+  Video counterpart of `ingest_images` for walkthrough videos.
+
+  Keyframes are picked by scene change (utils/video.py), run through the
+  models in batches, and objects seen in several frames are collapsed to
+  their most confident view. Only keyframes holding at least one kept object
+  are stored as `images` rows, so re-ingesting the same video is a no-op.
+
+  Returns:
+    dict: Sampled keyframe count, the stored frames and the distinct objects.
+  """
+  # OpenCV needs a path; delete=False so the file can be reopened on Windows
+  report_progress(job, "decode")
+  suffix = os.path.splitext(filename)[1] or ".mp4"
+  with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+    tmp.write(video_bytes)
+  try:
+    with metrics.timer("video.decode"):
+      keyframes = await run_in_threadpool(sample_keyframes, tmp.name, IMAGE_MAX_SIDE)
+  finally:
+    os.remove(tmp.name)
+  report_progress(job, "decode", "done", done=len(keyframes), total=len(keyframes))
+  metrics.increment("video.keyframes", len(keyframes))
+
+  report_progress(job, "inference", done=0, total=len(keyframes))
+  outputs = []
+  for start in range(0, len(keyframes), DETECTION_BATCH_SIZE):
+    batch = [image for _, image in keyframes[start:start + DETECTION_BATCH_SIZE]]
+    outputs.extend(await submit_inference(process_image_batch, batch))
+    report_progress(job, "inference", done=len(outputs), total=len(keyframes))
+  report_progress(job, "inference", "done", done=len(outputs), total=len(keyframes))
+
+  kept = collapse_regions([output["regions"] for output in outputs])
+  frames = [i for i, regions in enumerate(kept) if regions]
+  if not frames and keyframes:
+    frames = [0]
+
+  # Keyframes are stored as JPEGs; the cache keeps their full inference
+  stem = os.path.splitext(filename)[0]
+  stored = []
+  for i in frames:
+    timestamp, image = keyframes[i]
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    image_bytes = buffer.getvalue()
+    stored.append({
+      "index": i,
+      "timestamp": timestamp,
+      "filename": f"{stem}@{timestamp:.1f}s.jpg",
+      "image_data": image_bytes,
+      "content_hash": image_content_hash(image_bytes),
+      "labels": sorted({region["label"] for region in kept[i]}),
+    })
+  await run_in_threadpool(put_cached_inferences, [(frame["content_hash"], outputs[frame["index"]]) for frame in stored])
+  await run_in_threadpool(put_detections, [(frame["content_hash"], outputs[frame["index"]]["detections"]) for frame in stored])
+
+  report_progress(job, "store", done=0, total=len(stored))
+  existing = await run_in_threadpool(find_user_images, user_id, [frame["content_hash"] for frame in stored])
+  new_frames = [frame for frame in stored if frame["content_hash"] not in existing]
+  image_ids = await run_in_threadpool(save_images_to_db, user_id, [
+    {"filename": frame["filename"], "items": ", ".join(frame["labels"]), "image_data": frame["image_data"], "content_hash": frame["content_hash"]}
+    for frame in new_frames
+  ])
+  for frame, image_id in zip(new_frames, image_ids):
+    frame["image_id"] = image_id
+  for frame in stored:
+    if frame["content_hash"] in existing:
+      frame["image_id"] = existing[frame["content_hash"]]["image_id"]
+  report_progress(job, "store", "done", done=len(stored), total=len(stored))
+
+  report_progress(job, "index", done=0, total=len(new_frames))
+  saved = [frame for frame in new_frames if frame["image_id"] is not None]
+  _, failed_ids = await run_in_threadpool(store_image_embeddings_in_pinecone, [
+    {
+      "image_id": frame["image_id"],
+      "file": frame["filename"],
+      "items": frame["labels"],
+      "embedding": outputs[frame["index"]]["embedding"],
+      "regions": kept[frame["index"]],
+    }
+    for frame in saved
+  ], user_id=user_id)
+  report_progress(job, "index", "done", done=len(saved) - len(failed_ids), total=len(new_frames))
+
+  for frame in stored:
+    if frame["image_id"] is None:
+      frame["status"], frame["error"] = "error", "Error saving image to the database."
+    elif frame["image_id"] in failed_ids:
+      frame["status"], frame["error"] = "error", "Error storing image embedding."
+    else:
+      frame["status"], frame["error"] = "ok", None
+
+  return {
+    "filename": filename,
+    "keyframes": len(keyframes),
+    "frames": [
+      {
+        "filename": frame["filename"],
+        "timestamp": frame["timestamp"],
+        "image_id": frame["image_id"],
+        "items": frame["labels"],
+        "duplicate": frame["content_hash"] in existing,
+        "status": frame["status"],
+        "error": frame["error"],
+      }
+      for frame in stored
+    ],
+    "objects": [
+      {"label": region["label"], "score": region["score"], "seen_in": region["seen_in"], "image_id": frame["image_id"], "box": region["box"]}
+      for frame in stored
+      for region in kept[frame["index"]]
+    ],
+  }
+
+
 
 @router.post("/detect_objects")
 async def detect_objects(
@@ -74,128 +508,235 @@ async def detect_objects(
 ):
   # Read the image file
   image_bytes = await file.read()
-  image = Image.open(BytesIO(image_bytes))
-  image_inputs = clip_processor(images=image, return_tensors="pt")
   print(user_id)
-  
 
-    # Get the image embedding from CLIP (returns a tensor with shape [batch_size, 512])
-  with torch.no_grad():
-    image_embeddings = clip_model.get_image_features(**image_inputs)
+  result = (await ingest_images(user_id, [(file.filename, image_bytes)]))[0]
+  if result["status"] != "ok":
+    raise HTTPException(status_code=500, detail=result["error"])
 
-  # Convert the embedding to a numpy array or directly use the tensor (if needed)
-  image_embeddings = image_embeddings.cpu().numpy()
+  return {"detections": result["vectors"]}
 
-  # The image embedding is now a 512-dimensional vector
 
+@router.post("/detect_objects_batch")
+async def detect_objects_batch(
+    files: List[UploadFile] = File(...),
+    user_id: int = Form(None)
+):
+  """
+  Batched variant of /detect_objects for large photo uploads.
 
-  # Convert to a format Detectron2 can use (numpy array)
-  image = image.convert("RGB")
-  image_np = np.array(image)  # Directly convert to numpy array (no need for torch)
+  Returns per-photo results in input order; a photo that fails is reported
+  with status "error" without aborting the others.
+  """
+  uploads = [(file.filename, await file.read()) for file in files]
+  results = await ingest_images(user_id, uploads)
 
-  # Run object detection
-  outputs = predictor(image_np)
+  return {"results": [{key: value for key, value in result.items() if key != "vectors"} for result in results]}
 
-  # Process results (e.g., extracting detected objects)
-  instances = outputs["instances"]
-  classes = instances.pred_classes.numpy()  # Class labels of detected objects
 
-  # Extract object labels
-  detected_labels = [COCO_CLASSES[cls] for cls in classes if cls < len(COCO_CLASSES)]
-  '''
-  # Generate embeddings using CLIP for detected object labels
-  inputs = clip_processor(text=detected_labels, return_tensors="pt", padding=True)
-  with torch.no_grad():
-    text_embeddings = clip_model.get_text_features(**inputs)
-  text_embeddings = text_embeddings.cpu().numpy()  # Convert to numpy for easier handling
-  
+@router.post("/detect_objects_video")
+async def detect_objects_video(
+    file: UploadFile = File(...),
+    user_id: int = Form(None)
+):
+  """
+  Ingests a walkthrough video: keyframes are detected and stored as photos.
+  Long videos are better sent to /jobs/detect_objects_video.
+  """
+  video_bytes = await file.read()
+  try:
+    return await ingest_video(user_id, file.filename, video_bytes)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
 
-  # Metadata for the objects
-  results = [
-    {"bbox": box.tolist(), "score": float(score), "class": COCO_CLASSES[cls], "embedding": embedding.tolist()}
-    for box, score, cls, embedding in zip(boxes, scores, classes, text_embeddings)
-  ]
-  
 
-  # Draw bounding boxes on the image
-  draw = ImageDraw.Draw(image)
-  for box, score, cls in zip(boxes, scores, classes):
-    if score > 0.5:  # Only draw boxes with a score above the threshold
-      x1, y1, x2, y2 = box
-      draw.rectangle([x1, y1, x2, y2], outline="red", width=3)
-      # Adjust text position: move the text slightly to the right (x1 + 5)
-      class_name = COCO_CLASSES[cls]
-      text_position = (x1 + 5, y1)  # Shift text 5 pixels to the right of the bbox
-      #draw.text(text_position, f"{cls} ({score:.2f})", fill="red")
-      draw.text(text_position, f"{class_name} ({score:.2f})", fill="red")
-
-  # Convert the image to a byte stream to return as a response
-  img_byte_arr = BytesIO()
-  image.save(img_byte_arr, format='PNG')
-  img_byte_arr.seek(0)
-  '''
-  # Collect unique classes from detection results
-  unique_classes = list(set(detected_labels))  # Use a set to remove duplicates
-  items = ", ".join(unique_classes)  # Convert the unique classes into a comma-separated string
-
-  '''
-  # Log the results for debugging
-  print("Detection Results with Embeddings:")
-  print(results)
-  print("Unique Classes (Items):", items)
-  '''
-
-  image_id = save_image_to_db(
-    user_id=user_id, 
-    filename=file.filename,
-    items=items,
-    image_data=image_bytes  
-  )
-  
-  dict_item_context = {"items": unique_classes}
-  embedding_result = store_embeddings_in_pinecone(dict_item_context=dict_item_context, embeddings=image_embeddings, chat_id=0, file=file.filename, user_id=user_id, image_id=image_id, type="image")
-  
-  return {"detections": embedding_result}
+@router.get("/image_cache/stats")
+def image_cache_stats():
+  return get_cache_stats()
 
 
-@router.get("/get_image/{image_id}")
-async def get_image(image_id: int):
-    conn = get_connection()
+def fetch_image_data(image_id):
+  """Loads the full bytes of a photo, from the blob store or legacy BYTEA storage."""
+  conn = get_connection()
+  cursor = None
+
+  try:
     cursor = conn.cursor()
+    cursor.execute("SELECT image_data, blob_key FROM images WHERE image_id = %s", (image_id,))
+    row = cursor.fetchone()
+    if not row:
+      return None
+    if row["blob_key"]:
+      return get_blob_store().read(row["blob_key"])
+    return bytes(row["image_data"]) if row["image_data"] else None
 
-    try:
-        print(f"Fetching image for image_id: {image_id}")
+  finally:
+    if cursor:
+      cursor.close()
+    if conn:
+      conn.close()
 
-        # Query to get image data
-        cursor.execute("SELECT image_data FROM images WHERE image_id = %s", (image_id,))
-        image_data = cursor.fetchone()
-        print("Raw image_data fetched from DB:", image_data['image_data'])
 
-        # Check if image was found
-        if not image_data['image_data']:
-            raise HTTPException(status_code=404, detail="Image not found or image data is empty.")
+def fetch_image_info(image_id):
+  """
+  Returns the content hash, blob key and upload time of an image without loading its bytes.
+  Rows stored before content hashing get their hash backfilled here.
+  """
+  conn = get_connection()
+  cursor = None
 
-        # Convert memoryview to bytes
-        image_bytes = bytes(image_data['image_data'])
-        print("Length of image bytes:", len(image_data['image_data']))
+  try:
+    cursor = conn.cursor()
+    cursor.execute("SELECT content_hash, blob_key, uploaded_at FROM images WHERE image_id = %s", (image_id,))
+    row = cursor.fetchone()
+    if row is None or row["content_hash"]:
+      return row
+
+    cursor.execute("SELECT image_data FROM images WHERE image_id = %s", (image_id,))
+    image_data = cursor.fetchone()["image_data"]
+    if not image_data:
+      return None
+    content_hash = image_content_hash(bytes(image_data))
+    cursor.execute("UPDATE images SET content_hash = %s WHERE image_id = %s", (content_hash, image_id))
+    conn.commit()
+    return {"content_hash": content_hash, "blob_key": None, "uploaded_at": row["uploaded_at"]}
 
-        # Convert the image bytes to a file-like object and open the image using PIL
-        image = Image.open(BytesIO(image_data['image_data']))
+  finally:
+    if cursor:
+      cursor.close()
+    if conn:
+      conn.close()
 
-        # Save the image to a BytesIO object
-        img_byte_arr = BytesIO()
-        image.save(img_byte_arr, format="PNG")
-        img_byte_arr.seek(0)
-        print("Image successfully processed.")
 
-        # Return the image as a StreamingResponse
-        return StreamingResponse(img_byte_arr, media_type="image/png")
+@router.get("/get_image/{image_id}")
+def get_image(image_id: int, request: Request, w: Optional[int] = None):
+  """
+  Returns a stored photo: the original bytes, streamed from the blob store
+  (sendfile for the local store), or with `?w=` a cached JPEG derivative
+  snapped to one of THUMBNAIL_WIDTHS.
+
+  Responses carry an ETag (content hash + size) and Last-Modified, and a
+  matching If-None-Match / If-Modified-Since is answered with 304 before any
+  image bytes are loaded.
+  """
+  try:
+    info = fetch_image_info(image_id)
+  except Exception as e:
+    print(f"Error: {e}")
+    raise HTTPException(status_code=500, detail=f"Error fetching image: {e}")
+
+  if not info:
+    raise HTTPException(status_code=404, detail="Image not found or image data is empty.")
+
+  width = pick_width(w)
+  etag = make_etag(info["content_hash"], width)
+  headers = {
+    "ETag": etag,
+    "Cache-Control": "private, max-age=31536000, immutable",
+  }
+  if info["uploaded_at"]:
+    headers["Last-Modified"] = formatdate(info["uploaded_at"].timestamp(), usegmt=True)
+
+  if_none_match = request.headers.get("if-none-match")
+  if_modified_since = request.headers.get("if-modified-since")
+  not_modified = etag_matches(if_none_match, etag)
+  if not if_none_match and if_modified_since and info["uploaded_at"]:
+    try:
+      not_modified = int(info["uploaded_at"].timestamp()) <= int(parsedate_to_datetime(if_modified_since).timestamp())
+    except (TypeError, ValueError):
+      pass
+  if not_modified:
+    metrics.increment("get_image.not_modified")
+    return Response(status_code=304, headers=headers)
 
-    except Exception as e:
-        print(f"Error: {e}")
-        raise HTTPException(status_code=500, detail=f"Error fetching image: {e}")
+  try:
+    if width is None and info["blob_key"]:
+      store = get_blob_store()
+      media_type = sniff_media_type(store.head(info["blob_key"]))
+      path = store.local_path(info["blob_key"])
+      if path:
+        return FileResponse(path, media_type=media_type, headers=headers)
+      return StreamingResponse(store.iter_chunks(info["blob_key"]), media_type=media_type, headers=headers)
+
+    if width is None:
+      # Rows not yet moved out of BYTEA by scripts/migrate_image_blobs.py
+      image_bytes = fetch_image_data(image_id)
+      if not image_bytes:
+        raise HTTPException(status_code=404, detail="Image not found or image data is empty.")
+      return Response(content=image_bytes, media_type=sniff_media_type(image_bytes), headers=headers)
+
+    image_bytes = get_derivative(info["content_hash"], width, lambda: fetch_image_data(image_id))
+    return Response(content=image_bytes, media_type="image/jpeg", headers=headers)
+
+  except HTTPException:
+    raise
 
-    finally:
-        # Close the cursor and connection
-        cursor.close()
-        conn.close()
+  except Exception as e:
+    print(f"Error: {e}")
+    raise HTTPException(status_code=500, detail=f"Error fetching image: {e}")
+
+
+def parse_labels(labels):
+  return [label.strip() for label in labels.split(",") if label.strip()] if labels else None
+
+
+def load_image_detections(image_id):
+  info = fetch_image_info(image_id)
+  if not info:
+    raise HTTPException(status_code=404, detail="Image not found or image data is empty.")
+  detections = get_detections(info["content_hash"])
+  if detections is None:
+    raise HTTPException(status_code=404, detail="No detections stored for this image; it was ingested before detections were kept.")
+  return info, detections
+
+
+@router.get("/images/{image_id}/detections")
+def image_detections(image_id: int, min_score: float = DETECTION_SCORE_THRESHOLD, labels: Optional[str] = None):
+  """
+  Stored boxes, scores and per-class counts of a photo, re-filtered by score
+  and comma-separated class names without running the detector again.
+  """
+  _, detections = load_image_detections(image_id)
+  filtered = filter_detections(detections, get_coco_classes(), min_score, parse_labels(labels))
+  return {
+    "image_id": image_id,
+    "min_score": min_score,
+    "stored_min_score": detections["score_threshold"],
+    "counts": count_labels(filtered),
+    "detections": filtered,
+  }
+
+
+@router.get("/images/{image_id}/overlay")
+def image_overlay(image_id: int, min_score: float = DETECTION_SCORE_THRESHOLD, labels: Optional[str] = None, w: Optional[int] = None):
+  """Renders the stored detections of a photo as a JPEG with box overlays."""
+  info, detections = load_image_detections(image_id)
+  filtered = filter_detections(detections, get_coco_classes(), min_score, parse_labels(labels))
+
+  image_bytes = fetch_image_data(image_id)
+  if not image_bytes:
+    raise HTTPException(status_code=404, detail="Image not found or image data is empty.")
+  image = load_image(image_bytes, max_side=pick_width(w) or IMAGE_MAX_SIDE)
+
+  buffer = BytesIO()
+  draw_overlay(image, filtered, get_coco_classes()).save(buffer, format="JPEG", quality=85)
+  return Response(content=buffer.getvalue(), media_type="image/jpeg", headers={"Cache-Control": "private, max-age=3600"})
+
+
+@router.get("/detections/counts")
+def detection_counts(user_id: int, min_score: float = DETECTION_SCORE_THRESHOLD, labels: Optional[str] = None):
+  """Counts detected objects per class across all photos of a user."""
+  coco_classes = get_coco_classes()
+  wanted = parse_labels(labels)
+  counts = {}
+  images = 0
+  for _, detections in get_user_detections(user_id):
+    images += 1
+    for label, count in count_labels(filter_detections(detections, coco_classes, min_score, wanted)).items():
+      counts[label] = counts.get(label, 0) + count
+  return {
+    "user_id": user_id,
+    "min_score": min_score,
+    "images": images,
+    "counts": dict(sorted(counts.items(), key=lambda item: (-item[1], item[0]))),
+  }
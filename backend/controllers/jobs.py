@@ -0,0 +1,109 @@
+import hashlib
+from typing import List, Optional
+from fastapi import APIRouter, Body, File, Form, Header, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from utils.blob_store import get_blob_store
+from utils.job_queue import enqueue, get_job
+
+router = APIRouter()
+
+'''
+Asynchronous ingestion: uploads are written to the blob store, a job is queued
+and 202 is returned with its id straight away. Workers (utils/job_worker.py)
+run the same pipelines as the synchronous endpoints; poll GET /jobs/{job_id}
+for per-stage progress and the result.
+
+Send an Idempotency-Key header to make retries of the same upload safe. Without
+one the key is derived from the user and the uploaded content, so re-posting
+the same files while their job is queued or running returns that job instead
+of ingesting them twice. Once the job failed the re-post retries it, once it
+succeeded the files are ingested again.
+'''
+
+
+def default_idempotency_key(kind, user_id, blob_keys):
+  digest = hashlib.sha256()
+  digest.update(f"{kind}:{user_id}:".encode())
+  for key in blob_keys:
+    digest.update(key.encode())
+  return digest.hexdigest()
+
+
+def job_status(job):
+  return {
+    "job_id": job["job_id"],
+    "kind": job["kind"],
+    "status": job["status"],
+    "stages": job["stages"],
+    "attempts": job["attempts"],
+    "result": job["result"],
+    "error": job["error"],
+    "created_at": job["created_at"],
+    "updated_at": job["updated_at"],
+  }
+
+
+async def enqueue_job(kind, payload, idempotency_key):
+  job, created = await run_in_threadpool(enqueue, kind, payload, idempotency_key)
+  return JSONResponse(status_code=202, content={**job_status(job), "created": created})
+
+
+@router.post("/jobs/detect_objects")
+async def enqueue_detect_objects(
+    files: List[UploadFile] = File(...),
+    user_id: int = Form(...),
+    idempotency_key: Optional[str] = Header(None),
+):
+  """Queues a batch of photos for the /detect_objects_batch pipeline."""
+  store = get_blob_store()
+  uploads = []
+  for file in files:
+    key = await run_in_threadpool(store.put, await file.read())
+    uploads.append({"filename": file.filename, "blob_key": key})
+
+  key = idempotency_key or default_idempotency_key("detect_objects", user_id, [upload["blob_key"] for upload in uploads])
+  return await enqueue_job("detect_objects", {"user_id": user_id, "uploads": uploads}, key)
+
+
+@router.post("/jobs/detect_objects_video")
+async def enqueue_detect_objects_video(
+    file: UploadFile = File(...),
+    user_id: int = Form(...),
+    idempotency_key: Optional[str] = Header(None),
+):
+  """Queues a walkthrough video for the /detect_objects_video pipeline."""
+  blob_key = await run_in_threadpool(get_blob_store().put, await file.read())
+  key = idempotency_key or default_idempotency_key("detect_objects_video", user_id, [blob_key])
+  payload = {"user_id": user_id, "filename": file.filename, "blob_key": blob_key}
+  return await enqueue_job("detect_objects_video", payload, key)
+
+
+@router.post("/jobs/process_chatlog")
+async def enqueue_process_chatlog(
+    file: UploadFile = File(...),
+    user_id: int = Body(...),
+    idempotency_key: Optional[str] = Header(None),
+):
+  """Queues a chat log for the /process_chatlog pipeline."""
+  if not file.content_type.startswith("text/"):
+    raise HTTPException(status_code=400, detail="Invalid file type. Please upload a valid text file.")
+
+  content = await file.read()
+  try:
+    content.decode("utf-8")
+  except UnicodeDecodeError:
+    raise HTTPException(status_code=400, detail="Failed to decode the file. Ensure it is UTF-8 encoded.")
+
+  blob_key = await run_in_threadpool(get_blob_store().put, content)
+  key = idempotency_key or default_idempotency_key("process_chatlog", user_id, [blob_key])
+  payload = {"user_id": user_id, "filename": file.filename, "blob_key": blob_key}
+  return await enqueue_job("process_chatlog", payload, key)
+
+
+@router.get("/jobs/{job_id}")
+def read_job(job_id: str):
+  job = get_job(job_id)
+  if job is None:
+    raise HTTPException(status_code=404, detail="Job not found.")
+  return job_status(job)
@@ -1,13 +1,19 @@
 import os
+import time
 import traceback
-from fastapi.responses import FileResponse
-from openai import OpenAI
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from contextlib import aclosing
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from fpdf import FPDF
 import json
 from database.database import get_connection
-from utils.pinecone_db import generate_query_embedding, search_in_pinecone
+from utils import metrics
+from utils.lexical_index import lexical_search, lookup_terms
+from utils.key_item_cache import cached_key_item
+from utils.llm_client import chat_completion, chat_completion_sync, stream_chat_completion
+from utils.pinecone_db import generate_query_embedding, search_many
 from .chatLogProcessing import chatlog_from_chatid
 
 load_dotenv()
@@ -15,163 +21,201 @@ load_dotenv()
 # Initialize the FastAPI router
 router = APIRouter()
 
-# Initialize the Nebius API client
-client = OpenAI(
-  base_url="https://api.studio.nebius.ai/v1/",
-  api_key=os.environ.get("NEBIUS_API_KEY")  # Ensure your API key is set in the environment
-)
+# Nebius calls go through the shared clients of utils/llm_client.py
+CHAT_MODEL = "meta-llama/Llama-3.3-70B-Instruct"
+CHAT_COMPLETION_PARAMS = {"temperature": 0.6, "max_tokens": 512, "top_p": 0.9}
+KEY_ITEM_MODEL = "meta-llama/Meta-Llama-3.1-8B-Instruct-fast"
+# Bump when the extraction messages change, so cached extractions are not reused
+KEY_ITEM_PROMPT_VERSION = "v1"
+# Key-item extraction is a short answer on the critical path of every chat turn
+KEY_ITEM_TIMEOUT = 15
+# Turns of the conversation sent along with the prompt
+CHAT_HISTORY_TURNS = 5
+
+CHAT_SYSTEM_PROMPT = '''Your goal is to act as an AI chat bot to help people who have lost there home remember items lost in there home. 
+  We may or may not provide you with information. If the user is vague try to help them jog there memory. 
+  If you receive items such as chat logs or images let the user know. ENSURE TO ACT AS IF YOU ARE TALKING TO SOMEONE SO HAVE SOME BREVITY AT TIMES.'''
 
-@router.post("/nebius-chat")
-async def nebius_chat(data: dict):
-  prompt = data.get('prompt')
-  user_id = data.get('user_id')
-  message_from_frontend = data.get('messages')
-  searchChat = data.get('searchChat')
-  searchImage = data.get('searchImage')
 
+def parse_chat_request(data):
+  prompt = data.get('prompt')
   if not prompt:
     raise HTTPException(status_code=400, detail="Prompt cannot be empty.")
-  try:
-    key_item = extract_key_item_from_prompt(prompt)
-    key_item_embedding = generate_query_embedding(key_item)
-    
+  return prompt, data.get('user_id'), data.get('messages') or [], data.get('searchChat'), data.get('searchImage')
+
+
+async def retrieve_for_prompt(prompt, user_id, searchChat, searchImage):
+  """
+  Searches the user's messages and photos for what the prompt is about.
+
+  Returns:
+    dict: "pc_chat_response", "pc_image_response" and "pc_merged_response",
+    each None when nothing was searched.
+  """
+  retrieved = {"pc_chat_response": None, "pc_image_response": None, "pc_merged_response": None}
+  searches = []
+  if(searchChat):
+    searches.append(("message", 3))
+
+  if(searchImage):
+    searches.append(("image", 2))
+
+  if not searches:
+    return retrieved
+
+  # Plain item lookups ("where is my passport") that match the lexical index
+  # skip the key-item extraction call and the CLIP query embedding
+  terms = lookup_terms(prompt)
+  if terms and await run_in_threadpool(has_exact_match, user_id, terms, searches):
+    metrics.increment("retrieval.lexical_fast_path")
+    key_item = " ".join(terms)
+    key_item_embedding = None
+  else:
+    key_item = await extract_key_item_from_prompt(prompt)
+    key_item_embedding = await run_in_threadpool(generate_query_embedding, key_item)
+
+  # Searches run concurrently, off the event loop
+  found = await run_in_threadpool(search_many, key_item_embedding, user_id, searches, key_item)
+  retrieved["pc_chat_response"] = found["by_type"].get("message")
+  retrieved["pc_image_response"] = found["by_type"].get("image")
+  retrieved["pc_merged_response"] = found["merged"]
+  return retrieved
+
+
+def retrieval_prompt(prompt, pc_chat_response, pc_image_response):
+  """The final user turn: the prompt with whatever retrieval found."""
+  if(pc_chat_response and pc_image_response):
+    return f'''Here are some related messages and detected items in the images related to the user message. Ensure to let the user know about this:
+    {', '.join(["image" + str(i) + " items: " + str(pc_image_response[i]['items']) for i in range(len(pc_image_response))])}
+    Messages: {', '.join(["Found " + str(pc_chat_response[i]['item']) + " in " + str(pc_chat_response[i]['message']) for i in range(len(pc_chat_response))])},
+    User message: {prompt}'''
+  if pc_chat_response:
+    return f'''Here are some related messages to the user query, ENSURE TO LET THE USER KNOW ABOUT THE FOUND MESSAGE it will be visible to them in the UI just need to bring it up in conversation. ENSURE YOU RESPOND AS IF YOU ARE STILL TALKING: 
+    messages: {["Found " + pc_chat_response[i]['item'] + "in " + pc_chat_response[i]['message'] for i in range(len(pc_chat_response))]}, 
+    user message: {prompt}'''
+  if pc_image_response:
+    return f'''Here are some items found in images that are related to the user query, ENSURE TO LET THE USER KNOW ABOUT THE FOUND IMAGES it will be visible to them in the UI you just need to bring it up  in conversation. ENSURE YOU RESPOND AS IF YOU ARE STILL TALKING TO THEM: 
+    {', '.join([f"image{str(i)} items found: {str(pc_image_response[i]['items'])}" for i in range(len(pc_image_response))])},
+    user message: {prompt}'''
+  return f'''
+    No messages or images searched JUST RESPOND TO USER PROMPT,
+    user message: {prompt}'''
+
+
+def build_chat_messages(prompt, message_from_frontend, retrieved):
+  formatted_messages = [
+    {"role": "user" if msg["sender"] == "user" else "assistant", "content": msg["text"]}
+    for msg in message_from_frontend
+  ]
+  return [
+    # make sure to make it talk like an ai aswell -> if i say hello it should talk to me normally like an assistant
+    {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+    *formatted_messages[-CHAT_HISTORY_TURNS:],
+    {"role": "user", "content": retrieval_prompt(prompt, retrieved["pc_chat_response"], retrieved["pc_image_response"])},
+  ]
 
-    # only being used in final_response
-    pc_chat_response = None
-    pc_image_response = None
-    if(searchChat):
-      pc_chat_response = search_in_pinecone(key_item_embedding, user_id, "message", 3)
 
-    if(searchImage):
-      pc_image_response = search_in_pinecone(key_item_embedding, user_id, "image", 2)
-    
-    print(pc_image_response)
-    print(pc_chat_response)
-  
-    formatted_messages = [
-      {"role": "user" if msg["sender"] == "user" else "assistant", "content": msg["text"]}
-      for msg in message_from_frontend 
-    ]
-    
-    formatted_messages = formatted_messages[-5:] if len(formatted_messages) > 5 else formatted_messages
-
-    completion = None
-
-    if(pc_chat_response and pc_image_response):
-      completion = client.chat.completions.create(
-        model="meta-llama/Llama-3.3-70B-Instruct",
-        messages = [{
-            "role": "system",
-            "content": '''Your goal is to act as an AI chat bot to help people who have lost there home remember items lost in there home. 
-            We may or may not provide you with information. If the user is vague try to help them jog there memory. 
-            If you receive items such as chat logs or images let the user know. ENSURE TO ACT AS IF YOU ARE TALKING TO SOMEONE SO HAVE SOME BREVITY AT TIMES.'''
-
-            # make sure to make it talk like an ai aswell -> if i say hello it should talk to me normally like an assistant
-          },
-          *formatted_messages,
-          {
-            "role": "user",
-            "content": f'''Here are some related messages and detected items in the images related to the user message. Ensure to let the user know about this:
-            {', '.join(["image" + str(i) + " items: " + str(pc_image_response[i]['items']) for i in range(len(pc_image_response))])}
-            Messages: {', '.join(["Found " + str(pc_chat_response[i]['item']) + " in " + str(pc_chat_response[i]['message']) for i in range(len(pc_chat_response))])},
-            User message: {prompt}'''
-          }
-        ],
-        temperature=0.6,
-        max_tokens=512,
-        top_p=0.9
-      )
-    elif pc_chat_response:
-      completion = client.chat.completions.create(
-        model="meta-llama/Llama-3.3-70B-Instruct",
-        messages = [{
-            "role": "system",
-            "content": '''Your goal is to act as an AI chat bot to help people who have lost there home remember items lost in there home. 
-            We may or may not provide you with information. If the user is vague try to help them jog there memory. 
-            If you receive items such as chat logs or images let the user know. ENSURE TO ACT AS IF YOU ARE TALKING TO SOMEONE SO HAVE SOME BREVITY AT TIMES.'''
-
-            # make sure to make it talk like an ai aswell -> if i say hello it should talk to me normally like an assistant
-          },
-          *formatted_messages,
-          {
-            "role": "user",
-            "content": f'''Here are some related messages to the user query, ENSURE TO LET THE USER KNOW ABOUT THE FOUND MESSAGE it will be visible to them in the UI just need to bring it up in conversation. ENSURE YOU RESPOND AS IF YOU ARE STILL TALKING: 
-            messages: {["Found " + pc_chat_response[i]['item'] + "in " + pc_chat_response[i]['message'] for i in range(len(pc_chat_response))]}, 
-            user message: {prompt}'''
-          }
-        ],
-        temperature=0.6,
-        max_tokens=512,
-        top_p=0.9
-      )
-    elif pc_image_response:
-      completion = client.chat.completions.create(
-        model="meta-llama/Llama-3.3-70B-Instruct",
-        messages = [{
-            "role": "system",
-            "content": '''Your goal is to act as an AI chat bot to help people who have lost there home remember items lost in there home. 
-            We may or may not provide you with information. If the user is vague try to help them jog there memory. 
-            If you receive items such as chat logs or images let the user know. ENSURE TO ACT AS IF YOU ARE TALKING TO SOMEONE SO HAVE SOME BREVITY AT TIMES.'''
-
-            # make sure to make it talk like an ai aswell -> if i say hello it should talk to me normally like an assistant
-          },
-          *formatted_messages,
-          {
-            "role": "user",
-            "content": f'''Here are some items found in images that are related to the user query, ENSURE TO LET THE USER KNOW ABOUT THE FOUND IMAGES it will be visible to them in the UI you just need to bring it up  in conversation. ENSURE YOU RESPOND AS IF YOU ARE STILL TALKING TO THEM: 
-            {', '.join([f"image{str(i)} items found: {str(pc_image_response[i]['items'])}" for i in range(len(pc_image_response))])},
-            user message: {prompt}'''
-          }
-        ],
-        temperature=0.6,
-        max_tokens=512,
-        top_p=0.9
-      )
-    else:
-      completion = client.chat.completions.create(
-        model="meta-llama/Llama-3.3-70B-Instruct",
-        messages = [{
-            "role": "system",
-            "content": '''Your goal is to act as an AI chat bot to help people who have lost there home remember items lost in there home. 
-            We may or may not provide you with information. If the user is vague try to help them jog there memory. 
-            If you receive items such as chat logs or images let the user know. ENSURE TO ACT AS IF YOU ARE TALKING TO SOMEONE SO HAVE SOME BREVITY AT TIMES.'''
-
-            # make sure to make it talk like an ai aswell -> if i say hello it should talk to me normally like an assistant
-          },
-          *formatted_messages,
-          {
-            "role": "user",
-            "content": f'''
-            No messages or images searched JUST RESPOND TO USER PROMPT,
-            user message: {prompt}'''
-          }
-        ],
-        temperature=0.6,
-        max_tokens=512,
-        top_p=0.9
-      )
+@router.post("/nebius-chat")
+async def nebius_chat(data: dict):
+  prompt, user_id, message_from_frontend, searchChat, searchImage = parse_chat_request(data)
+  try:
+    retrieved = await retrieve_for_prompt(prompt, user_id, searchChat, searchImage)
+
+    completion = await chat_completion(
+      "chat",
+      model=CHAT_MODEL,
+      messages=build_chat_messages(prompt, message_from_frontend, retrieved),
+      **CHAT_COMPLETION_PARAMS
+    )
 
     # Return the completion response
     response = json.loads(completion.to_json())
+    return {"response": response, **retrieved}
 
-    final_response = {
-      "response": response,
-      "pc_chat_response": pc_chat_response,
-      "pc_image_response": pc_image_response
-    }
-
-    # return {"response": response}
-    return final_response
-    
+  except HTTPException:
+    raise
 
   except Exception as e:
     print(e)
     raise HTTPException(status_code=500, detail=f"Error calling Nebius API: {str(e)}")
 
 
-def extract_key_item_from_prompt(prompt: str):
-  completion = client.chat.completions.create(
-    model="meta-llama/Meta-Llama-3.1-8B-Instruct-fast",
+def sse_event(event, data):
+  return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/nebius-chat-stream")
+async def nebius_chat_stream(data: dict, request: Request):
+  """
+  Streaming /nebius-chat as Server-Sent Events: one "retrieval" event with
+  the search results, a "token" event per completion delta ({"content"}),
+  then "done" ({"finish_reason"}) or "error" ({"detail"}). When the client
+  disconnects the upstream completion is closed, which stops generation.
+  """
+  start = time.perf_counter()
+  prompt, user_id, message_from_frontend, searchChat, searchImage = parse_chat_request(data)
+  try:
+    retrieved = await retrieve_for_prompt(prompt, user_id, searchChat, searchImage)
+  except HTTPException:
+    raise
+  except Exception as e:
+    print(e)
+    raise HTTPException(status_code=500, detail=f"Error searching for the prompt: {str(e)}")
+  messages = build_chat_messages(prompt, message_from_frontend, retrieved)
+
+  async def events():
+    yield sse_event("retrieval", retrieved)
+    first_token = True
+    finish_reason = None
+    try:
+      # Leaving this block, on disconnect too, closes the upstream stream
+      async with aclosing(stream_chat_completion("chat_stream", model=CHAT_MODEL, messages=messages, **CHAT_COMPLETION_PARAMS)) as chunks:
+        async for chunk in chunks:
+          if await request.is_disconnected():
+            metrics.increment("chat_stream.cancelled")
+            return
+          if not chunk.choices:
+            continue
+          choice = chunk.choices[0]
+          if choice.delta.content:
+            if first_token:
+              # Measured from the request, so retrieval counts too: it is what the user waits for
+              metrics.observe("chat_stream.time_to_first_token", time.perf_counter() - start)
+              first_token = False
+            yield sse_event("token", {"content": choice.delta.content})
+          finish_reason = choice.finish_reason or finish_reason
+      yield sse_event("done", {"finish_reason": finish_reason})
+      metrics.observe("chat_stream.duration", time.perf_counter() - start)
+
+    except Exception as e:
+      print(e)
+      metrics.increment("chat_stream.failed")
+      detail = e.detail if isinstance(e, HTTPException) else f"Error calling Nebius API: {str(e)}"
+      yield sse_event("error", {"detail": detail})
+
+  return StreamingResponse(
+    events(),
+    media_type="text/event-stream",
+    # No caching or proxy buffering, tokens must reach the browser as they come
+    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+  )
+
+
+def has_exact_match(user_id, terms, searches):
+  # Every term must appear in at least one document of a searched type
+  return any(lexical_search(user_id, " ".join(terms), type, 1, require_all=True) for type, _ in searches)
+
+
+async def extract_key_item_from_prompt(prompt: str):
+  # Deterministic (temperature 0), so repeated prompts are served from utils/key_item_cache.py
+  return await cached_key_item(prompt, KEY_ITEM_MODEL, KEY_ITEM_PROMPT_VERSION, run_key_item_extraction)
+
+
+async def run_key_item_extraction(prompt: str):
+  completion = await chat_completion(
+    "key_item",
+    timeout=KEY_ITEM_TIMEOUT,
+    model=KEY_ITEM_MODEL,
     messages=[
       {
         "role": "system",
@@ -286,8 +330,10 @@ def generate_report_text(items: list) -> str:
     """
     
     try:
-        completion = client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct",
+        # generate_report is a sync endpoint, so this runs in FastAPI's threadpool
+        completion = chat_completion_sync(
+            "report",
+            model=CHAT_MODEL,
             messages=[
                 {
                     "role": "system",
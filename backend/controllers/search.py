@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from utils.pinecone_db import generate_query_embedding, search_many
+
+router = APIRouter()
+
+'''
+Direct retrieval over a user's messages and photos, without the chat model.
+
+mode=hybrid fuses the CLIP vector ranking with BM25 over the lexical index
+(utils/lexical_index.py); mode=lexical only runs BM25, which needs no CLIP
+embedding and is the cheapest way to look up an exact item name.
+'''
+
+SEARCH_TYPES = ("message", "image")
+SEARCH_MODES = ("hybrid", "lexical")
+
+
+@router.get("/search")
+async def search(user_id: int, q: str, types: str = "message,image", mode: str = "hybrid", top_k: int = 5):
+  if not q.strip():
+    raise HTTPException(status_code=400, detail="Query cannot be empty.")
+  if mode not in SEARCH_MODES:
+    raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(SEARCH_MODES)}.")
+
+  requested = [type.strip() for type in types.split(",") if type.strip()]
+  unknown = [type for type in requested if type not in SEARCH_TYPES]
+  if unknown or not requested:
+    raise HTTPException(status_code=400, detail=f"types must be a comma separated subset of {', '.join(SEARCH_TYPES)}.")
+
+  top_k = max(1, min(top_k, 50))
+  query_embedding = await run_in_threadpool(generate_query_embedding, q) if mode == "hybrid" else None
+  # The requested mode wins over HYBRID_SEARCH, the default of chat retrieval
+  retrieved = await run_in_threadpool(search_many, query_embedding, user_id, [(type, top_k) for type in requested], q, hybrid=True)
+  return {
+    "query": q,
+    "mode": mode,
+    "results": retrieved["by_type"],
+    "merged": retrieved["merged"],
+  }
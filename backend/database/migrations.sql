@@ -0,0 +1,68 @@
+-- Statements for bringing an existing database up to date with queries.sql.
+-- Every statement is safe to re-run.
+
+-- Content-addressed image dedup cache
+ALTER TABLE images ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+CREATE INDEX IF NOT EXISTS images_user_content_hash_idx ON images (user_id, content_hash);
+CREATE TABLE IF NOT EXISTS image_inference_cache (
+    content_hash CHAR(64) PRIMARY KEY,
+    items TEXT,
+    embedding BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Region-level CLIP embeddings
+ALTER TABLE image_inference_cache ADD COLUMN IF NOT EXISTS regions JSONB;
+ALTER TABLE image_inference_cache ADD COLUMN IF NOT EXISTS region_embeddings BYTEA;
+
+-- Image blobs move out of Postgres (then run: python -m scripts.migrate_image_blobs)
+ALTER TABLE images ADD COLUMN IF NOT EXISTS blob_key TEXT;
+ALTER TABLE images ALTER COLUMN image_data DROP NOT NULL;
+
+-- Raw detections packed per photo (utils/detections.py)
+CREATE TABLE IF NOT EXISTS image_detections (
+    content_hash CHAR(64) PRIMARY KEY,
+    boxes BYTEA NOT NULL,
+    scores BYTEA NOT NULL,
+    classes BYTEA NOT NULL,
+    score_threshold REAL NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Vectors whose upsert failed after retries, re-sent by utils/bulk_upsert.py
+CREATE TABLE IF NOT EXISTS vector_sync_failures (
+    vector_id TEXT PRIMARY KEY,
+    user_id INT,
+    source TEXT,
+    source_id INT,
+    payload JSONB NOT NULL,
+    error TEXT,
+    attempts INT NOT NULL DEFAULT 1,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS vector_sync_failures_updated_idx ON vector_sync_failures (updated_at);
+
+-- Embedding versioning and re-embedding (utils/vector_indexes.py, utils/reembed.py)
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS item TEXT;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS context TEXT;
+ALTER TABLE image_inference_cache ADD COLUMN IF NOT EXISTS clip_model TEXT;
+UPDATE image_inference_cache SET clip_model = 'openai/clip-vit-base-patch32' WHERE clip_model IS NULL;
+CREATE TABLE IF NOT EXISTS vector_indexes (
+    index_name TEXT PRIMARY KEY,
+    embedding_version TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    activated_at TIMESTAMP,
+    retired_at TIMESTAMP
+);
+
+-- Key-item extractions of chat prompts (utils/key_item_cache.py)
+CREATE TABLE IF NOT EXISTS key_item_cache (
+    cache_key CHAR(64) PRIMARY KEY,
+    model TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    key_item TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS key_item_cache_created_idx ON key_item_cache (created_at);
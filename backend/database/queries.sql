@@ -20,7 +20,9 @@ CREATE TABLE messages (
     sender VARCHAR(100) NOT NULL,
     receiver VARCHAR(100),
     message TEXT NOT NULL,
-    timestamp TIMESTAMP DEFAULT NOW()
+    timestamp TIMESTAMP DEFAULT NOW(),
+    item TEXT,                  -- key item and context extracted by the LLM, re-embedded by utils/reembed.py
+    context TEXT
 );
 
 CREATE TABLE images (
@@ -28,6 +30,69 @@ CREATE TABLE images (
     user_id INT REFERENCES users(user_id),
     filename VARCHAR(255) NOT NULL,
     items TEXT, 
-    image_data BYTEA NOT NULL, 
+    image_data BYTEA,           -- legacy inline storage, NULL once moved to the blob store
+    blob_key TEXT,              -- key of the photo in the blob store (utils/blob_store.py)
+    content_hash CHAR(64),
     uploaded_at TIMESTAMP DEFAULT NOW()
 );
+
+CREATE INDEX images_user_content_hash_idx ON images (user_id, content_hash);
+
+-- Detection labels and CLIP embedding (float32 bytes) keyed by SHA-256 of the photo
+CREATE TABLE image_inference_cache (
+    content_hash CHAR(64) PRIMARY KEY,
+    items TEXT,
+    embedding BYTEA NOT NULL,
+    regions JSONB,              -- [{"label", "score", "box"}] per detected object
+    region_embeddings BYTEA,    -- float32 CLIP embedding of each region, same order
+    clip_model TEXT,            -- CLIP checkpoint the embeddings come from
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Every Faster R-CNN instance above score_threshold, packed per photo:
+-- boxes float32 [N, 4] normalized x1,y1,x2,y2, scores float32 [N], classes int16 [N]
+CREATE TABLE image_detections (
+    content_hash CHAR(64) PRIMARY KEY,
+    boxes BYTEA NOT NULL,
+    scores BYTEA NOT NULL,
+    classes BYTEA NOT NULL,
+    score_threshold REAL NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Vectors whose upsert to the vector index failed after retries; the payload is
+-- the full record so it can be re-sent (utils/bulk_upsert.py, scripts/reconcile_vectors.py)
+CREATE TABLE vector_sync_failures (
+    vector_id TEXT PRIMARY KEY,
+    user_id INT,
+    source TEXT,                -- vector type: message, image or region
+    source_id INT,              -- message_id or image_id
+    payload JSONB NOT NULL,
+    error TEXT,
+    attempts INT NOT NULL DEFAULT 1,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX vector_sync_failures_updated_idx ON vector_sync_failures (updated_at);
+
+-- Vector indexes and the embedding version each holds; one is active (utils/vector_indexes.py)
+CREATE TABLE vector_indexes (
+    index_name TEXT PRIMARY KEY,
+    embedding_version TEXT NOT NULL,
+    status TEXT NOT NULL,       -- building, active or retired
+    created_at TIMESTAMP DEFAULT NOW(),
+    activated_at TIMESTAMP,
+    retired_at TIMESTAMP
+);
+
+-- Key-item extractions of chat prompts, expired after KEY_ITEM_CACHE_TTL (utils/key_item_cache.py)
+CREATE TABLE key_item_cache (
+    cache_key CHAR(64) PRIMARY KEY, -- sha256 of model, instruction version and normalized prompt
+    model TEXT NOT NULL,
+    prompt TEXT NOT NULL,       -- normalized prompt
+    key_item TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX key_item_cache_created_idx ON key_item_cache (created_at);
@@ -1,12 +1,21 @@
+import asyncio
+import os
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from controllers.detectron2 import router as detectron2_router
 from controllers.chatLogProcessing import router as chatlog_upload_router
 from controllers.nebius import router as nebius_router
 from controllers.upload_backup import router as upload_backup_router
 from controllers.authentication import router as authentication_router
-from database.database import get_connection
-from utils.pinecone_db import clear_index
+from controllers.jobs import router as jobs_router
+from controllers.search import router as search_router
+from controllers.deletes import router as deletes_router
+from utils.pinecone_db import clear_index, get_index
+from utils import metrics, readiness
+from utils.model_registry import describe_models, get_clip, get_predictor
+from utils.job_worker import start_workers
 
 app = FastAPI()
 '''
@@ -36,14 +45,83 @@ app.include_router(chatlog_upload_router, prefix="/api", tags=["chatlog_upload"]
 app.include_router(nebius_router, prefix="/api", tags=["nebius"])
 app.include_router(upload_backup_router, prefix="/api", tags=["files"])
 app.include_router(authentication_router, prefix="/api", tags=["authentication"])
+app.include_router(jobs_router, prefix="/api", tags=["jobs"])
+app.include_router(search_router, prefix="/api", tags=["search"])
+app.include_router(deletes_router, prefix="/api", tags=["deletes"])
 
+# Loaded in the background after the server starts accepting connections,
+# or lazily by the first request that needs them
+WARM_UP_COMPONENTS = {
+  "clip": get_clip,
+  "detectron2": get_predictor,
+  "vector_store": get_index,
+}
+for name in WARM_UP_COMPONENTS:
+  readiness.register(name)
 
-conn = get_connection()
-cursor = conn.cursor()
+
+async def warm_up():
+  async def load(name, loader):
+    try:
+      await run_in_threadpool(loader)
+    except Exception as e:
+      print(f"Warm-up of {name} failed: {e}")
+
+  await asyncio.gather(*(load(name, loader) for name, loader in WARM_UP_COMPONENTS.items()))
+
+
+@app.on_event("startup")
+async def start_warm_up():
+  app.state.warm_up_task = asyncio.create_task(warm_up())
+
+
+# Job workers normally run as their own process (python -m scripts.run_job_worker);
+# set JOB_WORKERS_IN_PROCESS=1 to run them as threads of the API process instead
+JOB_WORKERS_IN_PROCESS = os.getenv("JOB_WORKERS_IN_PROCESS", "0") == "1"
+
+
+@app.on_event("startup")
+def start_job_workers():
+  if JOB_WORKERS_IN_PROCESS:
+    app.state.job_workers, app.state.job_workers_stop = start_workers()
+
+
+@app.on_event("shutdown")
+def stop_job_workers():
+  if JOB_WORKERS_IN_PROCESS:
+    app.state.job_workers_stop.set()
 
 
 @app.get("/")
 def read_root():
   return {"message": "Hello, World!"}
 
+
+@app.get("/healthz")
+def healthz():
+  """Liveness: the worker is up and serving requests."""
+  return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+  """Readiness: 200 once every component is loaded, 503 with per-component status before that."""
+  all_ready, components = readiness.report()
+  return JSONResponse(
+    status_code=200 if all_ready else 503,
+    content={"ready": all_ready, "components": components},
+  )
+
+
+@app.get("/metrics")
+def read_metrics():
+  """Per-process counters, timings and gauges (e.g. inference queue depth)."""
+  return metrics.snapshot()
+
+
+@app.get("/models")
+def read_models():
+  """Load time and memory of each model loaded by this worker."""
+  return describe_models()
+
 # clear_index()
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""
+Benchmarks compact embedding encodings (utils/compact_embeddings.py): memory
+per vector, recall@k against exact float32 search, and scoring latency.
+
+Embeddings come from our own data, the photo and region embeddings of the
+image inference cache in Postgres (--source cache) or a local vector store
+index (--source local), or are synthetic (--source synthetic). A sample of
+them is held out and used as queries against the rest.
+
+Usage (from backend/):
+  python -m scripts.benchmark_embedding_compression --source cache --k 10
+  python -m scripts.benchmark_embedding_compression --source synthetic --vectors 50000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import numpy as np
+from utils import compact_embeddings
+from utils.compact_embeddings import EMBEDDING_ENCODINGS, encode
+
+
+def cache_embeddings(limit):
+    from database.database import get_connection
+
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor(name="benchmark_embeddings")
+        cursor.itersize = 1000
+        cursor.execute("SELECT embedding, region_embeddings FROM image_inference_cache LIMIT %s", (limit,))
+        rows = []
+        for row in cursor:
+            rows.append(np.frombuffer(bytes(row["embedding"]), dtype=np.float32).reshape(1, -1))
+            if row["region_embeddings"]:
+                rows.append(np.frombuffer(bytes(row["region_embeddings"]), dtype=np.float32).reshape(-1, rows[-1].shape[1]))
+        return np.concatenate(rows)
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def local_embeddings(index_name):
+    from utils.vector_store import VECTOR_STORE_DIR, LocalVectorStore
+
+    store = LocalVectorStore(os.path.join(VECTOR_STORE_DIR, index_name))
+    return np.concatenate([
+        segment.vectors.decode(np.flatnonzero(segment.alive)) for segment in store._segments if segment.alive.any()
+    ])
+
+
+def synthetic_embeddings(vectors, dimension, rng):
+    # Clustered, like CLIP embeddings of photos of a few kinds of things
+    centers = rng.standard_normal((max(vectors // 200, 1), dimension)).astype(np.float32)
+    return centers[rng.integers(0, len(centers), vectors)] + 0.6 * rng.standard_normal((vectors, dimension)).astype(np.float32)
+
+
+def python_list_bytes(dimension):
+    # What one embedding.tolist() costs: the list plus a boxed float per value
+    return sys.getsizeof([0.0] * dimension) + dimension * sys.getsizeof(0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", choices=["cache", "local", "synthetic"], default="cache")
+    parser.add_argument("--index-name", default="item-context-embeddings-512", help="Local store index for --source local")
+    parser.add_argument("--limit", type=int, default=20000, help="Cache rows read for --source cache")
+    parser.add_argument("--vectors", type=int, default=50000, help="Vectors for --source synthetic")
+    parser.add_argument("--dimension", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200, help="Vectors held out as queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--subspaces", type=int, default=compact_embeddings.PQ_SUBSPACES, help="PQ bytes per vector")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.source == "cache":
+        matrix = cache_embeddings(args.limit)
+    elif args.source == "local":
+        matrix = local_embeddings(args.index_name)
+    else:
+        matrix = synthetic_embeddings(args.vectors, args.dimension, rng)
+    matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    matrix = matrix.astype(np.float32)
+
+    order = rng.permutation(len(matrix))
+    queries, base = matrix[order[:args.queries]], matrix[order[args.queries:]]
+    k = min(args.k, len(base))
+    truth = [set(np.argpartition(-(base @ query), k - 1)[:k]) for query in queries]
+    print(f"{len(base)} vectors of dimension {base.shape[1]}, {len(queries)} queries, recall@{k}")
+    print(f"as Python lists: {python_list_bytes(base.shape[1])} bytes/vector, {python_list_bytes(base.shape[1]) * len(base) / 1e6:.1f} MB")
+
+    for encoding in EMBEDDING_ENCODINGS:
+        start = time.perf_counter()
+        codebook = compact_embeddings.train_pq_codebook(base, subspaces=args.subspaces) if encoding == "pq" else None
+        compact = encode(base, encoding, codebook)
+        encode_seconds = time.perf_counter() - start
+
+        latencies = []
+        recalls = []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            scores = compact.scores(query)
+            found = np.argpartition(-scores, k - 1)[:k]
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(expected.intersection(found.tolist())) / k)
+
+        print(
+            f"{encoding:8s} {compact.nbytes / len(base):7.1f} bytes/vector  {compact.nbytes / 1e6:7.1f} MB  "
+            f"recall@{k} {statistics.mean(recalls):.3f}  p50 {statistics.median(latencies) * 1000:6.2f} ms  "
+            f"encode {encode_seconds:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmarks the image pre-scaling pipeline against full-resolution decoding.
+
+For every photo in a fixture directory it decodes the image at full
+resolution and at each requested IMAGE_MAX_SIDE, runs CLIP and Faster R-CNN
+on both, and reports decode / inference latency plus label recall of the
+scaled run against the full-resolution labels.
+
+Usage (from backend/):
+  python -m scripts.benchmark_preprocessing path/to/fixtures --max-side 800 1333 --repeat 3
+"""
+import argparse
+from io import BytesIO
+import os
+import statistics
+import time
+from PIL import Image, ImageOps
+from controllers.detectron2 import process_image_batch
+from utils.image_preprocessing import load_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def load_full_resolution(image_bytes):
+    # The decode path used before pre-scaling: full size, only orientation fixed
+    image = Image.open(BytesIO(image_bytes))
+    return ImageOps.exif_transpose(image).convert("RGB")
+
+
+def run(decode, image_bytes, repeat):
+    decode_times = []
+    inference_times = []
+    labels = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        image = decode(image_bytes)
+        decoded = time.perf_counter()
+        labels = process_image_batch([image])[0]["labels"]
+        done = time.perf_counter()
+        decode_times.append(decoded - start)
+        inference_times.append(done - decoded)
+    return {
+        "decode": statistics.median(decode_times),
+        "inference": statistics.median(inference_times),
+        "labels": set(labels),
+        "pixels": image.size[0] * image.size[1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures", help="Directory of fixture photos")
+    parser.add_argument("--max-side", type=int, nargs="+", default=[800, 1333], help="IMAGE_MAX_SIDE values to compare")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per image, the median is reported")
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.fixtures, name) for name in os.listdir(args.fixtures)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        raise SystemExit(f"No images found in {args.fixtures}")
+
+    configs = [("full", load_full_resolution)] + [
+        (str(max_side), lambda data, max_side=max_side: load_image(data, max_side=max_side))
+        for max_side in args.max_side
+    ]
+    totals = {name: {"decode": [], "inference": [], "pixels": [], "recall": []} for name, _ in configs}
+
+    for path in paths:
+        with open(path, "rb") as f:
+            image_bytes = f.read()
+
+        baseline = None
+        for name, decode in configs:
+            result = run(decode, image_bytes, args.repeat)
+            if baseline is None:
+                baseline = result
+            recall = len(result["labels"] & baseline["labels"]) / len(baseline["labels"]) if baseline["labels"] else 1.0
+
+            totals[name]["decode"].append(result["decode"])
+            totals[name]["inference"].append(result["inference"])
+            totals[name]["pixels"].append(result["pixels"])
+            totals[name]["recall"].append(recall)
+        print(f"{os.path.basename(path)}: full-res labels = {sorted(baseline['labels'])}")
+
+    print()
+    print(f"{'max side':>10} {'megapixels':>11} {'decode ms':>10} {'infer ms':>10} {'total ms':>10} {'recall':>7}")
+    for name, _ in configs:
+        t = totals[name]
+        decode_ms = statistics.mean(t["decode"]) * 1000
+        infer_ms = statistics.mean(t["inference"]) * 1000
+        print(
+            f"{name:>10} {statistics.mean(t['pixels']) / 1e6:>11.2f} {decode_ms:>10.1f} "
+            f"{infer_ms:>10.1f} {decode_ms + infer_ms:>10.1f} {statistics.mean(t['recall']):>7.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmarks the local vector store offline on synthetic vectors.
+
+Fills a throwaway LocalVectorStore with image/region/message vectors for a few
+users, then reports query latency of the exact (NumPy) path and, when hnswlib
+is installed, of the HNSW path together with its recall against exact search.
+
+Usage (from backend/):
+  python -m scripts.benchmark_vector_store --vectors 50000 --users 4 --queries 200
+  python -m scripts.benchmark_vector_store --encoding int8
+"""
+import argparse
+import statistics
+import tempfile
+import time
+import numpy as np
+from utils.vector_store import LocalVectorStore
+
+TYPES = ["image", "region", "message"]
+
+
+def fill(store, vectors, users, dimension, batch_size, rng):
+    for start in range(0, vectors, batch_size):
+        count = min(batch_size, vectors - start)
+        values = rng.standard_normal((count, dimension)).astype(np.float32)
+        store.upsert([
+            {
+                "id": f"v{start + i}",
+                "values": values[i].tolist(),
+                "metadata": {"user_id": (start + i) % users, "type": TYPES[(start + i) % len(TYPES)], "image_id": start + i},
+            }
+            for i in range(count)
+        ])
+
+
+def time_queries(store, queries, top_k, filter):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        result = store.query(query, top_k=top_k, filter=filter)
+        latencies.append(time.perf_counter() - start)
+        results.append([match["id"] for match in result["matches"]])
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50000, help="Total vectors stored")
+    parser.add_argument("--users", type=int, default=4, help="Tenants the vectors are spread over")
+    parser.add_argument("--dimension", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Vectors per upsert")
+    parser.add_argument("--encoding", choices=["float32", "float16", "int8"], default="float32", help="Segment matrix encoding")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.queries, args.dimension)).astype(np.float32)
+    filter = {"user_id": 0, "type": {"$in": ["image", "region"]}}
+
+    with tempfile.TemporaryDirectory() as path:
+        exact_store = LocalVectorStore(path, ann_threshold=args.vectors + 1, encoding=args.encoding)
+        start = time.perf_counter()
+        fill(exact_store, args.vectors, args.users, args.dimension, args.batch_size, rng)
+        print(f"upserted {args.vectors} vectors in {time.perf_counter() - start:.1f}s, {exact_store.describe_index_stats()}")
+
+        exact, exact_results = time_queries(exact_store, queries, args.top_k, filter)
+        print(f"exact  p50 {exact['p50_ms']:.2f} ms  p95 {exact['p95_ms']:.2f} ms")
+
+        start = time.perf_counter()
+        LocalVectorStore(path, ann_threshold=args.vectors + 1, encoding=args.encoding)
+        print(f"reopened (memory-mapped) in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        ann_store = LocalVectorStore(path, ann_threshold=0, encoding=args.encoding)
+        if not ann_store._ann_available():
+            print("hnswlib is not installed, skipping HNSW")
+            return
+        ann_store.query(queries[0], top_k=args.top_k, filter=filter)  # builds the index
+        ann, ann_results = time_queries(ann_store, queries, args.top_k, filter)
+        recall = statistics.mean(
+            len(set(approximate) & set(truth)) / max(len(truth), 1)
+            for approximate, truth in zip(ann_results, exact_results)
+        )
+        print(f"hnsw   p50 {ann['p50_ms']:.2f} ms  p95 {ann['p95_ms']:.2f} ms  recall@{args.top_k} {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
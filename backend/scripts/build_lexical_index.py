@@ -0,0 +1,111 @@
+"""
+Rebuilds the BM25 lexical index (utils/lexical_index.py) from Postgres.
+
+Ingest keeps the index up to date; run this after restoring the database,
+moving LEXICAL_DB_PATH or enabling hybrid search on an existing deployment.
+Documents get the same ids and metadata as their vector records, including
+the key item and context of chat messages kept in the messages table.
+Messages stored before those columns existed have neither until
+utils/reembed.py fills them in, so their documents already in the index are
+left alone and missing ones are added searchable by message text only.
+Documents of messages and photos no longer in Postgres (of the user, with
+--user-id) are deleted.
+
+Usage (from backend/):
+  python -m scripts.build_lexical_index --user-id 3
+"""
+import argparse
+from database.database import get_connection
+from utils.lexical_index import add_documents, delete_documents, existing_doc_ids, indexed_doc_ids
+
+BATCH_SIZE = 1000
+
+
+def image_documents(cursor, user_id):
+    cursor.execute("""
+        SELECT image_id, user_id, filename, items FROM images
+        WHERE %s IS NULL OR user_id = %s
+        ORDER BY image_id
+    """, (user_id, user_id))
+    for row in cursor.fetchall():
+        yield {
+            "id": row["filename"] + '_' + str(row["image_id"]),
+            "metadata": {
+                "type": "image",
+                "image_id": row["image_id"],
+                "user_id": row["user_id"],
+                "items": [item.strip() for item in (row["items"] or "").split(",") if item.strip()],
+                "filename": row["filename"],
+            },
+        }
+
+
+def message_documents(cursor, user_id):
+    cursor.execute("""
+        SELECT m.message_id, m.chat_id, m.message, m.item, m.context, c.user_id, c.chat_title
+        FROM messages m
+        JOIN chat_logs c ON c.chat_id = m.chat_id
+        WHERE %s IS NULL OR c.user_id = %s
+        ORDER BY m.message_id
+    """, (user_id, user_id))
+    for row in cursor.fetchall():
+        yield {
+            "id": row["chat_title"] + '_' + str(row["message_id"]),
+            "metadata": {
+                "chat_id": row["chat_id"],
+                "message_id": row["message_id"],
+                "type": "message",
+                "item": row["item"] or "",
+                "context": row["context"] or "",
+                "message": row["message"],
+                "user_id": row["user_id"],
+            },
+        }
+
+
+def index_batch(kind, batch):
+    if kind == "messages":
+        # Don't replace an indexed document with one lacking item and context
+        bare = [document["id"] for document in batch if not (document["metadata"]["item"] or document["metadata"]["context"])]
+        existing = existing_doc_ids(bare) if bare else set()
+        batch = [document for document in batch if document["id"] not in existing]
+    add_documents(batch)
+    return len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, default=None, help="Only rebuild this user's documents")
+    args = parser.parse_args()
+
+    # Taken before reading Postgres, so documents ingested meanwhile are kept
+    stale = indexed_doc_ids(args.user_id)
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor()
+        for kind, documents in (("images", image_documents), ("messages", message_documents)):
+            batch = []
+            total = 0
+            for document in documents(cursor, args.user_id):
+                stale.discard(document["id"])
+                batch.append(document)
+                if len(batch) == BATCH_SIZE:
+                    total += index_batch(kind, batch)
+                    batch = []
+            total += index_batch(kind, batch)
+            print(f"Indexed {total} {kind}")
+
+        delete_documents(doc_ids=sorted(stale))
+        print(f"Deleted {len(stale)} documents no longer in Postgres")
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Exports and verifies the optimized inference backends.
+
+  export  writes the ONNX exports of the CLIP image and text towers
+  verify  runs every backend on a directory of fixture photos and compares it
+          with the eager fp32 models: cosine similarity of CLIP image/text
+          embeddings, Faster R-CNN detection agreement, and latency
+
+Usage (from backend/):
+  python -m scripts.export_models export
+  python -m scripts.export_models verify path/to/fixtures --clip-backends int8 onnx --detectron-backends int8
+
+verify exits with status 1 when a backend falls below --min-cosine or
+--min-agreement, so it can gate a CLIP_BACKEND / DETECTRON_BACKEND change.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import numpy as np
+import torch
+from utils.image_preprocessing import load_image
+from utils.inference_backends import export_clip_onnx, ONNX_EXPORT_DIR
+from utils.model_registry import load_clip, load_predictor, inference_context
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+SAMPLE_TEXTS = [
+    "Item: laptop Context: on the desk in the office",
+    "Item: guitar Context: living room corner",
+    "Item: passport Context: kitchen drawer",
+    "Item: dog leash Context: hanging by the front door",
+]
+
+
+def load_fixtures(directory):
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        raise SystemExit(f"No images found in {directory}")
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(load_image(f.read()))
+    return images
+
+
+def clip_outputs(model, processor, images):
+    image_inputs = processor(images=images, return_tensors="pt")
+    text_inputs = processor(text=SAMPLE_TEXTS, return_tensors="pt", padding=True, truncation=True)
+    with inference_context():
+        start = time.perf_counter()
+        image_embeds = model.get_image_features(**image_inputs)
+        image_seconds = (time.perf_counter() - start) / len(images)
+        text_embeds = model.get_text_features(**text_inputs)
+    return image_embeds.float(), text_embeds.float(), image_seconds
+
+
+def cosine(a, b):
+    return torch.nn.functional.cosine_similarity(a, b, dim=-1)
+
+
+def detection_outputs(predictor, images):
+    outputs = []
+    seconds = []
+    with inference_context():
+        for image in images:
+            start = time.perf_counter()
+            outputs.append(predictor(np.asarray(image))["instances"].to("cpu"))
+            seconds.append(time.perf_counter() - start)
+    return outputs, statistics.mean(seconds)
+
+
+def detection_agreement(reference, candidate):
+    """Fraction of boxes matched by class with IoU >= 0.5 (over the larger of the two sets)."""
+    from detectron2.structures import pairwise_iou
+
+    if len(reference) == 0 and len(candidate) == 0:
+        return 1.0
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0.0
+
+    iou = pairwise_iou(reference.pred_boxes, candidate.pred_boxes)
+    same_class = reference.pred_classes[:, None] == candidate.pred_classes[None, :]
+    iou = torch.where(same_class, iou, torch.zeros_like(iou))
+
+    matched = 0
+    used = set()
+    for i in range(len(reference)):
+        order = torch.argsort(iou[i], descending=True)
+        for j in order.tolist():
+            if iou[i, j] < 0.5:
+                break
+            if j not in used:
+                used.add(j)
+                matched += 1
+                break
+    return matched / max(len(reference), len(candidate))
+
+
+def export(args):
+    model, processor = load_clip("eager")
+    image_path, text_path = export_clip_onnx(model, processor, args.output)
+    print(f"Exported {image_path} and {text_path}")
+
+
+def verify(args):
+    images = load_fixtures(args.fixtures)
+    ok = True
+
+    if args.clip_backends:
+        model, processor = load_clip("eager")
+        ref_image, ref_text, ref_seconds = clip_outputs(model, processor, images)
+        print(f"CLIP eager: {ref_seconds * 1000:.1f} ms/image")
+        for backend in args.clip_backends:
+            model, processor = load_clip(backend)
+            image_embeds, text_embeds, seconds = clip_outputs(model, processor, images)
+            image_cos = cosine(ref_image, image_embeds)
+            text_cos = cosine(ref_text, text_embeds)
+            worst = min(image_cos.min().item(), text_cos.min().item())
+            passed = worst >= args.min_cosine
+            ok = ok and passed
+            print(
+                f"CLIP {backend}: {seconds * 1000:.1f} ms/image ({ref_seconds / seconds:.2f}x), "
+                f"image cosine mean {image_cos.mean():.4f} min {image_cos.min():.4f}, "
+                f"text cosine mean {text_cos.mean():.4f} min {text_cos.min():.4f} "
+                f"-> {'OK' if passed else 'FAIL'}"
+            )
+
+    if args.detectron_backends:
+        reference, ref_seconds = detection_outputs(load_predictor("eager"), images)
+        print(f"Detectron2 eager: {ref_seconds * 1000:.1f} ms/image")
+        for backend in args.detectron_backends:
+            candidate, seconds = detection_outputs(load_predictor(backend), images)
+            agreement = statistics.mean(detection_agreement(r, c) for r, c in zip(reference, candidate))
+            passed = agreement >= args.min_agreement
+            ok = ok and passed
+            print(
+                f"Detectron2 {backend}: {seconds * 1000:.1f} ms/image ({ref_seconds / seconds:.2f}x), "
+                f"detection agreement {agreement:.3f} -> {'OK' if passed else 'FAIL'}"
+            )
+
+    if not ok:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export CLIP to ONNX")
+    export_parser.add_argument("--output", default=ONNX_EXPORT_DIR, help="Directory for the .onnx files")
+    export_parser.set_defaults(func=export)
+
+    verify_parser = subparsers.add_parser("verify", help="Compare backends against the eager models")
+    verify_parser.add_argument("fixtures", help="Directory of fixture photos")
+    verify_parser.add_argument("--clip-backends", nargs="*", default=["int8", "onnx"])
+    verify_parser.add_argument("--detectron-backends", nargs="*", default=["int8"])
+    verify_parser.add_argument("--min-cosine", type=float, default=0.98)
+    verify_parser.add_argument("--min-agreement", type=float, default=0.9)
+    verify_parser.set_defaults(func=verify)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
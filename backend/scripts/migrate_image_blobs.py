@@ -0,0 +1,91 @@
+"""
+Moves photos stored inline in images.image_data (BYTEA) into the blob store.
+
+Rows are processed in batches, each committed on its own, so the migration
+can be stopped and re-run at any time: it only picks rows that still have
+image_data and no blob_key. Run VACUUM (FULL) on images afterwards to give
+the space back to the OS.
+
+Usage (from backend/):
+  python -m scripts.migrate_image_blobs --batch-size 50
+"""
+import argparse
+import time
+from database.database import get_connection
+from utils.blob_store import get_blob_store, blob_key
+
+
+def migrate_batch(store, batch_size, dry_run):
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT image_id, image_data
+            FROM images
+            WHERE blob_key IS NULL AND image_data IS NOT NULL
+            ORDER BY image_id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (batch_size,))
+        rows = cursor.fetchall()
+
+        moved_bytes = 0
+        for row in rows:
+            data = bytes(row["image_data"])
+            moved_bytes += len(data)
+            if dry_run:
+                continue
+            key = store.put(data)
+            cursor.execute("""
+                UPDATE images
+                SET blob_key = %s, content_hash = COALESCE(content_hash, %s), image_data = NULL
+                WHERE image_id = %s
+            """, (key, blob_key(data), row["image_id"]))
+
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+        return len(rows), moved_bytes
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=50, help="Rows moved per transaction")
+    parser.add_argument("--sleep", type=float, default=0.0, help="Seconds to pause between batches")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be moved without writing")
+    args = parser.parse_args()
+
+    store = get_blob_store()
+    total_rows = 0
+    total_bytes = 0
+    start = time.perf_counter()
+
+    while True:
+        rows, moved_bytes = migrate_batch(store, args.batch_size, args.dry_run)
+        total_rows += rows
+        total_bytes += moved_bytes
+        if rows:
+            print(f"Moved {total_rows} images ({total_bytes / 2**20:.1f} MB) in {time.perf_counter() - start:.1f}s")
+        if rows < args.batch_size or args.dry_run:
+            break
+        if args.sleep:
+            time.sleep(args.sleep)
+
+    print(f"Done: {total_rows} images, {total_bytes / 2**20:.1f} MB{' (dry run)' if args.dry_run else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Moves vectors from the default namespace of the vector index into per-user
+namespaces (see VECTOR_NAMESPACES in utils/vector_store.py).
+
+For every user, the ids of their vectors are listed from Postgres
+(utils/vector_ids.py), fetched from the default namespace, written to the
+user's namespace and only then deleted from the default one. Batches are
+throttled with --sleep so serving traffic keeps its share of the index's
+throughput. Vectors already moved are no longer in the default namespace, so
+the migration can be stopped and re-run at any time; --start-user skips the
+users done before.
+
+Run it with VECTOR_NAMESPACES=migrating (searches read both namespaces
+meanwhile), then switch to VECTOR_NAMESPACES=on.
+
+Usage (from backend/):
+  python -m scripts.migrate_namespaces --batch-size 100 --sleep 0.2
+"""
+import argparse
+import time
+from database.database import get_connection
+from utils.bulk_upsert import plan_batches
+from utils.pinecone_db import get_index
+from utils.vector_ids import UNKNOWN_REGION_COUNT, user_vector_ids
+from utils.vector_store import VECTOR_NAMESPACES, user_namespace
+
+
+def list_user_ids(start_user):
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT user_id FROM users WHERE user_id >= %s ORDER BY user_id", (start_user,))
+        return [row["user_id"] for row in cursor.fetchall()]
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def migrate_user(store, user_id, batch_size, sleep, dry_run):
+    """Moves one user's vectors; returns how many were moved."""
+    ids = user_vector_ids(user_id, unknown_regions=UNKNOWN_REGION_COUNT)
+    moved = 0
+    for start in range(0, len(ids), batch_size):
+        records = store.fetch(ids[start:start + batch_size], namespace="")
+        vectors = [
+            {"id": vector_id, "values": [float(value) for value in record["values"]], "metadata": record["metadata"]}
+            for vector_id, record in records.items()
+            if record["metadata"].get("user_id") == user_id
+        ]
+        if not vectors:
+            continue
+        moved += len(vectors)
+        if dry_run:
+            continue
+
+        for batch in plan_batches(vectors):
+            store.upsert(batch, namespace=user_namespace(user_id))
+        # Deleted only after the copy is written, so an interrupted run loses nothing
+        store.delete(ids=[vector["id"] for vector in vectors], namespace="")
+        if sleep:
+            time.sleep(sleep)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", help="Index to migrate (default: the active index)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Vector ids fetched and moved at a time")
+    parser.add_argument("--sleep", type=float, default=0.2, help="Seconds to pause between batches")
+    parser.add_argument("--start-user", type=int, default=0, help="Skip users with a lower user_id")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be moved without writing")
+    args = parser.parse_args()
+
+    if VECTOR_NAMESPACES == "off" and not args.dry_run:
+        parser.error("VECTOR_NAMESPACES is off: searches would not see the moved vectors. Set it to migrating first.")
+
+    store = get_index(args.index)
+    total = 0
+    start = time.perf_counter()
+    for user_id in list_user_ids(args.start_user):
+        moved = migrate_user(store, user_id, args.batch_size, args.sleep, args.dry_run)
+        total += moved
+        if moved:
+            print(f"User {user_id}: moved {moved} vectors ({total} total, {time.perf_counter() - start:.1f}s)")
+
+    remaining = store.describe_index_stats()["namespaces"].get("", 0)
+    print(f"Done: {total} vectors{' (dry run)' if args.dry_run else ''}, {remaining} left in the default namespace")
+
+
+if __name__ == "__main__":
+    main()
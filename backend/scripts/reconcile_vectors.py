@@ -0,0 +1,34 @@
+"""
+Re-sends vectors whose upsert failed after retries (see utils/bulk_upsert.py).
+
+Failed batches are recorded in vector_sync_failures with the full vector, so
+the vector index can be brought back in sync with Postgres without running the
+models again. Job workers do this every VECTOR_RECONCILE_SECONDS; this script
+runs it on demand until nothing is left or no progress is made.
+
+Usage (from backend/):
+  python -m scripts.reconcile_vectors --limit 1000
+"""
+import argparse
+from utils.bulk_upsert import retry_failed_upserts
+from utils.pinecone_db import get_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=1000, help="Vectors re-sent per round")
+    args = parser.parse_args()
+
+    store = get_index()
+    total = 0
+    while True:
+        summary = retry_failed_upserts(store, limit=args.limit)
+        total += summary["synced"]
+        print(summary)
+        if summary["retried"] == 0 or summary["synced"] == 0:
+            break
+    print(f"Synced {total} vectors")
+
+
+if __name__ == "__main__":
+    main()
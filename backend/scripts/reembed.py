@@ -0,0 +1,49 @@
+"""
+Re-embeds all messages and photos for the current embedding version and cuts
+over to the new index (see utils/reembed.py).
+
+Queues a "reembed" job, so the work is checkpointed and resumes after a crash,
+and follows its progress. Job workers run it; pass --run to run a worker in
+this process instead. Run it with the new CLIP_MODEL_NAME configured.
+
+Usage (from backend/):
+  python -m scripts.reembed --run
+  python -m scripts.reembed --no-cutover    # build the index, activate later
+"""
+import argparse
+import time
+from utils.job_queue import enqueue, get_job
+from utils.job_worker import start_workers
+from utils.pinecone_db import embedding_version
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--run", action="store_true", help="Run a job worker in this process")
+    parser.add_argument("--no-cutover", action="store_true", help="Leave the new index building instead of activating it")
+    parser.add_argument("--restart", action="store_true", help="Start a new job instead of following the last one for this version")
+    args = parser.parse_args()
+
+    version = embedding_version()
+    key = f"reembed:{version}:{'building' if args.no_cutover else 'cutover'}"
+    if args.restart:
+        key += f":{time.time()}"
+    job, created = enqueue("reembed", {"cutover": not args.no_cutover}, idempotency_key=key)
+    print(f"{'Queued' if created else 'Following existing'} re-embed job {job['job_id']} for {version}")
+
+    if args.run:
+        start_workers(1)
+
+    last_stages = None
+    while job["status"] not in ("succeeded", "failed"):
+        time.sleep(2)
+        job = get_job(job["job_id"])
+        if job["stages"] != last_stages:
+            last_stages = job["stages"]
+            print(job["status"], last_stages)
+
+    print(job["status"], job["result"] or job["error"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""
+Runs ingestion job workers in their own process, next to the API.
+
+Workers share the SQLite queue at JOB_DB_PATH and the blob store with the API,
+so start this from the same directory and environment. Jobs left running by a
+worker that died are picked up again once their lease expires.
+
+Usage (from backend/):
+  python -m scripts.run_job_worker --concurrency 2
+"""
+import argparse
+from utils.job_worker import JOB_CONCURRENCY, run_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=JOB_CONCURRENCY, help="Worker threads in this process.")
+    args = parser.parse_args()
+
+    print(f"Starting {args.concurrency} job worker(s)")
+    run_worker(args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import sys
+import pytest
+from scripts import build_lexical_index
+from utils import lexical_index
+
+
+class FakeCursor:
+    """Answers the script's two SELECTs from in-memory rows."""
+
+    def __init__(self, images, messages):
+        self.tables = {"images": images, "messages": messages}
+        self.rows = []
+
+    def execute(self, query, params):
+        user_id = params[0]
+        rows = self.tables["images" if "FROM images" in query else "messages"]
+        self.rows = [row for row in rows if user_id is None or row["user_id"] == user_id]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def lexical_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(lexical_index, "LEXICAL_DB_PATH", str(tmp_path / "lexical.db"))
+    monkeypatch.setattr(lexical_index, "_local", type(lexical_index._local)())
+    monkeypatch.setattr(lexical_index, "_schema_ready", False)
+
+
+def image(image_id, user_id, items):
+    return {"image_id": image_id, "user_id": user_id, "filename": "photo.jpg", "items": items}
+
+
+def message(message_id, user_id, item, context):
+    return {
+        "message_id": message_id, "chat_id": 1, "message": "I put it in the drawer",
+        "item": item, "context": context, "user_id": user_id, "chat_title": "chat.txt",
+    }
+
+
+def rebuild(monkeypatch, images, messages, *args):
+    cursor = FakeCursor(images, messages)
+    monkeypatch.setattr(build_lexical_index, "get_connection", lambda: FakeConnection(cursor))
+    monkeypatch.setattr(sys, "argv", ["build_lexical_index", *args])
+    build_lexical_index.main()
+
+
+def test_rebuild_indexes_item_and_context_and_drops_deleted_rows(monkeypatch):
+    rebuild(monkeypatch, [image(1, 3, "passport"), image(2, 4, "dog leash")], [message(5, 3, "keys", "kitchen drawer")])
+    assert lexical_index.indexed_doc_ids() == {"photo.jpg_1", "photo.jpg_2", "chat.txt_5"}
+    assert [result["message_id"] for result in lexical_index.lexical_search(3, "kitchen", "message", 5)] == [5]
+
+    # Photo 1 and the message were deleted from Postgres, e.g. before a restore
+    rebuild(monkeypatch, [image(2, 4, "dog leash")], [])
+    assert lexical_index.indexed_doc_ids() == {"photo.jpg_2"}
+
+
+def test_user_rebuild_leaves_other_users(monkeypatch):
+    rebuild(monkeypatch, [image(1, 3, "passport"), image(2, 4, "dog leash")], [])
+    rebuild(monkeypatch, [], [], "--user-id", "3")
+    assert lexical_index.indexed_doc_ids() == {"photo.jpg_2"}
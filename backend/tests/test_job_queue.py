@@ -0,0 +1,73 @@
+import pytest
+from utils import job_queue
+
+
+@pytest.fixture(autouse=True)
+def job_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_DB_PATH", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(job_queue, "_local", type(job_queue._local)())
+    monkeypatch.setattr(job_queue, "_schema_ready", False)
+
+
+def run_to_end(status):
+    job = job_queue.claim_job("worker-1")
+    if status == "succeeded":
+        job_queue.complete(job["job_id"], "worker-1", {"ok": True})
+    else:
+        job_queue.fail(job["job_id"], "worker-1", "boom", job_queue.JOB_MAX_ATTEMPTS)
+    return job
+
+
+def test_repeat_returns_job_in_progress():
+    job, created = job_queue.enqueue("process_chatlog", {"n": 1}, "key")
+    assert created
+    assert job_queue.enqueue("process_chatlog", {"n": 1}, "key") == (job, False)
+
+    job_queue.claim_job("worker-1")
+    again, created = job_queue.enqueue("process_chatlog", {"n": 1}, "key")
+    assert not created and again["job_id"] == job["job_id"]
+
+
+def test_repeat_requeues_failed_job():
+    job, _ = job_queue.enqueue("process_chatlog", {"n": 1}, "key")
+    run_to_end("failed")
+    assert job_queue.get_job(job["job_id"])["status"] == "failed"
+
+    again, created = job_queue.enqueue("process_chatlog", {"n": 1}, "key")
+    assert created
+    assert again["job_id"] == job["job_id"]
+    assert again["status"] == "queued" and again["attempts"] == 0
+    assert job_queue.claim_job("worker-2")["job_id"] == job["job_id"]
+
+
+def test_repeat_after_success_queues_new_job():
+    job, _ = job_queue.enqueue("process_chatlog", {"n": 1}, "key")
+    run_to_end("succeeded")
+
+    again, created = job_queue.enqueue("process_chatlog", {"n": 1}, "key")
+    assert created
+    assert again["job_id"] != job["job_id"] and again["status"] == "queued"
+    assert job_queue.get_job(job["job_id"])["status"] == "succeeded"
+
+
+def test_late_worker_cannot_overwrite_new_claim():
+    job, _ = job_queue.enqueue("process_chatlog", {"n": 1}, "key")
+    first = job_queue.claim_job("worker-1")
+    context = job_queue.JobContext(first)
+
+    # worker-1's lease expires and worker-2 takes the job over
+    job_queue._connect().execute("UPDATE jobs SET lease_expires_at = 0 WHERE job_id = ?", (job["job_id"],))
+    second = job_queue.claim_job("worker-2")
+    assert second["worker_id"] == "worker-2" and second["attempts"] == 2
+
+    assert not job_queue.complete(job["job_id"], "worker-1", {"stale": True})
+    assert job_queue.fail(job["job_id"], "worker-1", "boom", 1) is None
+    with pytest.raises(job_queue.LeaseLostError):
+        context.progress("embed")
+
+    current = job_queue.get_job(job["job_id"])
+    assert current["status"] == "running" and current["worker_id"] == "worker-2"
+    assert current["result"] is None and current["error"] is None
+
+    assert job_queue.complete(job["job_id"], "worker-2", {"ok": True})
+    assert job_queue.get_job(job["job_id"])["status"] == "succeeded"
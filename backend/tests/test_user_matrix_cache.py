@@ -0,0 +1,32 @@
+import numpy as np
+from utils import user_matrix_cache
+from utils.user_matrix_cache import UserMatrix
+
+
+class EmptyStore:
+    def fetch_user(self, user_id, ids):
+        return {}
+
+
+def test_user_without_vectors_is_cached(monkeypatch):
+    calls = []
+    monkeypatch.setattr(user_matrix_cache, "user_vector_ids", lambda user_id: calls.append(user_id) or [])
+
+    entry = user_matrix_cache.load_user_matrix(EmptyStore(), "test-index", 7)
+    assert len(entry) == 0
+    assert entry.query(np.ones(4), 5, ["image"]) == {"matches": []}
+    assert user_matrix_cache.get_user_matrix(EmptyStore(), "test-index", 7) is entry
+    assert calls == [7]
+    user_matrix_cache.invalidate_user(7)
+
+
+def test_empty_matrix_takes_appends():
+    vectors = [
+        {"id": "a", "values": [1.0, 0.0, 0.0], "metadata": {"user_id": 7, "type": "image"}},
+        {"id": "b", "values": [0.0, 2.0, 0.0], "metadata": {"user_id": 7, "type": "message"}},
+    ]
+    entry = UserMatrix.from_vectors([]).appended(vectors)
+    assert entry.ids == ["a", "b"]
+    matches = entry.query([0.0, 1.0, 0.0], 5, ["message"])["matches"]
+    assert [match["id"] for match in matches] == ["b"]
+    assert matches[0]["score"] == 1.0
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from utils import vector_store
+from utils.vector_store import LocalVectorStore
+
+
+def make_vectors(prefix, count, rng):
+    return [{"id": f"{prefix}-{i}", "values": rng.normal(size=8).tolist(), "metadata": {"user_id": 1}} for i in range(count)]
+
+
+def assert_own_vectors(store, vectors):
+    records = store.fetch([vector["id"] for vector in vectors])
+    assert set(records) == {vector["id"] for vector in vectors}
+    for vector in vectors:
+        expected = np.asarray(vector["values"]) / np.linalg.norm(vector["values"])
+        np.testing.assert_allclose(records[vector["id"]]["values"], expected, atol=1e-6)
+
+
+def fail_segment_json(monkeypatch):
+    atomic_write = vector_store._atomic_write
+
+    def failing_write(path, write):
+        if path.endswith(".json"):
+            raise OSError("disk full")
+        atomic_write(path, write)
+
+    monkeypatch.setattr(vector_store, "_atomic_write", failing_write)
+
+
+# (first batch size, later batch size): a small first segment is merged too,
+# a large one is left alone and only the tail is merged
+@pytest.mark.parametrize("first_size, size", [(2, 2), (10, 2)])
+def test_interrupted_compaction_keeps_vectors(tmp_path, monkeypatch, first_size, size):
+    rng = np.random.default_rng(0)
+    store = LocalVectorStore(str(tmp_path), max_segments=2)
+    batches = [make_vectors("a", first_size, rng), make_vectors("b", size, rng)]
+    for batch in batches:
+        store.upsert(batch)
+
+    # The third segment is written, then compacting fails before the merged .json
+    batches.append(make_vectors("c", size, rng))
+    calls = {"count": 0}
+    compact = LocalVectorStore._compact
+
+    def interrupted_compact(self):
+        calls["count"] += 1
+        fail_segment_json(monkeypatch)
+        compact(self)
+
+    monkeypatch.setattr(LocalVectorStore, "_compact", interrupted_compact)
+    with pytest.raises(OSError):
+        store.upsert(batches[-1])
+    assert calls["count"] == 1
+    monkeypatch.undo()
+
+    reloaded = LocalVectorStore(str(tmp_path), max_segments=2)
+    assert_own_vectors(reloaded, [vector for batch in batches for vector in batch])
+
+
+def test_compaction_keeps_vectors_and_deletes(tmp_path):
+    rng = np.random.default_rng(1)
+    store = LocalVectorStore(str(tmp_path), max_segments=2)
+    batches = [make_vectors(prefix, 3, rng) for prefix in "abcde"]
+    for batch in batches:
+        store.upsert(batch)
+    store.delete(ids=["a-0", "c-1"])
+    store.upsert(make_vectors("f", 3, rng))
+
+    kept = [vector for batch in batches for vector in batch if vector["id"] not in ("a-0", "c-1")]
+    for current in (store, LocalVectorStore(str(tmp_path), max_segments=2)):
+        assert_own_vectors(current, kept)
+        assert current.fetch(["a-0", "c-1"]) == {}
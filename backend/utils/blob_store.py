@@ -0,0 +1,172 @@
+import hashlib
+import os
+import tempfile
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+Pluggable storage for image blobs, so photos do not live inline in Postgres.
+
+Blobs are content addressed: the key is the SHA-256 of the bytes, so storing
+the same photo twice is a no-op and a key never points at changed content.
+
+  local  files under BLOB_STORE_DIR, sharded as ab/cd/<key>
+  s3     any S3-compatible service (AWS, MinIO, ...) through a boto3-style
+         client; tests or local setups can pass any object implementing
+         put_object / get_object / head_object / delete_object
+
+Pick the backend with BLOB_STORE=local|s3.
+'''
+
+BLOB_STORE = os.getenv("BLOB_STORE", "local")
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "blobs")
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_PREFIX = os.getenv("S3_PREFIX", "images/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+CHUNK_SIZE = 256 * 1024
+
+
+def blob_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """Interface every blob backend implements."""
+
+    def put(self, data):
+        """Stores `data` and returns its key."""
+        raise NotImplementedError
+
+    def iter_chunks(self, key, chunk_size=CHUNK_SIZE):
+        """Yields the blob in chunks without loading it whole."""
+        raise NotImplementedError
+
+    def head(self, key, length=32):
+        """Returns the first `length` bytes of the blob (e.g. to sniff its type)."""
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Path on local disk when the blob can be served with sendfile, else None."""
+        return None
+
+    def read(self, key):
+        return b"".join(self.iter_chunks(key))
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root=BLOB_STORE_DIR):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put(self, data):
+        key = blob_key(data)
+        path = self._path(key)
+        if os.path.exists(path):
+            return key
+
+        # Write to a temp file and rename so readers never see a partial blob
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return key
+
+    def iter_chunks(self, key, chunk_size=CHUNK_SIZE):
+        with open(self._path(key), "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def head(self, key, length=32):
+        with open(self._path(key), "rb") as f:
+            return f.read(length)
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key):
+        return self._path(key)
+
+
+class S3BlobStore(BlobStore):
+    def __init__(self, bucket=S3_BUCKET, prefix=S3_PREFIX, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _object_key(self, key):
+        return self.prefix + key
+
+    def put(self, data):
+        key = blob_key(data)
+        if not self.exists(key):
+            self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data)
+        return key
+
+    def iter_chunks(self, key, chunk_size=CHUNK_SIZE):
+        body = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))["Body"]
+        try:
+            while True:
+                chunk = body.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    def head(self, key, length=32):
+        response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key), Range=f"bytes=0-{length - 1}")
+        return response["Body"].read()
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except Exception as e:
+            # botocore raises ClientError with a 404 code for missing objects
+            if getattr(e, "response", {}).get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """Returns the configured blob store (BLOB_STORE=local|s3)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if BLOB_STORE == "s3":
+                _store = S3BlobStore()
+            elif BLOB_STORE == "local":
+                _store = LocalBlobStore()
+            else:
+                raise ValueError(f"Unknown BLOB_STORE '{BLOB_STORE}', expected 'local' or 's3'")
+    return _store
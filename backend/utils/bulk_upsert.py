@@ -0,0 +1,244 @@
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import Json
+from dotenv import load_dotenv
+from database.database import get_connection
+from utils import metrics
+from utils.vector_store import write_namespace
+
+load_dotenv()
+
+'''
+Bulk writes of vectors to the vector store.
+
+Vectors are grouped into batches by serialized size (UPSERT_MAX_BYTES, below
+Pinecone's 2 MB request limit) as well as by count (UPSERT_BATCH_SIZE) within
+the namespace of each vector's user (utils/vector_store.write_namespace), sent
+UPSERT_CONCURRENCY at a time, and each batch is retried with exponential
+backoff and jitter. A batch that still fails does not abort the others: its
+vectors are written to the `vector_sync_failures` table together with the
+Postgres row they belong to, so `retry_failed_upserts` (run by the job worker
+and scripts/reconcile_vectors.py) can bring the index back in sync with the
+database later.
+'''
+
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", 100))
+UPSERT_MAX_BYTES = int(os.getenv("UPSERT_MAX_BYTES", 1_800_000))
+UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", 4))
+UPSERT_RETRIES = int(os.getenv("UPSERT_RETRIES", 4))
+UPSERT_BACKOFF_SECONDS = float(os.getenv("UPSERT_BACKOFF_SECONDS", 0.5))
+
+# Pinecone rejects records with more than 40 KB of metadata
+METADATA_MAX_BYTES = 40_000
+
+
+def payload_bytes(vector):
+    return len(json.dumps(vector, separators=(",", ":")))
+
+
+def fit_metadata(vector):
+    """Truncates the longest string metadata fields until the record fits METADATA_MAX_BYTES."""
+    metadata = vector.get("metadata", {})
+    while len(json.dumps(metadata)) > METADATA_MAX_BYTES:
+        field = max(
+            (name for name, value in metadata.items() if isinstance(value, str)),
+            key=lambda name: len(metadata[name]),
+            default=None,
+        )
+        if field is None or len(metadata[field]) < 16:
+            break
+        metadata = {**metadata, field: metadata[field][:len(metadata[field]) // 2] + "…"}
+        metrics.increment("vector_upsert.metadata_truncated")
+    return {**vector, "metadata": metadata}
+
+
+def plan_batches(vectors, max_bytes=UPSERT_MAX_BYTES, max_vectors=UPSERT_BATCH_SIZE):
+    """Splits vectors into batches under both the byte and the count limit."""
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for vector in vectors:
+        size = payload_bytes(vector)
+        if batch and (batch_bytes + size > max_bytes or len(batch) >= max_vectors):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(vector)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def plan_namespace_batches(vectors):
+    """`plan_batches` per write namespace, as (namespace, batch) pairs."""
+    by_namespace = {}
+    for vector in vectors:
+        by_namespace.setdefault(write_namespace(vector.get("metadata", {}).get("user_id")), []).append(vector)
+    return [
+        (namespace, batch)
+        for namespace, namespace_vectors in by_namespace.items()
+        for batch in plan_batches(namespace_vectors)
+    ]
+
+
+def _upsert_with_retry(store, namespace, batch, retries):
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            with metrics.timer("vector_upsert.batch"):
+                store.upsert(vectors=batch, namespace=namespace)
+            return {"status": "ok", "attempts": attempt, "error": None}
+        except Exception as e:
+            if attempt > retries:
+                metrics.increment("vector_upsert.batch_failed")
+                return {"status": "failed", "attempts": attempt, "error": str(e)}
+            metrics.increment("vector_upsert.retry")
+            delay = UPSERT_BACKOFF_SECONDS * 2 ** (attempt - 1)
+            time.sleep(delay + random.uniform(0, delay))
+
+
+def bulk_upsert(store, vectors, retries=UPSERT_RETRIES, concurrency=UPSERT_CONCURRENCY, record_failures=True):
+    """
+    Upserts `vectors` in size-bounded batches, in parallel, with retries.
+
+    Returns:
+        list of dict: Per batch, "ids", "status" ("ok" or "failed"),
+        "attempts" and "error", in batch order.
+    """
+    vectors = [fit_metadata(vector) for vector in vectors]
+    planned = plan_namespace_batches(vectors)
+    if not planned:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(planned)))) as pool:
+        outcomes = list(pool.map(lambda item: _upsert_with_retry(store, item[0], item[1], retries), planned))
+    batches = [batch for _, batch in planned]
+
+    results = [
+        {"ids": [vector["id"] for vector in batch], **outcome}
+        for batch, outcome in zip(batches, outcomes)
+    ]
+    metrics.increment("vector_upsert.vectors", len(vectors))
+
+    failed = [
+        (vector, outcome["error"])
+        for batch, outcome in zip(batches, outcomes) if outcome["status"] == "failed"
+        for vector in batch
+    ]
+    if failed and record_failures:
+        record_failed_vectors(failed)
+    return results
+
+
+def record_failed_vectors(failed):
+    """
+    Writes vectors whose upsert failed to `vector_sync_failures`.
+
+    Args:
+        failed (list of tuple): (vector, error) pairs.
+    """
+    conn = get_connection()
+    cursor = None
+
+    try:
+        query = """
+            INSERT INTO vector_sync_failures (vector_id, user_id, source, source_id, payload, error)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (vector_id) DO UPDATE
+            SET payload = EXCLUDED.payload, error = EXCLUDED.error,
+                attempts = vector_sync_failures.attempts + 1, updated_at = NOW()
+        """
+        cursor = conn.cursor()
+        cursor.executemany(query, [
+            (
+                vector["id"],
+                vector["metadata"].get("user_id"),
+                vector["metadata"].get("type"),
+                vector["metadata"].get("message_id", vector["metadata"].get("image_id")),
+                Json(vector),
+                error,
+            )
+            for vector, error in failed
+        ])
+        conn.commit()
+        metrics.increment("vector_upsert.recorded_failures", len(failed))
+
+    except Exception as e:
+        # Last resort: the ids are at least in the logs
+        print(f"Error recording failed upserts {[vector['id'] for vector, _ in failed]}:", e)
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def retry_failed_upserts(store, limit=1000):
+    """
+    Re-sends recorded failures and removes the ones that now succeeded.
+
+    Returns:
+        dict: Counts of "retried", "synced" and "still_failed" vectors.
+    """
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT vector_id, payload FROM vector_sync_failures
+            ORDER BY updated_at
+            LIMIT %s
+        """, (limit,))
+        rows = cursor.fetchall()
+        if not rows:
+            return {"retried": 0, "synced": 0, "still_failed": 0}
+
+        results = bulk_upsert(store, [row["payload"] for row in rows], record_failures=False)
+        synced = [vector_id for result in results if result["status"] == "ok" for vector_id in result["ids"]]
+        still_failed = [(vector_id, result["error"]) for result in results if result["status"] == "failed" for vector_id in result["ids"]]
+
+        cursor.execute("DELETE FROM vector_sync_failures WHERE vector_id = ANY(%s)", (synced,))
+        cursor.executemany("""
+            UPDATE vector_sync_failures
+            SET attempts = attempts + 1, error = %s, updated_at = NOW()
+            WHERE vector_id = %s
+        """, [(error, vector_id) for vector_id, error in still_failed])
+        conn.commit()
+        metrics.increment("vector_upsert.reconciled", len(synced))
+        return {"retried": len(rows), "synced": len(synced), "still_failed": len(still_failed)}
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+
+def forget_failed_upserts(vector_ids=None, user_id=None):
+    """
+    Drops recorded failures of deleted vectors (by id, or every one of a
+    user), so reconciliation does not write them back.
+    """
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor()
+        if user_id is not None:
+            cursor.execute("DELETE FROM vector_sync_failures WHERE user_id = %s", (user_id,))
+        elif vector_ids:
+            cursor.execute("DELETE FROM vector_sync_failures WHERE vector_id = ANY(%s)", (list(vector_ids),))
+        conn.commit()
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
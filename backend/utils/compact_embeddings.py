@@ -0,0 +1,298 @@
+import os
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+Compact in-memory and on-disk forms of L2-normalized embedding matrices.
+
+A CLIP embedding as a Python list of floats (`embedding.tolist()`) costs about
+20 KB of objects; as a float32 row it is 2 KB. Every local copy of our vectors
+(the local vector store, per-user caches) keeps them in one of these instead:
+
+  float32  4 bytes per dimension, exact
+  float16  2 bytes per dimension, cosine error around 1e-4
+  int8     1 byte per dimension plus a float32 scale per row (symmetric,
+           per-row quantization), cosine error around 1e-3
+  pq       product quantization: `subspaces` bytes per row plus a shared
+           codebook, for caches where memory matters more than exact ranking
+
+Scores are computed on the compressed form: rows are widened to float32 a
+chunk at a time (numpy has no fast float16 or int8 matrix product) and PQ
+uses asymmetric distance lookup tables, so a full float32 copy never exists.
+numpy widens float16 slowly, so int8 is both smaller and faster to score;
+float16 is for when int8's error is too much. scripts/benchmark_embedding_compression.py
+measures recall@k and memory of each encoding on our embeddings.
+'''
+
+EMBEDDING_ENCODINGS = ("float32", "float16", "int8", "pq")
+
+# Rows widened to float32 at a time while scoring
+SCORE_CHUNK_ROWS = int(os.getenv("SCORE_CHUNK_ROWS", 1024))
+
+PQ_SUBSPACES = 64
+PQ_CENTROIDS = 256
+PQ_TRAIN_ROWS = 8192
+PQ_ITERATIONS = 10
+
+
+def _save(path, array):
+    # Written to a temporary file first, so readers never see a partial matrix
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, np.asarray(array))
+    os.replace(tmp, path)
+
+
+def _save_files(prefix, arrays):
+    """Writes {suffix: array} and removes side files of other encodings left under `prefix`."""
+    for suffix in (".scales.npy", ".codebook.npy"):
+        if suffix not in arrays and os.path.exists(prefix + suffix):
+            os.remove(prefix + suffix)
+    # The main .npy last, so side files are in place when it appears
+    for suffix in sorted(arrays, key=lambda suffix: suffix == ".npy"):
+        _save(prefix + suffix, arrays[suffix])
+
+
+def _rows(matrix, rows):
+    return matrix if rows is None else matrix[rows]
+
+
+class CompactMatrix:
+    """
+    An [N, dimension] matrix of L2-normalized embeddings in compressed form.
+
+    `rows` arguments select a subset by index (any numpy index array); None
+    means every row.
+    """
+
+    encoding = None
+
+    def __len__(self):
+        raise NotImplementedError
+
+    @property
+    def dimension(self):
+        raise NotImplementedError
+
+    @property
+    def nbytes(self):
+        raise NotImplementedError
+
+    def decode(self, rows=None):
+        """Returns the selected rows as a float32 matrix."""
+        raise NotImplementedError
+
+    def scores(self, query, rows=None):
+        """Dot products of the selected rows with a normalized float32 query (cosine similarities)."""
+        raise NotImplementedError
+
+    def save(self, prefix):
+        """Writes the matrix as .npy files starting with `prefix`."""
+        raise NotImplementedError
+
+
+class _ChunkedMatrix(CompactMatrix):
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def dimension(self):
+        return self.values.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def _widen(self, values, start, stop):
+        return np.asarray(values[start:stop], dtype=np.float32)
+
+    def decode(self, rows=None):
+        values = _rows(self.values, rows)
+        return np.concatenate([
+            self._widen(values, start, start + SCORE_CHUNK_ROWS) for start in range(0, len(values), SCORE_CHUNK_ROWS)
+        ]) if len(values) else np.empty((0, self.dimension), dtype=np.float32)
+
+    def scores(self, query, rows=None):
+        values = _rows(self.values, rows)
+        scores = np.empty(len(values), dtype=np.float32)
+        for start in range(0, len(values), SCORE_CHUNK_ROWS):
+            scores[start:start + SCORE_CHUNK_ROWS] = self._widen(values, start, start + SCORE_CHUNK_ROWS) @ query
+        return scores
+
+    def save(self, prefix):
+        _save_files(prefix, {".npy": self.values})
+
+
+class Float32Matrix(_ChunkedMatrix):
+    encoding = "float32"
+
+    def scores(self, query, rows=None):
+        # Already float32, a single BLAS product
+        return np.asarray(_rows(self.values, rows)) @ query
+
+    def decode(self, rows=None):
+        return np.asarray(_rows(self.values, rows), dtype=np.float32)
+
+
+class Float16Matrix(_ChunkedMatrix):
+    encoding = "float16"
+
+
+class Int8Matrix(_ChunkedMatrix):
+    """Per-row symmetric int8: row ≈ codes * scale, scale = max(|row|) / 127."""
+
+    encoding = "int8"
+
+    def __init__(self, codes, scales):
+        super().__init__(codes)
+        self.scales = scales
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.scales.nbytes
+
+    def decode(self, rows=None):
+        return super().decode(rows) * np.asarray(_rows(self.scales, rows))[:, None]
+
+    def scores(self, query, rows=None):
+        return super().scores(query, rows) * np.asarray(_rows(self.scales, rows))
+
+    def save(self, prefix):
+        _save_files(prefix, {".npy": self.values, ".scales.npy": self.scales})
+
+
+class PQMatrix(CompactMatrix):
+    """
+    Product quantization: each row is split into `subspaces` equal parts and
+    every part is replaced by the index of its nearest centroid.
+    """
+
+    encoding = "pq"
+
+    def __init__(self, codes, codebook):
+        self.codes = codes          # uint8 [N, subspaces]
+        self.codebook = codebook    # float32 [subspaces, centroids, dimension / subspaces]
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def dimension(self):
+        return self.codebook.shape[0] * self.codebook.shape[2]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.codebook.nbytes
+
+    def decode(self, rows=None):
+        codes = np.asarray(_rows(self.codes, rows))
+        subspaces = np.arange(self.codebook.shape[0])
+        return self.codebook[subspaces, codes].reshape(len(codes), -1)
+
+    def scores(self, query, rows=None):
+        # Asymmetric distance: one [subspaces, centroids] table of partial dot
+        # products per query, then every row is a sum of table lookups
+        table = np.einsum("scd,sd->sc", self.codebook, query.reshape(self.codebook.shape[0], -1))
+        codes = _rows(self.codes, rows)
+        subspaces = np.arange(self.codebook.shape[0])
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+            chunk = np.asarray(codes[start:start + SCORE_CHUNK_ROWS])
+            scores[start:start + SCORE_CHUNK_ROWS] = table[subspaces, chunk].sum(axis=1)
+        return scores
+
+    def save(self, prefix):
+        _save_files(prefix, {".npy": self.codes, ".codebook.npy": self.codebook})
+
+
+def train_pq_codebook(matrix, subspaces=PQ_SUBSPACES, centroids=PQ_CENTROIDS, iterations=PQ_ITERATIONS, seed=0):
+    """
+    Learns PQ centroids with k-means per subspace on up to PQ_TRAIN_ROWS rows.
+
+    Returns:
+        numpy.ndarray: float32 [subspaces, centroids, dimension / subspaces].
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.shape[1] % subspaces:
+        raise ValueError(f"Dimension {matrix.shape[1]} is not divisible by {subspaces} subspaces")
+
+    rng = np.random.default_rng(seed)
+    if len(matrix) > PQ_TRAIN_ROWS:
+        matrix = matrix[rng.choice(len(matrix), PQ_TRAIN_ROWS, replace=False)]
+    parts = matrix.reshape(len(matrix), subspaces, -1).transpose(1, 0, 2)
+    centroids = min(centroids, len(matrix))
+
+    codebook = np.empty((subspaces, centroids, parts.shape[2]), dtype=np.float32)
+    for s, part in enumerate(parts):
+        centers = part[rng.choice(len(part), centroids, replace=False)]
+        for _ in range(iterations):
+            assignment = _nearest(part, centers)
+            # Cluster sums as a one-hot matrix product, far faster than np.add.at
+            one_hot = np.zeros((len(part), centroids), dtype=np.float32)
+            one_hot[np.arange(len(part)), assignment] = 1
+            sums = one_hot.T @ part
+            counts = one_hot.sum(axis=0)[:, None]
+            # Empty clusters keep their previous centroid
+            centers = np.where(counts > 0, sums / np.maximum(counts, 1), centers)
+        codebook[s] = centers
+    return codebook
+
+
+def _nearest(part, centers):
+    # argmin of squared distance, without the constant |part|^2 term
+    distances = (centers ** 2).sum(axis=1)[None, :] - 2 * part @ centers.T
+    return distances.argmin(axis=1)
+
+
+def encode(matrix, encoding, codebook=None):
+    """
+    Compresses an L2-normalized float32 matrix.
+
+    Args:
+        matrix (numpy.ndarray): [N, dimension] rows.
+        encoding (str): One of EMBEDDING_ENCODINGS.
+        codebook (numpy.ndarray): Trained PQ codebook, learned from `matrix`
+            when None.
+
+    Returns:
+        CompactMatrix
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if encoding == "float32":
+        return Float32Matrix(matrix)
+    if encoding == "float16":
+        return Float16Matrix(matrix.astype(np.float16))
+    if encoding == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127 if len(matrix) else np.empty(0, dtype=np.float32)
+        scales = np.where(scales == 0, 1, scales).astype(np.float32)
+        codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        return Int8Matrix(codes, scales)
+    if encoding == "pq":
+        codebook = train_pq_codebook(matrix) if codebook is None else codebook
+        parts = matrix.reshape(len(matrix), codebook.shape[0], -1)
+        codes = np.stack([_nearest(parts[:, s], codebook[s]) for s in range(codebook.shape[0])], axis=1)
+        return PQMatrix(codes.astype(np.uint8), codebook)
+    raise ValueError(f"Unknown embedding encoding '{encoding}', expected one of {', '.join(EMBEDDING_ENCODINGS)}")
+
+
+def load(prefix, mmap=True):
+    """Opens a matrix written by `CompactMatrix.save`, memory-mapped by default."""
+    mode = "r" if mmap else None
+    values = np.load(prefix + ".npy", mmap_mode=mode)
+    if os.path.exists(prefix + ".scales.npy"):
+        return Int8Matrix(values, np.load(prefix + ".scales.npy", mmap_mode=mode))
+    if os.path.exists(prefix + ".codebook.npy"):
+        return PQMatrix(values, np.load(prefix + ".codebook.npy"))
+    if values.dtype == np.float16:
+        return Float16Matrix(values)
+    return Float32Matrix(values)
+
+
+def concatenate(matrices, encoding, codebook=None):
+    """Merges matrices, re-encoding them to `encoding`."""
+    return encode(np.concatenate([matrix.decode() for matrix in matrices]), encoding, codebook)
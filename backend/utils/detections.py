@@ -0,0 +1,201 @@
+import numpy as np
+from PIL import ImageDraw
+from database.database import get_connection
+from utils import metrics
+from utils.model_registry import DETECTION_STORE_THRESHOLD
+
+'''
+Raw Faster R-CNN detections, kept so new features (counting items, drawing
+boxes, a different score threshold) never need inference to run again.
+
+Every instance scoring at least DETECTION_STORE_THRESHOLD is stored, which is
+below the threshold used for labels and regions, so the threshold can later
+be lowered as well as raised. Detections are packed per photo into three
+arrays in the `image_detections` table, keyed by content hash like the
+inference cache:
+
+  boxes    float32 [N, 4]  x1, y1, x2, y2 normalized to [0, 1]
+  scores   float32 [N]
+  classes  int16   [N]     COCO class index
+
+which is ~26 bytes per detection instead of one table row each.
+'''
+
+# Overlay colours, picked by class index so a label keeps its colour across photos
+OVERLAY_COLORS = ["#e6194b", "#3cb44b", "#4363d8", "#f58231", "#911eb4", "#42d4f4", "#f032e6", "#bfef45", "#fabed4", "#469990"]
+
+
+def pack_detections(instances, width, height):
+    """
+    Converts a Detectron2 `Instances` object into compact arrays.
+
+    Returns:
+        dict: "boxes", "scores" and "classes" numpy arrays.
+    """
+    boxes = instances.pred_boxes.tensor.numpy().astype(np.float32)
+    if len(boxes):
+        boxes = boxes / np.array([width, height, width, height], dtype=np.float32)
+    return {
+        "boxes": boxes.reshape(-1, 4).clip(0, 1),
+        "scores": instances.scores.numpy().astype(np.float32),
+        "classes": instances.pred_classes.numpy().astype(np.int16),
+    }
+
+
+def put_detections(entries):
+    """
+    Stores packed detections.
+
+    Args:
+        entries (list of tuple): (content_hash, detections) pairs.
+    """
+    if not entries:
+        return
+
+    conn = get_connection()
+    cursor = None
+
+    try:
+        query = """
+            INSERT INTO image_detections (content_hash, boxes, scores, classes, score_threshold)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (content_hash) DO NOTHING
+        """
+        cursor = conn.cursor()
+        cursor.executemany(query, [
+            (
+                content_hash,
+                detections["boxes"].astype(np.float32).tobytes(),
+                detections["scores"].astype(np.float32).tobytes(),
+                detections["classes"].astype(np.int16).tobytes(),
+                DETECTION_STORE_THRESHOLD,
+            )
+            for content_hash, detections in entries
+        ])
+        conn.commit()
+        metrics.increment("detections.stored", len(entries))
+
+    except Exception as e:
+        print("Error storing detections:", e)
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def _detections_from_row(row):
+    return {
+        "boxes": np.frombuffer(bytes(row["boxes"]), dtype=np.float32).reshape(-1, 4),
+        "scores": np.frombuffer(bytes(row["scores"]), dtype=np.float32),
+        "classes": np.frombuffer(bytes(row["classes"]), dtype=np.int16),
+        "score_threshold": row["score_threshold"],
+    }
+
+
+def get_detections(content_hash):
+    """Returns the packed detections of a photo, or None if none were stored."""
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT boxes, scores, classes, score_threshold
+            FROM image_detections
+            WHERE content_hash = %s
+        """, (content_hash,))
+        row = cursor.fetchone()
+        return _detections_from_row(row) if row else None
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def get_user_detections(user_id):
+    """
+    Yields (image_id, detections) for every photo of a user that has stored
+    detections. Rows are streamed with a server-side cursor.
+    """
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor(name="user_detections")
+        cursor.itersize = 500
+        cursor.execute("""
+            SELECT i.image_id, d.boxes, d.scores, d.classes, d.score_threshold
+            FROM images i
+            JOIN image_detections d ON d.content_hash = i.content_hash
+            WHERE i.user_id = %s
+        """, (user_id,))
+        for row in cursor:
+            yield row["image_id"], _detections_from_row(row)
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def filter_detections(detections, coco_classes, min_score=None, labels=None):
+    """
+    Re-filters stored detections by score and class.
+
+    Args:
+        detections (dict): Packed arrays from `get_detections`.
+        coco_classes (list of str): Class names, indexed by class id.
+        min_score (float): Lowest score kept, None to keep everything stored.
+        labels (iterable of str): Class names to keep, None for all.
+
+    Returns:
+        list of dict: "label", "score" and "box" per detection, highest score first.
+    """
+    keep = np.ones(len(detections["scores"]), dtype=bool)
+    if min_score is not None:
+        keep &= detections["scores"] >= min_score
+    if labels:
+        wanted = [i for i, name in enumerate(coco_classes) if name in set(labels)]
+        keep &= np.isin(detections["classes"], wanted)
+
+    indices = np.flatnonzero(keep)
+    indices = indices[np.argsort(-detections["scores"][indices], kind="stable")]
+    return [
+        {
+            "label": coco_classes[detections["classes"][i]],
+            "score": round(float(detections["scores"][i]), 4),
+            "box": [round(float(value), 4) for value in detections["boxes"][i]],
+        }
+        for i in indices
+        if detections["classes"][i] < len(coco_classes)
+    ]
+
+
+def count_labels(filtered):
+    counts = {}
+    for detection in filtered:
+        counts[detection["label"]] = counts.get(detection["label"], 0) + 1
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+
+def draw_overlay(image, filtered, coco_classes):
+    """Draws boxes and labels of filtered detections on a copy of an RGB PIL image."""
+    image = image.copy()
+    draw = ImageDraw.Draw(image)
+    width, height = image.size
+    line_width = max(2, round(max(width, height) / 400))
+    for detection in filtered:
+        x1, y1, x2, y2 = detection["box"]
+        color = OVERLAY_COLORS[coco_classes.index(detection["label"]) % len(OVERLAY_COLORS)]
+        box = (x1 * width, y1 * height, x2 * width, y2 * height)
+        draw.rectangle(box, outline=color, width=line_width)
+        caption = f"{detection['label']} {detection['score']:.2f}"
+        text_box = draw.textbbox((box[0], box[1]), caption)
+        draw.rectangle(text_box, fill=color)
+        draw.text((box[0], box[1]), caption, fill="white")
+    return image
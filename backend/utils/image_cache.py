@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import numpy as np
+from dotenv import load_dotenv
+from database.database import get_connection
+from utils import metrics
+from utils.lru_cache import LRUCache
+from utils.model_registry import CLIP_MODEL_NAME
+
+load_dotenv()
+
+'''
+Content-addressed cache of inference results (detection labels, the CLIP
+image embedding and the per-object region embeddings).
+
+Photos are keyed by the SHA-256 of their raw bytes. Inference results are
+persisted in the `image_inference_cache` table with an in-memory LRU in front,
+so a re-uploaded photo skips Faster R-CNN and CLIP entirely. Separately,
+`images.content_hash` lets an upload that a user already stored reuse the
+existing image_id (and its vector) instead of inserting another row.
+
+Rows record the CLIP checkpoint of their embeddings (`clip_model`); rows of
+another checkpoint are misses and get overwritten, so changing CLIP_MODEL_NAME
+never serves stale embeddings.
+'''
+
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", 1024))
+
+_memory_cache = LRUCache("image_cache.memory", maxsize=IMAGE_CACHE_SIZE)
+
+
+def image_content_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def find_user_images(user_id, content_hashes):
+    """
+    Looks up photos the user has already stored.
+
+    Returns:
+        dict: content_hash -> row with "image_id", "filename" and "items".
+    """
+    if not content_hashes:
+        return {}
+
+    conn = get_connection()
+    cursor = None
+
+    try:
+        query = """
+            SELECT DISTINCT ON (content_hash) content_hash, image_id, filename, items
+            FROM images
+            WHERE user_id = %s AND content_hash = ANY(%s)
+            ORDER BY content_hash, image_id
+        """
+        cursor = conn.cursor()
+        cursor.execute(query, (user_id, list(content_hashes)))
+        existing = {row["content_hash"]: row for row in cursor.fetchall()}
+
+    except Exception as e:
+        print("Error looking up existing images:", e)
+        existing = {}
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+    if existing:
+        metrics.increment("image_cache.duplicate_upload", len(existing))
+    return existing
+
+
+def get_cached_inferences(content_hashes):
+    """
+    Returns cached inference results, checking the LRU before Postgres.
+
+    Returns:
+        dict: content_hash -> {"labels", "embedding", "regions"} for every cache hit.
+    """
+    found = {}
+    missing = []
+    for content_hash in content_hashes:
+        cached = _memory_cache.get(content_hash)
+        if cached is not None:
+            found[content_hash] = cached
+        else:
+            missing.append(content_hash)
+
+    if not missing:
+        return found
+
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT content_hash, items, embedding, regions, region_embeddings
+            FROM image_inference_cache
+            WHERE content_hash = ANY(%s) AND clip_model = %s
+        """, (missing, CLIP_MODEL_NAME))
+        for row in cursor.fetchall():
+            inference = _inference_from_row(row)
+            found[row["content_hash"]] = inference
+            _memory_cache.put(row["content_hash"], inference)
+
+    except Exception as e:
+        print("Error reading image inference cache:", e)
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+    hits = sum(1 for content_hash in missing if content_hash in found)
+    metrics.increment("image_cache.db.hit", hits)
+    metrics.increment("image_cache.db.miss", len(missing) - hits)
+    return found
+
+
+def _inference_from_row(row):
+    labels = [item.strip() for item in row["items"].split(",") if item.strip()] if row["items"] else []
+    regions = [dict(region) for region in (row["regions"] or [])]
+    if regions:
+        region_embeddings = np.frombuffer(bytes(row["region_embeddings"]), dtype=np.float32).reshape(len(regions), -1)
+        for region, embedding in zip(regions, region_embeddings):
+            region["embedding"] = embedding
+    return {
+        "labels": labels,
+        "embedding": np.frombuffer(bytes(row["embedding"]), dtype=np.float32),
+        "regions": regions,
+    }
+
+
+def put_cached_inferences(entries):
+    """
+    Stores inference results.
+
+    Args:
+        entries (list of tuple): (content_hash, inference) pairs, where inference
+            is a dict with "labels", "embedding" and "regions".
+    """
+    if not entries:
+        return
+
+    for content_hash, inference in entries:
+        _memory_cache.put(content_hash, inference)
+
+    conn = get_connection()
+    cursor = None
+
+    try:
+        query = """
+            INSERT INTO image_inference_cache (content_hash, items, embedding, regions, region_embeddings, clip_model)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (content_hash) DO UPDATE
+            SET items = EXCLUDED.items, embedding = EXCLUDED.embedding, regions = EXCLUDED.regions,
+                region_embeddings = EXCLUDED.region_embeddings, clip_model = EXCLUDED.clip_model, created_at = NOW()
+            WHERE image_inference_cache.clip_model IS DISTINCT FROM EXCLUDED.clip_model
+        """
+        cursor = conn.cursor()
+        cursor.executemany(query, [
+            (
+                content_hash,
+                ", ".join(inference["labels"]),
+                np.asarray(inference["embedding"], dtype=np.float32).tobytes(),
+                json.dumps([{key: value for key, value in region.items() if key != "embedding"} for region in inference["regions"]]),
+                np.asarray([region["embedding"] for region in inference["regions"]], dtype=np.float32).tobytes(),
+                CLIP_MODEL_NAME,
+            )
+            for content_hash, inference in entries
+        ])
+        conn.commit()
+
+    except Exception as e:
+        print("Error writing image inference cache:", e)
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def get_cache_stats():
+    """Hit/miss counters for the memory and Postgres levels."""
+    counters = metrics.snapshot()["counters"]
+    return {
+        name: value for name, value in counters.items()
+        if name.startswith("image_cache.")
+    }
@@ -0,0 +1,120 @@
+import os
+import tempfile
+from io import BytesIO
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+from utils import metrics
+from utils.lru_cache import LRUCache
+
+load_dotenv()
+
+'''
+Resized derivatives of stored photos for /get_image.
+
+Derivatives come in a fixed set of widths, are generated once and cached on
+disk (plus a small in-memory LRU), and are keyed by the photo's content hash,
+so a cached derivative never goes stale and the ETag can be computed without
+touching the image bytes.
+'''
+
+THUMBNAIL_WIDTHS = (128, 256, 512, 1024)
+DERIVATIVE_CACHE_DIR = os.getenv("DERIVATIVE_CACHE_DIR", "image_derivatives")
+DERIVATIVE_QUALITY = 85
+
+_memory_cache = LRUCache("image_derivatives.memory", maxsize=int(os.getenv("DERIVATIVE_MEMORY_CACHE_SIZE", 256)))
+
+
+def pick_width(requested):
+    """Snaps a requested width to the smallest derivative at least that wide (None = original)."""
+    if not requested:
+        return None
+    for width in THUMBNAIL_WIDTHS:
+        if width >= requested:
+            return width
+    return THUMBNAIL_WIDTHS[-1]
+
+
+def make_etag(content_hash, width):
+    return f'"{content_hash}-{width or "orig"}"'
+
+
+def etag_matches(if_none_match, etag):
+    """True when an If-None-Match header value matches `etag` (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def sniff_media_type(image_bytes):
+    """Media type from the first bytes of an image (32 are enough for the common formats)."""
+    if image_bytes[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if image_bytes[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if image_bytes[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    try:
+        image = Image.open(BytesIO(image_bytes))
+        return Image.MIME.get(image.format, "application/octet-stream")
+    except Exception:
+        return "application/octet-stream"
+
+
+def render_derivative(image_bytes, width):
+    """Decodes (in JPEG draft mode when possible), orients and resizes a photo to `width`, as JPEG bytes."""
+    image = Image.open(BytesIO(image_bytes))
+    if image.format == "JPEG":
+        image.draft("RGB", (width, width))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.LANCZOS)
+
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=DERIVATIVE_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def _derivative_path(content_hash, width):
+    return os.path.join(DERIVATIVE_CACHE_DIR, content_hash[:2], f"{content_hash}_{width}.jpg")
+
+
+def get_derivative(content_hash, width, load_original):
+    """
+    Returns the JPEG derivative of a photo, generating and caching it on first use.
+
+    Args:
+        content_hash (str): SHA-256 of the original photo.
+        width (int): One of THUMBNAIL_WIDTHS.
+        load_original (callable): Returns the original bytes, only called on a cache miss.
+    """
+    key = (content_hash, width)
+    cached = _memory_cache.get(key)
+    if cached is not None:
+        return cached
+
+    path = _derivative_path(content_hash, width)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        metrics.increment("image_derivatives.disk.hit")
+    except FileNotFoundError:
+        metrics.increment("image_derivatives.disk.miss")
+        with metrics.timer("image_derivatives.render"):
+            data = render_derivative(load_original(), width)
+
+        # Write to a temp file and rename so concurrent readers never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    _memory_cache.put(key, data)
+    return data
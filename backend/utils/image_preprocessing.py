@@ -0,0 +1,45 @@
+import os
+from io import BytesIO
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+Decodes uploaded photos once, at the resolution the models actually use.
+
+Faster R-CNN resizes its input to at most 1333px on the long side
+(INPUT.MAX_SIZE_TEST) and CLIP to 224px, so decoding a 48 MP phone photo at
+full size only costs time and memory. JPEGs are decoded in draft mode (libjpeg
+scales by 1/2, 1/4 or 1/8 while decoding), EXIF orientation is applied, and
+the result is downscaled once to IMAGE_MAX_SIDE. Set IMAGE_MAX_SIDE=0 to keep
+the full resolution.
+'''
+
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", 1333))
+
+
+def load_image(image_bytes, max_side=IMAGE_MAX_SIDE):
+    """
+    Decodes image bytes into an upright RGB PIL image no larger than `max_side`.
+
+    Args:
+        image_bytes (bytes): Raw uploaded file.
+        max_side (int): Longest side of the returned image, 0 for no limit.
+
+    Returns:
+        PIL.Image.Image: RGB image.
+    """
+    image = Image.open(BytesIO(image_bytes))
+
+    if max_side and image.format == "JPEG":
+        # Picks the largest libjpeg scale that still keeps both sides >= max_side
+        image.draft("RGB", (max_side, max_side))
+
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("RGB")
+
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.BICUBIC)
+
+    return image
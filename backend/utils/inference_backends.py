@@ -0,0 +1,144 @@
+import os
+import torch
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+Alternative CPU inference backends for CLIP and Faster R-CNN.
+
+  eager  fp32 PyTorch, the reference
+  int8   PyTorch with dynamic int8 quantization of every nn.Linear (CLIP's
+         transformer layers, the Faster R-CNN box head)
+  onnx   CLIP only: image and text towers exported to ONNX and run with
+         ONNX Runtime (export with `python -m scripts.export_models export`)
+
+The backend is picked with CLIP_BACKEND / DETECTRON_BACKEND and every backend
+exposes the same interface as the eager model, so callers do not change.
+scripts/export_models.py checks each backend against the eager models.
+'''
+
+CLIP_BACKENDS = ("eager", "int8", "onnx")
+DETECTRON_BACKENDS = ("eager", "int8")
+ONNX_EXPORT_DIR = os.getenv("ONNX_EXPORT_DIR", "model_exports")
+ONNX_OPSET = 17
+
+
+def quantize_int8(module):
+    """Dynamic int8 quantization of the Linear layers, weights are quantized once up front."""
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class _ClipImageTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+class _ClipTextTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+def onnx_paths(export_dir=ONNX_EXPORT_DIR):
+    return os.path.join(export_dir, "clip_image.onnx"), os.path.join(export_dir, "clip_text.onnx")
+
+
+def export_clip_onnx(model, processor, export_dir=ONNX_EXPORT_DIR):
+    """Exports the CLIP image and text towers with dynamic batch / sequence axes."""
+    from PIL import Image
+
+    os.makedirs(export_dir, exist_ok=True)
+    image_path, text_path = onnx_paths(export_dir)
+
+    image_inputs = processor(images=[Image.new("RGB", (224, 224))], return_tensors="pt")
+    text_inputs = processor(text=["a photo of a guitar"], return_tensors="pt", padding=True)
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _ClipImageTower(model).eval(),
+            (image_inputs["pixel_values"],),
+            image_path,
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=ONNX_OPSET,
+        )
+        torch.onnx.export(
+            _ClipTextTower(model).eval(),
+            (text_inputs["input_ids"], text_inputs["attention_mask"]),
+            text_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["text_embeds"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "text_embeds": {0: "batch"},
+            },
+            opset_version=ONNX_OPSET,
+        )
+    return image_path, text_path
+
+
+class OnnxClipModel:
+    """ONNX Runtime stand-in for CLIPModel's get_image_features / get_text_features."""
+
+    def __init__(self, export_dir=ONNX_EXPORT_DIR, num_threads=None):
+        import onnxruntime as ort
+
+        image_path, text_path = onnx_paths(export_dir)
+        if not (os.path.exists(image_path) and os.path.exists(text_path)):
+            raise FileNotFoundError(
+                f"ONNX exports not found in {export_dir}, run `python -m scripts.export_models export` first."
+            )
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        providers = ["CPUExecutionProvider"]
+        self.image_session = ort.InferenceSession(image_path, options, providers=providers)
+        self.text_session = ort.InferenceSession(text_path, options, providers=providers)
+        self.memory_bytes = os.path.getsize(image_path) + os.path.getsize(text_path)
+
+    def eval(self):
+        return self
+
+    def get_image_features(self, pixel_values, **kwargs):
+        (embeds,) = self.image_session.run(None, {"pixel_values": pixel_values.cpu().numpy()})
+        return torch.from_numpy(embeds)
+
+    def get_text_features(self, input_ids, attention_mask=None, **kwargs):
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        (embeds,) = self.text_session.run(None, {
+            "input_ids": input_ids.cpu().numpy().astype("int64"),
+            "attention_mask": attention_mask.cpu().numpy().astype("int64"),
+        })
+        return torch.from_numpy(embeds)
+
+
+def build_clip_model(model, backend, num_threads=None):
+    """Wraps an eager CLIPModel in the requested backend."""
+    if backend not in CLIP_BACKENDS:
+        raise ValueError(f"Unknown CLIP backend '{backend}', expected one of {CLIP_BACKENDS}")
+    if backend == "int8":
+        return quantize_int8(model)
+    if backend == "onnx":
+        return OnnxClipModel(num_threads=num_threads)
+    return model
+
+
+def build_predictor(predictor, backend):
+    """Applies the requested backend to a Detectron2 DefaultPredictor in place."""
+    if backend not in DETECTRON_BACKENDS:
+        raise ValueError(f"Unknown Detectron2 backend '{backend}', expected one of {DETECTRON_BACKENDS}")
+    if backend == "int8":
+        predictor.model = quantize_int8(predictor.model)
+    return predictor
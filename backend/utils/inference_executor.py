@@ -0,0 +1,100 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import torch
+from fastapi import HTTPException
+from dotenv import load_dotenv
+from utils import metrics
+
+load_dotenv()
+
+'''
+Runs Detectron2 / CLIP inference off the event loop.
+
+Models are shared module globals, so a thread pool is used instead of a
+process pool: PyTorch releases the GIL inside its kernels, and pinning the
+intra-op thread count keeps concurrent jobs from oversubscribing the CPU.
+Submissions beyond the queue limit are rejected with a 503 so uploads cannot
+pile up unbounded work behind light endpoints.
+'''
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 1))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", 16))
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", max(1, (os.cpu_count() or 1) // INFERENCE_WORKERS)))
+
+_executor = None
+_executor_lock = threading.Lock()
+_state_lock = threading.Lock()
+_queued = 0
+_running = 0
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            torch.set_num_threads(TORCH_NUM_THREADS)
+            _executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+    return _executor
+
+
+def queue_depth():
+    with _state_lock:
+        return _queued
+
+
+def running_jobs():
+    with _state_lock:
+        return _running
+
+
+metrics.register_gauge("inference.queue_depth", queue_depth)
+metrics.register_gauge("inference.running", running_jobs)
+
+
+def _run(fn, args, kwargs, submitted_at):
+    global _queued, _running
+    with _state_lock:
+        _queued -= 1
+        _running += 1
+    metrics.observe("inference.queue_wait", time.perf_counter() - submitted_at)
+
+    try:
+        with metrics.timer("inference.run"):
+            return fn(*args, **kwargs)
+    except Exception:
+        metrics.increment("inference.failed")
+        raise
+    finally:
+        with _state_lock:
+            _running -= 1
+
+
+async def submit_inference(fn, *args, **kwargs):
+    """
+    Runs `fn(*args, **kwargs)` in the inference pool and awaits its result.
+
+    Raises:
+        HTTPException: 503 when INFERENCE_QUEUE_SIZE jobs are already waiting.
+    """
+    global _queued
+    with _state_lock:
+        if _queued >= INFERENCE_QUEUE_SIZE:
+            metrics.increment("inference.rejected")
+            raise HTTPException(status_code=503, detail="Inference queue is full, please retry shortly.", headers={"Retry-After": "5"})
+        _queued += 1
+
+    metrics.increment("inference.submitted")
+    future = get_executor().submit(_run, fn, args, kwargs, time.perf_counter())
+    future.add_done_callback(_release_if_cancelled)
+    return await asyncio.wrap_future(future)
+
+
+def _release_if_cancelled(future):
+    # A job cancelled before it started never reaches _run, so free its queue slot here
+    global _queued
+    if future.cancelled():
+        with _state_lock:
+            _queued -= 1
@@ -0,0 +1,232 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+from utils import metrics
+
+load_dotenv()
+
+'''
+Durable local job queue for ingestion work, backed by SQLite.
+
+Upload endpoints enqueue a job and return its id straight away; worker
+processes (scripts/run_job_worker.py, or threads inside the API when
+JOB_WORKERS_IN_PROCESS=1) claim jobs and run them. Claiming takes a lease, so a
+job whose worker died is picked up again once the lease expires, up to
+JOB_MAX_ATTEMPTS. Jobs are deduplicated by idempotency key while queued or
+running, and handlers can checkpoint expensive stages so a retried job
+resumes where it stopped.
+'''
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 600))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+class LeaseLostError(RuntimeError):
+    pass
+
+
+def _connect():
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(JOB_DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        _local.conn = conn
+
+    with _schema_lock:
+        if not _schema_ready:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    idempotency_key TEXT UNIQUE,
+                    status TEXT NOT NULL,           -- queued, running, succeeded, failed
+                    stages TEXT NOT NULL,           -- JSON: stage -> {"status", "done", "total"}
+                    payload TEXT NOT NULL,          -- JSON
+                    checkpoint TEXT NOT NULL,       -- JSON, written by handlers to resume retries
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    lease_expires_at REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status, created_at)")
+            _schema_ready = True
+    return conn
+
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    for key in ("stages", "payload", "checkpoint", "result"):
+        job[key] = json.loads(job[key]) if job[key] else None
+    return job
+
+
+def enqueue(kind, payload, idempotency_key=None):
+    """
+    Adds a job unless one with the same idempotency key is queued or running.
+    A failed job with that key is requeued, resuming from its checkpoint; a
+    succeeded one gives up the key to a new job, so the same upload can be
+    ingested again (e.g. after its data was deleted).
+
+    Returns:
+        tuple: (job, created) where created is False for a repeated request
+        answered with a job in progress.
+    """
+    conn = _connect()
+    now = time.time()
+    job_id = uuid.uuid4().hex
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = None
+        if idempotency_key is not None:
+            row = conn.execute("SELECT job_id, status FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+        if row is not None and row["status"] in ("queued", "running"):
+            conn.execute("COMMIT")
+            metrics.increment(f"jobs.{kind}.deduplicated")
+            return get_job(row["job_id"]), False
+
+        if row is not None and row["status"] == "failed":
+            conn.execute("""
+                UPDATE jobs
+                SET status = 'queued', attempts = 0, worker_id = NULL, lease_expires_at = NULL, updated_at = ?
+                WHERE job_id = ?
+            """, (now, row["job_id"]))
+            conn.execute("COMMIT")
+            metrics.increment(f"jobs.{kind}.requeued")
+            return get_job(row["job_id"]), True
+
+        if row is not None:
+            conn.execute("UPDATE jobs SET idempotency_key = NULL WHERE job_id = ?", (row["job_id"],))
+        conn.execute("""
+            INSERT INTO jobs (job_id, kind, idempotency_key, status, stages, payload, checkpoint, created_at, updated_at)
+            VALUES (?, ?, ?, 'queued', '{}', ?, '{}', ?, ?)
+        """, (job_id, kind, idempotency_key, json.dumps(payload), now, now))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    metrics.increment(f"jobs.{kind}.enqueued")
+    return get_job(job_id), True
+
+
+def get_job(job_id):
+    row = _connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return _row_to_job(row)
+
+
+def claim_job(worker_id):
+    """
+    Atomically takes the oldest queued job, or a running job whose lease
+    expired, and marks it running for `worker_id`.
+    """
+    conn = _connect()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("""
+            SELECT job_id FROM jobs
+            WHERE (status = 'queued' OR (status = 'running' AND lease_expires_at < ?))
+              AND attempts < ?
+            ORDER BY created_at
+            LIMIT 1
+        """, (now, JOB_MAX_ATTEMPTS)).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute("""
+            UPDATE jobs
+            SET status = 'running', attempts = attempts + 1, worker_id = ?, lease_expires_at = ?, updated_at = ?
+            WHERE job_id = ?
+        """, (worker_id, now + JOB_LEASE_SECONDS, now, row["job_id"]))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return get_job(row["job_id"])
+
+
+def fail_exhausted_jobs():
+    """Marks jobs that ran out of attempts after their last lease expired as failed."""
+    _connect().execute("""
+        UPDATE jobs SET status = 'failed', error = COALESCE(error, 'Worker lease expired'), updated_at = ?
+        WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?
+    """, (time.time(), time.time(), JOB_MAX_ATTEMPTS))
+
+
+def _update(job_id, worker_id, **fields):
+    """
+    Updates a running job as long as `worker_id` still holds its lease.
+    Returns False when the lease expired and another worker claimed the job.
+    """
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    cursor = _connect().execute(
+        f"UPDATE jobs SET {assignments} WHERE job_id = ? AND worker_id = ? AND status = 'running'",
+        (*fields.values(), job_id, worker_id),
+    )
+    return cursor.rowcount > 0
+
+
+def complete(job_id, worker_id, result):
+    """Records the result; returns False when the worker had lost the job."""
+    return _update(job_id, worker_id, status="succeeded", result=json.dumps(result), error=None, lease_expires_at=None)
+
+
+def fail(job_id, worker_id, error, attempts):
+    """
+    Requeues the job while it has attempts left, otherwise marks it failed.
+    Returns the new status, or None when the worker had lost the job.
+    """
+    status = "queued" if attempts < JOB_MAX_ATTEMPTS else "failed"
+    return status if _update(job_id, worker_id, status=status, error=str(error), lease_expires_at=None) else None
+
+
+class JobContext:
+    """
+    Handed to job handlers to report per-stage progress and checkpoint
+    intermediate results. Every update also renews the worker's lease, and
+    raises LeaseLostError once the job was claimed by another worker.
+    """
+
+    def __init__(self, job):
+        self.job_id = job["job_id"]
+        self.worker_id = job["worker_id"]
+        self.attempts = job["attempts"]
+        self.stages = job["stages"] or {}
+        self.checkpoint = job["checkpoint"] or {}
+
+    def progress(self, stage, status="running", done=None, total=None, **details):
+        # details: extra per-stage figures, e.g. throughput
+        self.stages[stage] = {"status": status, "done": done, "total": total, **details}
+        self._renew(stages=json.dumps(self.stages))
+
+    def save_checkpoint(self, **values):
+        self.checkpoint.update(values)
+        self._renew(checkpoint=json.dumps(self.checkpoint))
+
+    def _renew(self, **fields):
+        if not _update(self.job_id, self.worker_id, lease_expires_at=time.time() + JOB_LEASE_SECONDS, **fields):
+            # Another worker runs the job now; stop instead of racing it
+            raise LeaseLostError(f"Job {self.job_id} was claimed by another worker")
+
+
+def report_progress(job, stage, status="running", done=None, total=None, **details):
+    """Progress helper for pipelines that run both inside and outside a job."""
+    if job is not None:
+        job.progress(stage, status, done, total, **details)
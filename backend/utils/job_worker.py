@@ -0,0 +1,153 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from dotenv import load_dotenv
+from utils import job_queue, metrics
+from utils.blob_store import get_blob_store
+
+load_dotenv()
+
+'''
+Runs queued ingestion jobs (see utils/job_queue.py).
+
+Each worker thread claims one job at a time, runs the handler registered for
+its kind and records the result. A handler that raises is retried by the next
+claim while attempts remain; because jobs checkpoint their stages the retry
+skips work that already succeeded.
+'''
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", 1))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 1.0))
+# How often vectors whose upsert failed are re-sent (utils/bulk_upsert.py), 0 to disable
+VECTOR_RECONCILE_SECONDS = float(os.getenv("VECTOR_RECONCILE_SECONDS", 300))
+
+
+def run_detect_objects(job, payload):
+    # Imported here so the worker only loads the controllers it runs
+    from controllers.detectron2 import ingest_images
+
+    store = get_blob_store()
+    uploads = [(upload["filename"], store.read(upload["blob_key"])) for upload in payload["uploads"]]
+    results = asyncio.run(ingest_images(payload["user_id"], uploads, job=job))
+    return {"results": [{key: value for key, value in result.items() if key != "vectors"} for result in results]}
+
+
+def run_detect_objects_video(job, payload):
+    from controllers.detectron2 import ingest_video
+
+    video_bytes = get_blob_store().read(payload["blob_key"])
+    return asyncio.run(ingest_video(payload["user_id"], payload["filename"], video_bytes, job=job))
+
+
+def run_process_chatlog(job, payload):
+    from controllers.chatLogProcessing import process_chatlog_content
+
+    chatlog_content = get_blob_store().read(payload["blob_key"]).decode("utf-8")
+    dict_item_context = process_chatlog_content(payload["user_id"], payload["filename"], chatlog_content, job=job)
+    return {
+        "items": dict_item_context["items"],
+        "context": dict_item_context["context"],
+        "messages": dict_item_context["messages"],
+    }
+
+
+def run_reembed(job, payload):
+    from utils.reembed import run_reembed as reembed
+
+    return reembed(job=job, cutover=payload.get("cutover", True))
+
+
+HANDLERS = {
+    "detect_objects": run_detect_objects,
+    "detect_objects_video": run_detect_objects_video,
+    "process_chatlog": run_process_chatlog,
+    "reembed": run_reembed,
+}
+
+
+def run_one(worker_id):
+    """Claims and runs a single job. Returns False when the queue is empty."""
+    job = job_queue.claim_job(worker_id)
+    if job is None:
+        return False
+
+    kind = job["kind"]
+    context = job_queue.JobContext(job)
+    try:
+        with metrics.timer(f"jobs.{kind}.run"):
+            result = HANDLERS[kind](context, job["payload"])
+    except Exception as e:
+        traceback.print_exc()
+        status = job_queue.fail(job["job_id"], worker_id, e, job["attempts"])
+        if status is None:
+            print(f"Job worker {worker_id} lost the lease on job {job['job_id']}, leaving it to its new worker")
+            metrics.increment(f"jobs.{kind}.lease_lost")
+        else:
+            metrics.increment(f"jobs.{kind}.{'retried' if status == 'queued' else 'failed'}")
+        return True
+
+    if job_queue.complete(job["job_id"], worker_id, result):
+        metrics.increment(f"jobs.{kind}.succeeded")
+    else:
+        print(f"Job worker {worker_id} lost the lease on job {job['job_id']}, dropping its result")
+        metrics.increment(f"jobs.{kind}.lease_lost")
+    return True
+
+
+def worker_loop(worker_id, stop_event):
+    while not stop_event.is_set():
+        try:
+            job_queue.fail_exhausted_jobs()
+            if not run_one(worker_id):
+                stop_event.wait(JOB_POLL_SECONDS)
+        except Exception as e:
+            print(f"Job worker {worker_id} error: {e}")
+            stop_event.wait(JOB_POLL_SECONDS)
+
+
+def reconcile_loop(stop_event):
+    from utils.bulk_upsert import retry_failed_upserts
+    from utils.pinecone_db import get_index
+
+    while not stop_event.wait(VECTOR_RECONCILE_SECONDS):
+        try:
+            summary = retry_failed_upserts(get_index())
+            if summary["retried"]:
+                print(f"Vector reconciliation: {summary}")
+        except Exception as e:
+            print(f"Vector reconciliation error: {e}")
+
+
+def start_workers(concurrency=JOB_CONCURRENCY, stop_event=None):
+    """Starts `concurrency` daemon worker threads and returns (threads, stop_event)."""
+    stop_event = stop_event or threading.Event()
+    prefix = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    threads = []
+    for i in range(concurrency):
+        thread = threading.Thread(
+            target=worker_loop, args=(f"{prefix}-{i}", stop_event),
+            name=f"job-worker-{i}", daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+    if VECTOR_RECONCILE_SECONDS > 0:
+        thread = threading.Thread(target=reconcile_loop, args=(stop_event,), name="vector-reconcile", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads, stop_event
+
+
+def run_worker(concurrency=JOB_CONCURRENCY):
+    """Runs workers in the foreground until interrupted."""
+    threads, stop_event = start_workers(concurrency)
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import weakref
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from database.database import get_connection
+from utils import metrics
+from utils.lru_cache import LRUCache
+
+load_dotenv()
+
+'''
+Two-level cache of key-item extractions (controllers/nebius.py).
+
+The extraction runs a small model at temperature 0, so a prompt always gives
+the same key item, yet it is a full LLM round trip before retrieval can
+start. Results are kept in an in-process LRU and in the `key_item_cache`
+table, shared by every worker and kept across restarts. Entries are keyed by
+the normalized prompt (case and whitespace folded), the model and the version
+of the extraction instructions, and expire after KEY_ITEM_CACHE_TTL seconds
+at both levels.
+
+Identical prompts arriving while their extraction is running wait for that
+one call instead of starting their own.
+'''
+
+KEY_ITEM_CACHE_SIZE = int(os.getenv("KEY_ITEM_CACHE_SIZE", 4096))
+KEY_ITEM_CACHE_TTL = int(os.getenv("KEY_ITEM_CACHE_TTL", 7 * 24 * 3600))
+# Expired rows are deleted at most this often per process
+PRUNE_INTERVAL_SECONDS = 3600
+
+_memory_cache = LRUCache("key_item_cache.memory", maxsize=KEY_ITEM_CACHE_SIZE, ttl=KEY_ITEM_CACHE_TTL)
+# Extractions in flight, per event loop (futures belong to the loop that made them)
+_in_flight = weakref.WeakKeyDictionary()
+_stats = {"hits": 0, "lookups": 0}
+_stats_lock = threading.Lock()
+_last_prune = None
+
+
+def hit_rate():
+    """Share of lookups answered without calling the model, from either level or a coalesced call."""
+    with _stats_lock:
+        return round(_stats["hits"] / _stats["lookups"], 4) if _stats["lookups"] else 0.0
+
+
+metrics.register_gauge("key_item_cache.hit_rate", hit_rate)
+
+
+def _count(outcome):
+    metrics.increment(f"key_item_cache.{outcome}")
+    with _stats_lock:
+        _stats["lookups"] += 1
+        if outcome != "miss":
+            _stats["hits"] += 1
+
+
+def normalize_prompt(prompt):
+    return " ".join(prompt.split()).casefold()
+
+
+def cache_key(prompt, model, version):
+    return hashlib.sha256(f"{model}\0{version}\0{normalize_prompt(prompt)}".encode()).hexdigest()
+
+
+def get_persisted(key):
+    conn = None
+    cursor = None
+
+    try:
+        # Connected inside the try: an unreachable database is a miss, not an error
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT key_item FROM key_item_cache
+            WHERE cache_key = %s AND created_at > NOW() - make_interval(secs => %s)
+        """, (key, KEY_ITEM_CACHE_TTL))
+        row = cursor.fetchone()
+        return row["key_item"] if row else None
+
+    except Exception as e:
+        # The cache is an optimization; a database problem means a model call
+        print("Error reading key item cache:", e)
+        return None
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def put_persisted(key, prompt, model, key_item):
+    global _last_prune
+    conn = None
+    cursor = None
+
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO key_item_cache (cache_key, model, prompt, key_item)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (cache_key) DO UPDATE
+            SET key_item = EXCLUDED.key_item, created_at = NOW()
+        """, (key, model, normalize_prompt(prompt), key_item))
+        if _last_prune is None or time.monotonic() - _last_prune > PRUNE_INTERVAL_SECONDS:
+            _last_prune = time.monotonic()
+            cursor.execute(
+                "DELETE FROM key_item_cache WHERE created_at < NOW() - make_interval(secs => %s)",
+                (KEY_ITEM_CACHE_TTL,),
+            )
+        conn.commit()
+
+    except Exception as e:
+        print("Error writing key item cache:", e)
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+async def _load(key, prompt, model, extract):
+    key_item = await run_in_threadpool(get_persisted, key)
+    if key_item is not None:
+        _count("db_hit")
+    else:
+        _count("miss")
+        key_item = await extract(prompt)
+        await run_in_threadpool(put_persisted, key, prompt, model, key_item)
+    _memory_cache.put(key, key_item)
+    return key_item
+
+
+async def cached_key_item(prompt, model, version, extract):
+    """
+    The key item of `prompt`, from the cache or from `await extract(prompt)`.
+
+    Args:
+        prompt (str): User prompt.
+        model (str): Model id `extract` calls.
+        version (str): Version of the extraction instructions; bump it when
+            they change so earlier results are not served.
+        extract: Coroutine function running the extraction. Its exceptions
+            reach every waiting caller and nothing is cached.
+    """
+    key = cache_key(prompt, model, version)
+    key_item = _memory_cache.get(key)
+    if key_item is not None:
+        _count("memory_hit")
+        return key_item
+
+    in_flight = _in_flight.setdefault(asyncio.get_running_loop(), {})
+    task = in_flight.get(key)
+    if task is not None:
+        _count("coalesced")
+    else:
+        task = asyncio.ensure_future(_load(key, prompt, model, extract))
+        in_flight[key] = task
+        task.add_done_callback(lambda _: in_flight.pop(key, None))
+    # Shielded: a caller that goes away must not cancel the call others wait on
+    return await asyncio.shield(task)
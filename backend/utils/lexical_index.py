@@ -0,0 +1,209 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from dotenv import load_dotenv
+from utils import metrics
+
+load_dotenv()
+
+'''
+Local BM25 index over chat messages and image labels, backed by SQLite FTS5.
+
+CLIP text embeddings rank exact item names ("passport", "dog leash") poorly,
+so searches can be fused with a lexical ranking (reciprocal rank fusion), and
+prompts that are plainly an item lookup can be answered from this index alone
+without the LLM key-item extraction or a vector query.
+
+Documents mirror the records written to the vector store: one per message
+vector (item, context and message text) and one per image vector (its labels),
+with the same metadata, so lexical and vector results are interchangeable.
+The index is updated on every ingest; scripts/build_lexical_index.py rebuilds
+it from Postgres.
+'''
+
+LEXICAL_DB_PATH = os.getenv("LEXICAL_DB_PATH", "lexical.db")
+RRF_K = 60
+
+# Words dropped from prompts before deciding whether they are a plain item lookup
+STOPWORDS = {
+    "a", "an", "the", "my", "our", "me", "i", "we", "is", "are", "was", "were", "where", "what", "which",
+    "did", "do", "does", "have", "has", "had", "find", "show", "any", "some", "of", "in", "on", "for",
+    "to", "at", "with", "and", "or", "please", "can", "you", "photo", "photos", "picture", "pictures",
+}
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def _connect():
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(LEXICAL_DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        _local.conn = conn
+
+    with _schema_lock:
+        if not _schema_ready:
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5(
+                    text,
+                    doc_id UNINDEXED,
+                    user_id UNINDEXED,
+                    type UNINDEXED,
+                    metadata UNINDEXED,
+                    tokenize = 'porter unicode61'
+                )
+            """)
+            _schema_ready = True
+    return conn
+
+
+def tokenize(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def document_text(metadata):
+    """Searchable text of a vector record, by type."""
+    if metadata.get("type") == "message":
+        return " ".join(str(metadata.get(field) or "") for field in ("item", "context", "message"))
+    items = metadata.get("items") or []
+    return " ".join(items) if isinstance(items, list) else str(items)
+
+
+def add_documents(vectors):
+    """
+    Indexes message and image vector records, replacing earlier versions of
+    the same ids. Region records are skipped; their labels are already part
+    of the image record.
+    """
+    records = [vector for vector in vectors if vector.get("metadata", {}).get("type") in ("message", "image")]
+    if not records:
+        return
+
+    conn = _connect()
+    conn.execute("BEGIN")
+    try:
+        conn.executemany("DELETE FROM documents WHERE doc_id = ?", [(record["id"],) for record in records])
+        conn.executemany(
+            "INSERT INTO documents (text, doc_id, user_id, type, metadata) VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    document_text(record["metadata"]),
+                    record["id"],
+                    record["metadata"].get("user_id"),
+                    record["metadata"]["type"],
+                    json.dumps(record["metadata"]),
+                )
+                for record in records
+            ],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    metrics.increment("lexical_index.indexed", len(records))
+
+
+def delete_documents(doc_ids=None, user_id=None):
+    conn = _connect()
+    if user_id is not None:
+        conn.execute("DELETE FROM documents WHERE user_id = ?", (user_id,))
+    elif doc_ids:
+        conn.executemany("DELETE FROM documents WHERE doc_id = ?", [(doc_id,) for doc_id in doc_ids])
+
+
+def indexed_doc_ids(user_id=None):
+    """Every doc_id in the index, or those of one user."""
+    conn = _connect()
+    if user_id is not None:
+        rows = conn.execute("SELECT doc_id FROM documents WHERE user_id = ?", (user_id,)).fetchall()
+    else:
+        rows = conn.execute("SELECT doc_id FROM documents").fetchall()
+    return {row["doc_id"] for row in rows}
+
+
+def existing_doc_ids(doc_ids):
+    conn = _connect()
+    found = set()
+    for start in range(0, len(doc_ids), 500):
+        chunk = doc_ids[start:start + 500]
+        rows = conn.execute(
+            f"SELECT doc_id FROM documents WHERE doc_id IN ({','.join('?' * len(chunk))})", chunk
+        ).fetchall()
+        found.update(row["doc_id"] for row in rows)
+    return found
+
+
+def _match_expression(terms, require_all):
+    # Every term is quoted so user text can never be parsed as FTS5 syntax
+    quoted = ['"' + term.replace('"', '""') + '"' for term in terms]
+    return (" AND " if require_all else " OR ").join(quoted)
+
+
+def lexical_search(user_id, text, type, top_k, require_all=False):
+    """
+    BM25 search of the user's documents of `type` ("message" or "image").
+
+    Returns:
+        list of dict: Record metadata plus "bm25_score" (higher is better), best first.
+    """
+    terms = tokenize(text)
+    if not terms:
+        return []
+
+    with metrics.timer("lexical_index.search"):
+        rows = _connect().execute("""
+            SELECT metadata, -bm25(documents) AS score
+            FROM documents
+            WHERE documents MATCH ? AND user_id = ? AND type = ?
+            ORDER BY bm25(documents)
+            LIMIT ?
+        """, (_match_expression(terms, require_all), user_id, type, top_k)).fetchall()
+
+    return [{**json.loads(row["metadata"]), "bm25_score": round(row["score"], 4)} for row in rows]
+
+
+def lookup_terms(prompt, max_terms=3):
+    """
+    The content words of a prompt when it reads as a plain item lookup
+    ("where is my passport", "dog leash"), otherwise None.
+    """
+    terms = [term for term in tokenize(prompt) if term not in STOPWORDS]
+    if not terms or len(terms) > max_terms or len(tokenize(prompt)) > max_terms + 4:
+        return None
+    return terms
+
+
+def result_key(result):
+    """Identity of a search result across the lexical and vector rankings."""
+    if result.get("type") == "message":
+        return ("message", result.get("message_id"))
+    return ("image", result.get("image_id"))
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """
+    Fuses several ranked result lists: each result scores the sum of
+    1 / (k + rank) over the lists it appears in. Metadata of the first list
+    that has a result wins, and scores from the other lists are kept.
+
+    Returns:
+        list of dict: Up to top_k results with an "rrf_score", best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking, start=1):
+            key = result_key(result)
+            entry = fused.setdefault(key, {"result": dict(result), "score": 0.0})
+            for field in ("match_score", "bm25_score"):
+                if field in result:
+                    entry["result"].setdefault(field, result[field])
+            entry["score"] += 1.0 / (k + rank)
+
+    ranked = sorted(fused.values(), key=lambda entry: -entry["score"])[:top_k]
+    return [{**entry["result"], "rrf_score": round(entry["score"], 6)} for entry in ranked]
@@ -0,0 +1,181 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+import httpx
+from fastapi import HTTPException
+from openai import AsyncOpenAI, OpenAI
+from dotenv import load_dotenv
+from utils import metrics
+
+load_dotenv()
+
+'''
+Shared clients for the Nebius (OpenAI-compatible) LLM API.
+
+Request handlers await `chat_completion` / `stream_chat_completion`, which
+use an AsyncOpenAI client, so a worker keeps serving other requests while a
+completion is generated. Code already running in a thread (chat log
+ingestion, the job worker, sync endpoints) uses `chat_completion_sync`.
+
+Both clients keep a pooled, keep-alive HTTP connection to the API
+(LLM_MAX_CONNECTIONS), every call has a timeout (LLM_TIMEOUT unless the
+caller passes a tighter one) and at most LLM_CONCURRENCY calls per process
+are in flight; callers queue for a slot up to LLM_QUEUE_TIMEOUT seconds and
+then get a 503, like inference does (utils/inference_executor.py).
+
+An httpx async pool belongs to the event loop it was first used on, and the
+job worker runs each job in its own loop (asyncio.run), so async clients
+are created per loop.
+'''
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.studio.nebius.ai/v1/")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 200))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 50))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 128))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 10))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+
+_loop_state = weakref.WeakKeyDictionary()
+_sync_client = None
+_sync_lock = threading.Lock()
+# Shared by sync callers across threads; each event loop has its own semaphore
+_sync_slots = threading.BoundedSemaphore(LLM_CONCURRENCY)
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def _limits():
+    return httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS)
+
+
+def _timeout():
+    return httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+def _api_key():
+    return os.environ.get("NEBIUS_API_KEY")
+
+
+def get_async_client():
+    """The AsyncOpenAI client of the running event loop."""
+    loop = asyncio.get_running_loop()
+    state = _loop_state.get(loop)
+    if state is None:
+        state = {
+            "client": AsyncOpenAI(
+                base_url=LLM_BASE_URL,
+                api_key=_api_key(),
+                max_retries=LLM_MAX_RETRIES,
+                http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout()),
+            ),
+            "slots": asyncio.Semaphore(LLM_CONCURRENCY),
+        }
+        _loop_state[loop] = state
+    return state["client"]
+
+
+def get_client():
+    """The OpenAI client for calls made from threads."""
+    global _sync_client
+    with _sync_lock:
+        if _sync_client is None:
+            _sync_client = OpenAI(
+                base_url=LLM_BASE_URL,
+                api_key=_api_key(),
+                max_retries=LLM_MAX_RETRIES,
+                http_client=httpx.Client(limits=_limits(), timeout=_timeout()),
+            )
+    return _sync_client
+
+
+def in_flight():
+    with _in_flight_lock:
+        return _in_flight
+
+
+metrics.register_gauge("llm.in_flight", in_flight)
+
+
+def _track(delta):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += delta
+
+
+def _busy(name):
+    metrics.increment("llm.rejected")
+    raise HTTPException(status_code=503, detail=f"Too many language model requests in flight ({name}), try again shortly.")
+
+
+@asynccontextmanager
+async def _async_slot(name):
+    get_async_client()
+    slots = _loop_state[asyncio.get_running_loop()]["slots"]
+    start = time.perf_counter()
+    if slots.locked():
+        try:
+            await asyncio.wait_for(slots.acquire(), LLM_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            _busy(name)
+    else:
+        await slots.acquire()
+    metrics.observe("llm.queue_wait", time.perf_counter() - start)
+    _track(1)
+    try:
+        yield
+    finally:
+        _track(-1)
+        slots.release()
+
+
+@contextmanager
+def _sync_slot(name):
+    start = time.perf_counter()
+    if not _sync_slots.acquire(timeout=LLM_QUEUE_TIMEOUT):
+        _busy(name)
+    metrics.observe("llm.queue_wait", time.perf_counter() - start)
+    _track(1)
+    try:
+        yield
+    finally:
+        _track(-1)
+        _sync_slots.release()
+
+
+async def chat_completion(name, timeout=None, **params):
+    """
+    Awaits a chat completion. `name` labels the call in metrics
+    (llm.<name>); `params` go to chat.completions.create.
+    """
+    async with _async_slot(name):
+        with metrics.timer(f"llm.{name}"):
+            return await get_async_client().chat.completions.create(timeout=timeout or LLM_TIMEOUT, **params)
+
+
+async def stream_chat_completion(name, timeout=None, **params):
+    """
+    Yields the chunks of a streamed chat completion. Closing the generator
+    early (use contextlib.aclosing) closes the HTTP response, which stops
+    generation upstream. `timeout` bounds each read, not the whole stream.
+    """
+    async with _async_slot(name):
+        start = time.perf_counter()
+        stream = await get_async_client().chat.completions.create(stream=True, timeout=timeout or LLM_TIMEOUT, **params)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.close()
+            metrics.observe(f"llm.{name}", time.perf_counter() - start)
+
+
+def chat_completion_sync(name, timeout=None, **params):
+    """`chat_completion` for callers running in a thread."""
+    with _sync_slot(name):
+        with metrics.timer(f"llm.{name}"):
+            return get_client().chat.completions.create(timeout=timeout or LLM_TIMEOUT, **params)
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from utils import metrics
+
+
+class LRUCache:
+    """
+    Thread-safe bounded mapping that evicts the least recently used entry.
+
+    With `ttl` (seconds) set, entries older than that are treated as missing
+    and dropped when next looked up. With `max_bytes` set, entries are also
+    evicted until the total of `sizeof(value)` fits the budget.
+
+    Hits, misses, evictions and expirations are reported to utils.metrics as
+    "<name>.hit", "<name>.miss", "<name>.evict" and "<name>.expired".
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=None, max_bytes=None, sizeof=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        metrics.register_gauge(f"{name}.size", self.__len__)
+        if max_bytes is not None:
+            metrics.register_gauge(f"{name}.bytes", lambda: self._bytes)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                metrics.increment(f"{self.name}.miss")
+                return default
+            value, expires_at = self._data[key]
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                metrics.increment(f"{self.name}.expired")
+                metrics.increment(f"{self.name}.miss")
+                return default
+            self._data.move_to_end(key)
+            metrics.increment(f"{self.name}.hit")
+            return value
+
+    def put(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at)
+            self._bytes += self.sizeof(value)
+            while len(self._data) > self.maxsize or (self.max_bytes is not None and self._bytes > self.max_bytes and len(self._data) > 1):
+                self._remove(next(iter(self._data)))
+                metrics.increment(f"{self.name}.evict")
+
+    def _remove(self, key):
+        value, _ = self._data.pop(key)
+        self._bytes -= self.sizeof(value)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._remove(key) if key in self._data else default
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
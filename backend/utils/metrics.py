@@ -0,0 +1,65 @@
+import threading
+import time
+from contextlib import contextmanager
+
+'''
+Small in-process metrics registry.
+
+Counters and timings are kept per worker process and exposed as JSON through
+the /metrics endpoint in main.py. Gauges are callables evaluated on read, so
+modules can report live values such as queue depth.
+'''
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+_gauges = {}
+
+
+def increment(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, seconds):
+    """Records one duration (in seconds) under `name`."""
+    with _lock:
+        timing = _timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+        timing["count"] += 1
+        timing["total"] += seconds
+        timing["max"] = max(timing["max"], seconds)
+
+
+@contextmanager
+def timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def register_gauge(name, fn):
+    with _lock:
+        _gauges[name] = fn
+
+
+def snapshot():
+    """Returns the current value of every counter, timing and gauge."""
+    with _lock:
+        counters = dict(_counters)
+        timings = {
+            name: {
+                "count": timing["count"],
+                "avg_seconds": timing["total"] / timing["count"] if timing["count"] else 0.0,
+                "max_seconds": timing["max"],
+            }
+            for name, timing in _timings.items()
+        }
+        gauges = dict(_gauges)
+
+    return {
+        "counters": counters,
+        "timings": timings,
+        "gauges": {name: fn() for name, fn in gauges.items()},
+    }
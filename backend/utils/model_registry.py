@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+import torch
+from dotenv import load_dotenv
+from utils import readiness
+from utils.inference_backends import build_clip_model, build_predictor
+
+load_dotenv()
+
+'''
+Process-wide registry for the ML models.
+
+Every model (CLIP model and processor, the Detectron2 predictor) is loaded
+once per process, on first use or by the warm-up task in main.py, and shared
+by all callers instead of each module loading its own copy. Models are put in
+eval() when loaded, and inference_context() gives callers
+torch.inference_mode() (or no_grad() when INFERENCE_MODE=0) so the setting is
+controlled from a single place. CLIP_BACKEND / DETECTRON_BACKEND select an
+optimized backend from utils/inference_backends.py.
+'''
+
+CLIP_MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "openai/clip-vit-base-patch32")
+DETECTRON_CONFIG = "COCO-Detection/faster_rcnn_R_50_FPN_3x.yaml"
+DETECTION_SCORE_THRESHOLD = 0.5
+# Instances down to this score are kept and stored (utils/detections.py); labels
+# and regions still only use those above DETECTION_SCORE_THRESHOLD
+DETECTION_STORE_THRESHOLD = float(os.getenv("DETECTION_STORE_THRESHOLD", 0.3))
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", "eager")
+DETECTRON_BACKEND = os.getenv("DETECTRON_BACKEND", "eager")
+
+_inference_mode = os.getenv("INFERENCE_MODE", "1") != "0"
+_models = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def _tensor_bytes(value):
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_bytes(item) for item in value)
+    return 0
+
+
+def model_memory_bytes(model):
+    """
+    Bytes used by a model's weights. Uses the state dict so that packed
+    int8 weights of quantized layers are counted too.
+    """
+    if hasattr(model, "memory_bytes"):
+        return model.memory_bytes
+    return sum(_tensor_bytes(value) for value in model.state_dict().values())
+
+
+def _get(name, loader):
+    entry = _models.get(name)
+    if entry is not None:
+        return entry["instance"]
+
+    with _registry_lock:
+        lock = _locks.setdefault(name, threading.Lock())
+
+    # Per-model lock so concurrent first callers wait for a single load
+    with lock:
+        entry = _models.get(name)
+        if entry is None:
+            readiness.loading(name)
+            start = time.perf_counter()
+            try:
+                instance, module = loader()
+            except Exception as e:
+                readiness.failed(name, e)
+                raise
+            if module is not None:
+                module.eval()
+            entry = {
+                "instance": instance,
+                "load_seconds": time.perf_counter() - start,
+                "memory_bytes": model_memory_bytes(module) if module is not None else 0,
+            }
+            _models[name] = entry
+            readiness.ready(name, entry["load_seconds"])
+            print(f"Loaded model '{name}' in {entry['load_seconds']:.1f}s ({entry['memory_bytes'] / 2**20:.0f} MB)")
+    return entry["instance"]
+
+
+def load_clip(backend="eager"):
+    """Loads a fresh (model, processor) pair; use get_clip() for the shared one."""
+    from transformers import CLIPModel, CLIPProcessor
+    processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+    if backend == "onnx":
+        return build_clip_model(None, backend, num_threads=torch.get_num_threads()), processor
+    model = CLIPModel.from_pretrained(CLIP_MODEL_NAME).eval()
+    return build_clip_model(model, backend), processor
+
+
+def load_predictor(backend="eager"):
+    """Loads a fresh DefaultPredictor; use get_predictor() for the shared one."""
+    from detectron2.engine import DefaultPredictor
+    from detectron2.config import get_cfg
+    from detectron2 import model_zoo
+
+    cfg = get_cfg()
+    cfg.merge_from_file(model_zoo.get_config_file(DETECTRON_CONFIG))
+    cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url(DETECTRON_CONFIG)
+    cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = min(DETECTION_SCORE_THRESHOLD, DETECTION_STORE_THRESHOLD)  # Set threshold for detection
+    cfg.MODEL.DEVICE = "cpu"  # Explicitly set the device to CPU
+    return build_predictor(DefaultPredictor(cfg), backend)
+
+
+def _load_clip():
+    model, processor = load_clip(CLIP_BACKEND)
+    return (model, processor), model
+
+
+def _load_predictor():
+    predictor = load_predictor(DETECTRON_BACKEND)
+    return predictor, predictor.model
+
+
+def get_clip():
+    """Returns the shared (CLIPModel, CLIPProcessor) pair."""
+    return _get("clip", _load_clip)
+
+
+def clip_model_version():
+    """
+    Identifies the CLIP weights and backend embeddings come from, so caches of
+    embeddings can tell when they were produced by a different model.
+    """
+    return f"{CLIP_MODEL_NAME}@{CLIP_BACKEND}"
+
+
+def get_predictor():
+    """Returns the shared Detectron2 DefaultPredictor."""
+    return _get("detectron2", _load_predictor)
+
+
+def get_coco_classes():
+    from detectron2.data import MetadataCatalog
+    return MetadataCatalog.get("coco_2017_val").thing_classes
+
+
+def set_inference_mode(enabled):
+    """Chooses between torch.inference_mode() and torch.no_grad() for every caller."""
+    global _inference_mode
+    _inference_mode = enabled
+
+
+def inference_context():
+    return torch.inference_mode() if _inference_mode else torch.no_grad()
+
+
+def describe_models():
+    """Backend, load time and weight memory of every loaded model."""
+    backends = {"clip": CLIP_BACKEND, "detectron2": DETECTRON_BACKEND}
+    return {
+        name: {
+            "backend": backends.get(name),
+            "load_seconds": round(entry["load_seconds"], 3),
+            "memory_mb": round(entry["memory_bytes"] / 2**20, 1),
+        }
+        for name, entry in _models.items()
+    }
@@ -1,71 +1,203 @@
 import json
 from fastapi import HTTPException
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer
-import torch
-from transformers import CLIPModel, CLIPProcessor
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
+import numpy as np
+from utils import metrics, readiness
+from utils.bulk_upsert import bulk_upsert, forget_failed_upserts
+from utils.llm_client import chat_completion_sync
+from utils.lexical_index import add_documents, delete_documents, lexical_search, reciprocal_rank_fusion
+from utils.lru_cache import LRUCache
+from utils.vector_store import VECTOR_NAMESPACES, VECTOR_STORE, build_vector_store, read_namespaces, user_namespace
+from utils.vector_indexes import active_index_name, index_state
+from utils.vector_ids import UNKNOWN_REGION_COUNT, chat_vector_ids, image_vector_ids, user_vector_ids
+from utils.user_matrix_cache import add_user_vectors, get_user_matrix, invalidate_user
+from utils.model_registry import CLIP_MODEL_NAME, clip_model_version, get_clip, inference_context
 
 load_dotenv()
 
-# Initialize Nebius OpenAI client
-client = OpenAI(
-    base_url="https://api.studio.nebius.ai/v1/",
-    api_key=os.environ.get("NEBIUS_API_KEY")
-)
-
-# Initialize CLIP for text embeddings
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-
-
-# Initialize Pinecone
-pc = Pinecone(api_key=os.environ.get("PINECONE_API_KEY"))
-
-# Define index name
-index_name = "item-context-embeddings-512"
-
-# Create the index if it doesn't exist
-if index_name not in pc.list_indexes().names():
-    pc.create_index(
-        name=index_name,
-        dimension=512,
-        spec=ServerlessSpec(
-            cloud="aws",  # Specify your cloud provider
-            region="us-east-1"  # Specify your region
-        ),
-        metric="cosine"  # You can use 'cosine', 'euclidean', or 'dotproduct'
-    )
+# Text embedded for a message vector is embedding_text(item, context); bump the
+# format whenever that changes so stored vectors get re-embedded (utils/reembed.py)
+EMBEDDING_TEXT_FORMAT = "item-context-v1"
+
+# Image searches fetch this many times top_k matches before keeping one per photo
+REGION_OVERFETCH = 4
+
+# Key items repeat constantly across chat turns, so their CLIP text embeddings are cached
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 4096))
+QUERY_EMBEDDING_CACHE_TTL = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL", 24 * 3600))
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+# Searches of one chat turn run in parallel (see search_many)
+RETRIEVAL_CONCURRENCY = int(os.getenv("RETRIEVAL_CONCURRENCY", 8))
+_retrieval_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_CONCURRENCY, thread_name_prefix="retrieval")
+
+# Hybrid searches fuse BM25 and vector rankings (see search_many)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+# Each ranking contributes this many times top_k candidates to the fusion
+HYBRID_CANDIDATES = 3
+
+_query_embedding_cache = LRUCache("query_embedding_cache", maxsize=QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL)
+_query_embedding_version = None
+_query_embedding_lock = threading.Lock()
+_query_embedding_cost = {"seconds": 0.0, "items": 0}
+
+
+def embedding_version():
+    """
+    Identifies how stored vectors are produced: the CLIP checkpoint and the
+    message text format. Backends (eager, int8, ONNX) of one checkpoint give
+    interchangeable embeddings and share a version.
+    """
+    return f"{CLIP_MODEL_NAME}/{EMBEDDING_TEXT_FORMAT}"
+
 
-# Connect to the index
-index = pc.Index(index_name)
+def embedding_text(item, context):
+    return item + ' ' + context
 
-# Query the index to check the inserted vectors
-result = index.describe_index_stats()
-print('inserted vectors: ', result)
+
+def get_index(name=None):
+    """
+    Opens the vector store selected by VECTOR_STORE (Pinecone by default, see
+    utils/vector_store.py) on first use, creating the index if it doesn't exist.
+    Nothing touches the network at import time, so the API can start without Pinecone.
+
+    Without a name this is the active index of utils/vector_indexes.py, which
+    changes when a re-embedded index is cut over.
+    """
+    name = name or active_index_name()
+    index = _indexes.get(name)
+    if index is not None:
+        return index
+
+    with _index_lock:
+        if name not in _indexes:
+            readiness.loading("vector_store")
+            start = time.perf_counter()
+            try:
+                _indexes[name] = build_vector_store(name)
+            except Exception as e:
+                readiness.failed("vector_store", e)
+                raise
+            readiness.ready("vector_store", time.perf_counter() - start)
+            print(f"Using {VECTOR_STORE} vector store for '{name}'")
+
+    return _indexes[name]
+
+def get_building_index():
+    """
+    The index a re-embed is filling, when it holds this process's embedding
+    version; ingest dual-writes to it so the cutover loses nothing.
+    """
+    building = index_state()["building"]
+    if building is None or building["embedding_version"] != embedding_version():
+        return None
+    if building["index_name"] == active_index_name():
+        return None
+    return get_index(building["index_name"])
+
+def upsert_vectors(vectors):
+    """
+    Bulk upserts to the active index and dual-writes to a building index.
+
+    Returns:
+        list of dict: Per-batch results of the active index upsert.
+    """
+    results = bulk_upsert(get_index(), vectors)
+    add_user_vectors(active_index_name(), vectors)
+    building = get_building_index()
+    if building is not None:
+        # Failures here are not reconciled against the active index; the
+        # re-embed job's catch-up pass covers rows it has not reached yet
+        for result in bulk_upsert(building, vectors, record_failures=False):
+            if result["status"] == "failed":
+                metrics.increment("vector_indexes.dual_write_failed", len(result["ids"]))
+                print(f"Error dual-writing {len(result['ids'])} vectors to the building index: {result['error']}")
+    return results
 
 def clear_index():
     """
-    Clears all vectors from the Pinecone index without deleting the index.
+    Clears all vectors from the index, in every namespace, without deleting the index.
     """
     try:
-        index.delete(delete_all=True)
+        index = get_index()
+        for namespace in index.describe_index_stats()["namespaces"] or {"": 0}:
+            index.delete(delete_all=True, namespace=namespace)
     except Exception as e:
-        print(f"Error clearing the index '{index_name}': {e}")
+        print(f"Error clearing the index '{active_index_name()}': {e}")
+
+def _indexes_to_delete_from():
+    # A building index gets the delete too, whatever its version, or the cutover would resurrect the vectors
+    indexes = [get_index()]
+    building = index_state()["building"]
+    if building is not None and building["index_name"] != active_index_name():
+        indexes.append(get_index(building["index_name"]))
+    return indexes
+
+def delete_vectors(user_id, vector_ids):
+    """
+    Deletes vectors of a user by id, from every index and namespace that can
+    hold them, along with their lexical documents and recorded sync failures.
+    Raises when the vector store fails, so the caller keeps its rows and can retry.
+
+    Returns:
+        int: Number of ids deleted (ids that never existed included).
+    """
+    if not vector_ids:
+        return 0
+    with metrics.timer("vector_delete"):
+        for index in _indexes_to_delete_from():
+            for namespace in read_namespaces(user_id):
+                index.delete(ids=vector_ids, namespace=namespace)
+        delete_documents(doc_ids=vector_ids)
+        forget_failed_upserts(vector_ids=vector_ids)
+    invalidate_user(user_id)
+    metrics.increment("vector_delete.vectors", len(vector_ids))
+    return len(vector_ids)
+
+def delete_chat_vectors(chat_id, user_id):
+    """Deletes the message vectors of a chat log; call before deleting its rows."""
+    return delete_vectors(user_id, chat_vector_ids(chat_id))
+
+def delete_image_vectors(image_id, user_id):
+    """Deletes the vector and region vectors of a photo; call before deleting its row."""
+    return delete_vectors(user_id, image_vector_ids(image_id))
+
+def delete_user_vectors(user_id):
+    """
+    Deletes every vector of a user. Their namespace is dropped whole; vectors
+    still in the default namespace (before scripts/migrate_namespaces.py) go
+    by id.
+    """
+    with metrics.timer("vector_delete"):
+        default_ids = user_vector_ids(user_id, unknown_regions=UNKNOWN_REGION_COUNT) if VECTOR_NAMESPACES != "on" else []
+        for index in _indexes_to_delete_from():
+            if VECTOR_NAMESPACES != "off":
+                index.delete(delete_all=True, namespace=user_namespace(user_id))
+            if default_ids:
+                index.delete(ids=default_ids, namespace="")
+        delete_documents(user_id=user_id)
+        forget_failed_upserts(user_id=user_id)
+    invalidate_user(user_id)
+    metrics.increment("vector_delete.users")
 
 # clear_index() 
 
 # this dont work
 def query_index(query_vector):
+    index = get_index()
     index_stats = index.describe_index_stats()
     print('W: ', index_stats['total_vector_count'])
     '''
     query_vector = query_vector.tolist()
     response = index.query(query_vector=query_vector, top_k=1)
     '''
-    response = index.query(query_vector=query_vector, top_k=1)
+    response = index.query(vector=query_vector, top_k=1)
 
     index_stats =  index.describe_index_stats()
     print('W? ', index_stats['total_vector_count'])
@@ -73,7 +205,11 @@ def query_index(query_vector):
 
 
 def extract_insights_from_chatlog(chatlog_content):
-    completion = client.chat.completions.create(
+    # Runs in a thread (request threadpool or job worker), so it uses the sync client
+    completion = chat_completion_sync(
+        "chatlog_insights",
+        # Whole chat logs take a while to read
+        timeout=180,
         model="meta-llama/Meta-Llama-3.1-8B-Instruct-fast",
         messages=[
             {
@@ -121,29 +257,87 @@ def generate_embeddings(dict_item_context):
         list of numpy.ndarray: Embeddings for each insight.
     """
     # Prepare text input for CLIP (item + context)
-    texts = [item + ' ' + context for item, context in zip(dict_item_context["items"], dict_item_context["context"])]
+    texts = [embedding_text(item, context) for item, context in zip(dict_item_context["items"], dict_item_context["context"])]
     
-    # Process the text using CLIPProcessor
+    # Process the text using the shared CLIPProcessor
+    clip_model, clip_processor = get_clip()
     inputs = clip_processor(text=texts, return_tensors="pt", padding=True, truncation=True)
     
     # Generate text embeddings using CLIPModel
-    with torch.no_grad():
+    with inference_context():
         text_embeddings = clip_model.get_text_features(**inputs)
 
     return text_embeddings
 
 
+def normalize_key_item(key_item):
+    """
+    Cache key for a key item. CLIP's tokenizer lowercases and splits on
+    whitespace, so case and spacing differences give the same embedding.
+    """
+    return " ".join(key_item.lower().split())
+
+
+def _check_query_embedding_version():
+    # Drop every cached embedding when the CLIP model or backend changes
+    global _query_embedding_version
+    version = clip_model_version()
+    with _query_embedding_lock:
+        if _query_embedding_version != version:
+            if _query_embedding_version is not None:
+                metrics.increment("query_embedding_cache.invalidated")
+            _query_embedding_cache.clear()
+            _query_embedding_version = version
+
+
+def generate_query_embeddings(key_items):
+    """
+    Returns a CLIP text embedding (numpy float32 [512]) per key item.
+
+    Cached items are served from an LRU+TTL cache; all misses are embedded
+    together in a single forward pass.
+    """
+    _check_query_embedding_version()
+    keys = [normalize_key_item(key_item) for key_item in key_items]
+
+    embeddings = {}
+    for key in keys:
+        if key not in embeddings:
+            cached = _query_embedding_cache.get(key)
+            if cached is not None:
+                embeddings[key] = cached
+
+    misses = [key for key in dict.fromkeys(keys) if key not in embeddings]
+    if misses:
+        clip_model, clip_processor = get_clip()
+        inputs = clip_processor(text=misses, return_tensors="pt", padding=True, truncation=True)
+        start = time.perf_counter()
+        with inference_context():
+            query_embeddings = clip_model.get_text_features(**inputs)
+        elapsed = time.perf_counter() - start
+        metrics.observe("query_embedding.embed", elapsed)
+        with _query_embedding_lock:
+            _query_embedding_cost["seconds"] += elapsed
+            _query_embedding_cost["items"] += len(misses)
+        for key, embedding in zip(misses, query_embeddings.cpu().numpy().astype(np.float32)):
+            embeddings[key] = embedding
+            _query_embedding_cache.put(key, embedding)
+
+    hits = len(keys) - len(misses)
+    if hits and _query_embedding_cost["items"]:
+        # Estimated CLIP time saved, from the measured cost of embedding one miss
+        per_item = _query_embedding_cost["seconds"] / _query_embedding_cost["items"]
+        metrics.increment("query_embedding_cache.saved_seconds", hits * per_item)
+
+    return [embeddings[key] for key in keys]
+
+
 # With the extracted key item from the user prompt, we pass it here to make it a query embedding
 def generate_query_embedding(key_item):
-    if not key_item:
+    if not key_item or not key_item.strip():
         raise HTTPException(status_code=400, detail="Key item is empty.")
-    
-    inputs = clip_processor(text=[key_item], return_tensors="pt", padding=True, truncation=True)
-
-    with torch.no_grad():
-        query_embedding = clip_model.get_text_features(**inputs)
 
-    return query_embedding
+    return generate_query_embeddings([key_item])[0]
 
 
 def store_embeddings_in_pinecone(dict_item_context, embeddings, chat_id, file, user_id, image_id, type):
@@ -154,67 +348,280 @@ def store_embeddings_in_pinecone(dict_item_context, embeddings, chat_id, file, u
         dict_item_context (dict): Dictionary containing "items" and "context".
         embeddings (list): List of embeddings corresponding to each item-context pair.
         filename (str): Name of the uploaded file (used as a unique identifier).
+
+    Returns:
+        tuple: (vectors, per-batch results from utils.bulk_upsert). Batches
+        that still fail after retries are recorded for reconciliation instead
+        of raising, since the rows are already committed in Postgres.
     """
 
     print(file)
     if (type=="message"):
         pinecone_data = [
-            {
-                "id": file + '_' + str(dict_item_context["ids"][i]),
-                "values": embedding.tolist(),  # Convert NumPy array to list
-                "metadata": {
-                    "chat_id": chat_id,
-                    "message_id": dict_item_context["ids"][i],
-                    "type": type,
-                    "item": dict_item_context["items"][i],
-                    "context": dict_item_context["context"][i],
-                    "message": dict_item_context["messages"][i],
-                    "user_id": user_id
-                }
-            }
+            build_message_vector(
+                chat_id, dict_item_context["ids"][i], file, dict_item_context["items"][i],
+                dict_item_context["context"][i], dict_item_context["messages"][i], embedding, user_id,
+            )
             for i, embedding in enumerate(embeddings)
         ]
     else:
-        pinecone_data = [
-            {
-                "id": file + '_' + str(image_id),
-                "values": embeddings[0].tolist(),  # Convert NumPy array to list
-                "metadata": {
-                    "type": type,
-                    "image_id": image_id,
-                    "user_id": user_id,
-                    "items": dict_item_context["items"],
-                    "filename": file,
-                }
-            }
-        ]
+        pinecone_data = [build_image_vector(image_id, file, dict_item_context["items"], embeddings[0], user_id)]
 
     # Upsert data into Pinecone
+    results = upsert_vectors(pinecone_data)
+    failed = sum(len(result["ids"]) for result in results if result["status"] == "failed")
+    if failed:
+        print(f"Error upserting {failed} of {len(pinecone_data)} vectors to Pinecone, recorded for reconciliation")
+    index_lexically(pinecone_data)
+    return pinecone_data, results
+
+def index_lexically(vectors):
+    """
+    Mirrors vector records into the BM25 index. Failures are logged only: the
+    lexical index is a derived copy that scripts/build_lexical_index.py rebuilds.
+    """
     try:
-        index.upsert(vectors=pinecone_data)
-        return pinecone_data
+        add_documents(vectors)
     except Exception as e:
-        print(f"Error upserting data to Pinecone: {e}")
-        raise
+        print("Error updating the lexical index:", e)
+
+def build_message_vector(chat_id, message_id, file, item, context, message, embedding, user_id):
+    return {
+        "id": file + '_' + str(message_id),
+        "values": embedding.tolist(),  # Convert NumPy array to list
+        "metadata": {
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "type": "message",
+            "item": item,
+            "context": context,
+            "message": message,
+            "user_id": user_id,
+            "embedding_version": embedding_version(),
+        }
+    }
+
+def build_image_vector(image_id, file, items, embedding, user_id):
+    """
+    Builds the Pinecone record for an image. `embedding` may be None when only
+    the metadata is needed (e.g. to describe an already stored duplicate).
+    """
+    vector = {
+        "id": file + '_' + str(image_id),
+        "metadata": {
+            "type": "image",
+            "image_id": image_id,
+            "user_id": user_id,
+            "items": items,
+            "filename": file,
+            "embedding_version": embedding_version(),
+        }
+    }
+    if embedding is not None:
+        vector["values"] = embedding.tolist()  # Convert NumPy array to list
+    return vector
+
+def build_region_vectors(image_id, file, items, regions, user_id):
+    """
+    Builds one Pinecone record per detected object of an image. `items` holds
+    every label of the photo so a region match can describe the whole photo.
+    Pinecone metadata lists must be strings, so the normalized box is stored
+    as "x1,y1,x2,y2".
+    """
+    return [
+        {
+            "id": file + '_' + str(image_id) + '_r' + str(i),
+            "values": region["embedding"].tolist(),
+            "metadata": {
+                "type": "region",
+                "image_id": image_id,
+                "user_id": user_id,
+                "items": items,
+                "filename": file,
+                "label": region["label"],
+                "score": region["score"],
+                "box": ",".join(str(value) for value in region["box"]),
+                "embedding_version": embedding_version(),
+            }
+        }
+        for i, region in enumerate(regions)
+    ]
+
+def store_image_embeddings_in_pinecone(images, user_id):
+    """
+    Stores the image and region embeddings of several images through
+    utils.bulk_upsert (size-bounded parallel batches with retries).
+
+    Args:
+        images (list of dict): Each with "image_id", "file", "items", "embedding"
+            and optionally "regions".
+        user_id (int): Owner of the images.
+
+    Returns:
+        tuple: (per-image list of vectors with the image vector first, in input
+        order; set of image_ids whose upsert failed).
+    """
+    vectors = [
+        [build_image_vector(image["image_id"], image["file"], image["items"], image["embedding"], user_id)]
+        + build_region_vectors(image["image_id"], image["file"], image["items"], image.get("regions", []), user_id)
+        for image in images
+    ]
+    pinecone_data = [vector for image_vectors in vectors for vector in image_vectors]
+
+    if not pinecone_data:
+        return vectors, set()
+
+    failed_vector_ids = set()
+    for result in upsert_vectors(pinecone_data):
+        if result["status"] == "failed":
+            print(f"Error upserting data to Pinecone: {result['error']}")
+            failed_vector_ids.update(result["ids"])
+    failed_ids = {vector["metadata"]["image_id"] for vector in pinecone_data if vector["id"] in failed_vector_ids}
+    index_lexically(pinecone_data)
+
+    return vectors, failed_ids
+
+def merge_namespace_results(results, top_k):
+    """Merges query results of several namespaces by score, one match per id."""
+    if len(results) == 1:
+        return results[0]
+    matches = {}
+    for match in sorted((match for result in results for match in result["matches"]), key=lambda match: -match["score"]):
+        matches.setdefault(match["id"], match)
+    return {"matches": list(matches.values())[:top_k]}
 
 def search_in_pinecone(query_embedding, user_id, type, top_k):
-    
-    # Step 1: Query Pinecone to get the top 5 closest results
-    query_vector = query_embedding.cpu().numpy().tolist()
-    result = index.query(
-        vector=query_vector, 
-        top_k=top_k, 
-        include_metadata=True,  # You can retrieve metadata too
-        metric="cosine",
-        filter={"user_id": user_id, "type": type}
-    )
+    """
+    Returns the metadata of the top_k closest vectors of `type` for the user.
+
+    Image searches also match the region vectors of detected objects and
+    return at most one result per photo; a region match carries the object's
+    "label", "score" and normalized "box" alongside the photo's image_id.
+    Every result has the cosine similarity of the match as "match_score".
+    """
+    if type == "image":
+        type_filter = {"$in": ["image", "region"]}
+        # Several regions of one photo can match, over-fetch before collapsing per photo
+        query_top_k = top_k * REGION_OVERFETCH
+    else:
+        type_filter = type
+        query_top_k = top_k
+
+    # Step 1: Query Pinecone to get the closest results
+    if hasattr(query_embedding, "cpu"):
+        query_embedding = query_embedding.cpu().numpy()
+    query_vector = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    index = get_index()
+    # Users in the hot cache are searched in memory (utils/user_matrix_cache.py)
+    user_matrix = get_user_matrix(index, active_index_name(), user_id)
+    if user_matrix is not None:
+        with metrics.timer("retrieval.user_matrix"):
+            result = user_matrix.query(query_vector, query_top_k, type_filter["$in"] if type == "image" else [type_filter])
+    else:
+        # The user_id filter stays: the default namespace is shared until migrated
+        namespace_results = [
+            index.query(
+                vector=query_vector.tolist(),
+                top_k=query_top_k,
+                include_metadata=True,
+                filter={"user_id": user_id, "type": type_filter},
+                namespace=namespace,
+            )
+            for namespace in read_namespaces(user_id)
+        ]
+        result = merge_namespace_results(namespace_results, query_top_k)
     
     # Step 2: Parse and return results
     results = []
+    seen_images = set()
     
     for match in result['matches']:
         # Each match includes metadata (item, context, etc.)
-        item_metadata = match['metadata']
+        item_metadata = dict(match['metadata'])
+        item_metadata["match_score"] = match["score"]
+        if type == "image":
+            if item_metadata["image_id"] in seen_images:
+                continue
+            seen_images.add(item_metadata["image_id"])
+            if "box" in item_metadata:
+                item_metadata["box"] = [float(value) for value in item_metadata["box"].split(",")]
         results.append(item_metadata)
+        if len(results) == top_k:
+            break
 
     return results
+
+
+def search_many(query_embedding, user_id, requests, query_text=None, hybrid=None):
+    """
+    Runs several searches for one query concurrently, so retrieval takes as
+    long as the slowest search instead of their sum.
+
+    With `query_text` (and `hybrid`, HYBRID_SEARCH by default), every type is
+    searched both by vector and by BM25 over the lexical index, and the two
+    rankings are fused with reciprocal rank fusion; results then carry an
+    "rrf_score". Without a `query_embedding` only the lexical search runs.
+
+    Similarities are not comparable across types (text-to-text matches score
+    far higher than text-to-image ones), so the merged list ranks results by
+    "normalized_score": their score relative to the best match of the same
+    type.
+
+    Args:
+        query_embedding: Query vector (numpy array or torch tensor), or None.
+        user_id (int): Owner of the searched vectors.
+        requests (list of tuple): (type, top_k) pairs.
+        query_text (str): Text of the query for the lexical ranking.
+        hybrid (bool): Fuse the vector and lexical rankings; None follows
+            HYBRID_SEARCH.
+
+    Returns:
+        dict: "by_type" maps each type to its results and "merged" holds all
+        of them, best normalized score first.
+    """
+    if query_embedding is None and not query_text:
+        raise ValueError("search_many needs a query embedding or query text")
+    if hasattr(query_embedding, "cpu"):
+        query_embedding = query_embedding.cpu().numpy()
+    active = index_state()["active"]
+    if query_embedding is not None and active and active["embedding_version"] != embedding_version():
+        # Query embeddings come from a different model than the served vectors
+        metrics.increment("vector_indexes.version_mismatch")
+    if hybrid is None:
+        hybrid = HYBRID_SEARCH
+    hybrid = bool(query_text) and (hybrid or query_embedding is None)
+
+    def timed_search(type, top_k):
+        with metrics.timer(f"retrieval.{type}"):
+            return search_in_pinecone(query_embedding, user_id, type, top_k)
+
+    def timed_lexical_search(type, top_k):
+        with metrics.timer(f"retrieval.lexical_{type}"):
+            return lexical_search(user_id, query_text, type, top_k)
+
+    with metrics.timer("retrieval.search_many"):
+        futures = []
+        for type, top_k in requests:
+            candidates = top_k * HYBRID_CANDIDATES if hybrid else top_k
+            rankings = []
+            if query_embedding is not None:
+                rankings.append(_retrieval_pool.submit(timed_search, type, candidates))
+            if hybrid:
+                rankings.append(_retrieval_pool.submit(timed_lexical_search, type, candidates))
+            futures.append((type, top_k, rankings))
+
+        by_type = {}
+        for type, top_k, rankings in futures:
+            rankings = [future.result() for future in rankings]
+            by_type[type] = reciprocal_rank_fusion(rankings, top_k) if hybrid else rankings[0]
+
+    score_field = "rrf_score" if hybrid else "match_score"
+    merged = []
+    for type, results in by_type.items():
+        best = max((result[score_field] for result in results), default=0) or 1
+        merged.extend(
+            {**result, "result_type": type, "normalized_score": round(result[score_field] / best, 4)}
+            for result in results
+        )
+    merged.sort(key=lambda result: -result["normalized_score"])
+    return {"by_type": by_type, "merged": merged}
@@ -0,0 +1,52 @@
+import threading
+import time
+
+'''
+Readiness of the slow-to-initialise components (models, external clients).
+
+Components are registered as "pending" and move to "loading", then "ready"
+or "error" as they are loaded, either by the background warm-up in main.py or
+lazily by the first request that needs them. /readyz reports this table.
+'''
+
+_lock = threading.Lock()
+_components = {}
+
+
+def register(name):
+    with _lock:
+        _components.setdefault(name, {"status": "pending", "load_seconds": None, "error": None})
+
+
+def loading(name):
+    with _lock:
+        component = _components.setdefault(name, {"load_seconds": None})
+        component.update({"status": "loading", "error": None, "started_at": time.perf_counter()})
+
+
+def ready(name, load_seconds):
+    with _lock:
+        component = _components.setdefault(name, {})
+        component.pop("started_at", None)
+        component.update({"status": "ready", "load_seconds": round(load_seconds, 3), "error": None})
+
+
+def failed(name, error):
+    with _lock:
+        component = _components.setdefault(name, {"load_seconds": None})
+        component.pop("started_at", None)
+        component.update({"status": "error", "error": str(error)})
+
+
+def report():
+    """Returns (all_ready, per-component status)."""
+    with _lock:
+        components = {}
+        for name, component in _components.items():
+            component = dict(component)
+            started_at = component.pop("started_at", None)
+            if started_at is not None:
+                component["elapsed_seconds"] = round(time.perf_counter() - started_at, 3)
+            components[name] = component
+    all_ready = bool(components) and all(c["status"] == "ready" for c in components.values())
+    return all_ready, components
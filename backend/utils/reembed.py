@@ -0,0 +1,304 @@
+import os
+import time
+import numpy as np
+from dotenv import load_dotenv
+from database.database import get_connection
+from utils import metrics
+from utils.blob_store import get_blob_store
+from utils.bulk_upsert import bulk_upsert
+from utils.image_cache import put_cached_inferences
+from utils.image_preprocessing import load_image
+from utils.job_queue import report_progress
+from utils.pinecone_db import (
+    build_image_vector, build_message_vector, build_region_vectors, embedding_version, generate_embeddings, get_index,
+)
+from utils.vector_indexes import activate_index, index_state, register_index, versioned_index_name
+
+load_dotenv()
+
+'''
+Re-embeds every message and photo into a new index for the current embedding
+version (utils/vector_indexes.py), then cuts over to it.
+
+Rows are streamed from Postgres with server-side cursors in id order and
+embedded in large batches: message vectors from the stored item and context,
+photo and region vectors from the stored blob and packed detections, so
+neither the LLM nor Faster R-CNN runs again (photos without stored detections
+are the exception). The last id written is checkpointed after every batch, so
+a retried job resumes where it stopped. While the index is building, ingest
+dual-writes new vectors to it; a final catch-up pass picks up rows added
+before that took effect, and only then is the new index activated.
+
+Runs as the "reembed" job (utils/job_worker.py); enqueue it with
+scripts/reembed.py.
+'''
+
+REEMBED_MESSAGE_BATCH_SIZE = int(os.getenv("REEMBED_MESSAGE_BATCH_SIZE", 256))
+REEMBED_IMAGE_BATCH_SIZE = int(os.getenv("REEMBED_IMAGE_BATCH_SIZE", 32))
+
+MESSAGES_QUERY = """
+    SELECT m.message_id, m.chat_id, m.message, m.item, m.context, c.user_id, c.chat_title
+    FROM messages m
+    JOIN chat_logs c ON c.chat_id = m.chat_id
+    WHERE m.message_id > %s
+    ORDER BY m.message_id
+"""
+
+# Legacy rows still holding the photo inline only load it when there is no blob
+IMAGES_QUERY = """
+    SELECT i.image_id, i.user_id, i.filename, i.items, i.blob_key, i.content_hash,
+           CASE WHEN i.blob_key IS NULL THEN i.image_data END AS image_data,
+           d.boxes, d.scores, d.classes
+    FROM images i
+    LEFT JOIN image_detections d ON d.content_hash = i.content_hash
+    WHERE i.image_id > %s
+    ORDER BY i.image_id
+"""
+
+
+def stream_batches(query, params, batch_size):
+    """Yields lists of rows from a server-side cursor."""
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor(name="reembed")
+        cursor.itersize = batch_size
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def count_rows():
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT (SELECT COUNT(*) FROM messages) AS messages, (SELECT COUNT(*) FROM images) AS images")
+        return dict(cursor.fetchone())
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def backfill_message_fields(rows, source):
+    """
+    Fills item and context of messages stored before those columns existed,
+    from the metadata of their vectors in `source`, and saves them to Postgres.
+    Messages with no vector left are embedded from their text.
+    """
+    missing = {row["chat_title"] + '_' + str(row["message_id"]): row for row in rows if row["item"] is None}
+    if not missing:
+        return
+
+    found = {}
+    for user_id in {row["user_id"] for row in missing.values()}:
+        user_ids = [vector_id for vector_id, row in missing.items() if row["user_id"] == user_id]
+        found.update({
+            vector_id: record["metadata"]
+            for vector_id, record in source.fetch_user(user_id, user_ids).items()
+            if record["metadata"].get("user_id") == user_id
+        })
+    updates = []
+    for vector_id, row in missing.items():
+        metadata = found.get(vector_id)
+        if metadata:
+            row["item"], row["context"] = metadata.get("item", ""), metadata.get("context", "")
+            updates.append((row["item"], row["context"], row["message_id"]))
+        else:
+            row["item"], row["context"] = "", row["message"]
+            metrics.increment("reembed.message_without_vector")
+
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor()
+        cursor.executemany("UPDATE messages SET item = %s, context = %s WHERE message_id = %s", updates)
+        conn.commit()
+
+    except Exception as e:
+        print("Error backfilling message item/context:", e)
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def embed_message_rows(rows, source):
+    backfill_message_fields(rows, source)
+    embeddings = generate_embeddings({
+        "items": [row["item"] for row in rows],
+        "context": [row["context"] for row in rows],
+    }).cpu().numpy()
+    return [
+        build_message_vector(
+            row["chat_id"], row["message_id"], row["chat_title"], row["item"], row["context"],
+            row["message"], embedding, row["user_id"],
+        )
+        for row, embedding in zip(rows, embeddings)
+    ]
+
+
+def _load_row_image(row, blob_store):
+    try:
+        data = blob_store.read(row["blob_key"]) if row["blob_key"] else bytes(row["image_data"])
+        return load_image(data)
+    except Exception as e:
+        print(f"Skipping image {row['image_id']}: {e}")
+        metrics.increment("reembed.image_skipped")
+        return None
+
+
+def embed_image_rows(rows, blob_store):
+    # Imported here so loading this module does not load Detectron2
+    from controllers.detectron2 import embed_images, process_image_batch, regions_from_detections
+    from utils.detections import put_detections
+
+    loaded = [(row, image) for row in rows for image in [_load_row_image(row, blob_store)] if image is not None]
+    stored = [(row, np.asarray(image)) for row, image in loaded if row["boxes"] is not None]
+    undetected = [(row, image) for row, image in loaded if row["boxes"] is None]
+
+    inferences = []
+
+    # Photos with stored detections: crop their regions, one CLIP batch for everything
+    per_image_regions = []
+    crops = []
+    for row, image_np in stored:
+        detections = {
+            "boxes": np.frombuffer(bytes(row["boxes"]), dtype=np.float32).reshape(-1, 4),
+            "scores": np.frombuffer(bytes(row["scores"]), dtype=np.float32),
+            "classes": np.frombuffer(bytes(row["classes"]), dtype=np.int16),
+        }
+        regions, image_crops = regions_from_detections(detections, image_np)
+        per_image_regions.append(regions)
+        crops.extend(image_crops)
+    if stored:
+        embeddings = embed_images([image_np for _, image_np in stored] + crops)
+        region_embeddings = iter(embeddings[len(stored):])
+        for i, ((row, _), regions) in enumerate(zip(stored, per_image_regions)):
+            for region in regions:
+                region["embedding"] = next(region_embeddings)
+            labels = [item.strip() for item in (row["items"] or "").split(",") if item.strip()]
+            inferences.append((row, {"labels": labels, "embedding": embeddings[i], "regions": regions}))
+
+    # Photos from before detections were stored need Faster R-CNN once
+    if undetected:
+        outputs = process_image_batch([image for _, image in undetected])
+        put_detections([(row["content_hash"], output["detections"]) for (row, _), output in zip(undetected, outputs) if row["content_hash"]])
+        inferences.extend((row, output) for (row, _), output in zip(undetected, outputs))
+
+    put_cached_inferences([
+        (row["content_hash"], {key: inference[key] for key in ("labels", "embedding", "regions")})
+        for row, inference in inferences if row["content_hash"]
+    ])
+
+    vectors = []
+    for row, inference in inferences:
+        # Keep the labels shown to the user, they came from the original upload
+        items = [item.strip() for item in (row["items"] or "").split(",") if item.strip()]
+        vectors.append(build_image_vector(row["image_id"], row["filename"], items, inference["embedding"], row["user_id"]))
+        vectors.extend(build_region_vectors(row["image_id"], row["filename"], items, inference["regions"], row["user_id"]))
+    return vectors
+
+
+def _write(target, vectors):
+    # A failed batch fails the job; the retry resumes from the last checkpoint
+    failed = [result for result in bulk_upsert(target, vectors, record_failures=False) if result["status"] == "failed"]
+    if failed:
+        raise RuntimeError(f"{sum(len(result['ids']) for result in failed)} vectors failed to upsert: {failed[0]['error']}")
+
+
+def reembed_pass(job, stage, query, batch_size, last_id_key, id_field, embed, target, totals, checkpoint):
+    """Re-embeds rows after the checkpointed id. Returns the number of rows processed."""
+    processed = 0
+    start = time.perf_counter()
+    for rows in stream_batches(query, (checkpoint.get(last_id_key, 0),), batch_size):
+        with metrics.timer(f"reembed.{stage}.batch"):
+            vectors = embed(rows)
+            if vectors:
+                _write(target, vectors)
+
+        processed += len(rows)
+        metrics.increment(f"reembed.{stage}", len(rows))
+        metrics.increment("reembed.vectors", len(vectors))
+        checkpoint[last_id_key] = rows[-1][id_field]
+        checkpoint[f"{stage}_done"] = checkpoint.get(f"{stage}_done", 0) + len(rows)
+        if job is not None:
+            job.save_checkpoint(**checkpoint)
+
+        rate = processed / max(time.perf_counter() - start, 1e-9)
+        report_progress(job, stage, done=checkpoint[f"{stage}_done"], total=totals[stage], per_second=round(rate, 1))
+        print(f"Re-embedded {checkpoint[f'{stage}_done']}/{totals[stage]} {stage} ({rate:.1f}/s)")
+    return processed
+
+
+def run_reembed(job=None, cutover=True):
+    """
+    Re-embeds everything into the index of the current embedding version and,
+    with `cutover`, makes it the active index.
+
+    Returns:
+        dict: "index_name", "embedding_version", rows re-embedded per type and
+        whether the index is now active.
+    """
+    version = embedding_version()
+    target_name = versioned_index_name(version)
+    state = index_state(refresh=True)
+    if state["active"] and state["active"]["index_name"] == target_name:
+        return {"index_name": target_name, "embedding_version": version, "messages": 0, "images": 0, "active": True}
+
+    register_index(target_name, version)
+    target = get_index(target_name)
+    source = get_index()
+    blob_store = get_blob_store()
+    checkpoint = dict(job.checkpoint) if job is not None else {}
+    totals = count_rows()
+
+    passes = [
+        ("messages", MESSAGES_QUERY, REEMBED_MESSAGE_BATCH_SIZE, "last_message_id", "message_id", lambda rows: embed_message_rows(rows, source)),
+        ("images", IMAGES_QUERY, REEMBED_IMAGE_BATCH_SIZE, "last_image_id", "image_id", lambda rows: embed_image_rows(rows, blob_store)),
+    ]
+    with metrics.timer("reembed.run"):
+        for stage, query, batch_size, last_id_key, id_field, embed in passes:
+            reembed_pass(job, stage, query, batch_size, last_id_key, id_field, embed, target, totals, checkpoint)
+            report_progress(job, stage, "done", done=checkpoint.get(f"{stage}_done", 0), total=totals[stage])
+
+        # Rows committed while the passes ran (before dual-writes reached this
+        # index) come after the checkpoints; repeat until a round finds none
+        report_progress(job, "catch_up")
+        while sum(
+            reembed_pass(job, stage, query, batch_size, last_id_key, id_field, embed, target, totals, checkpoint)
+            for stage, query, batch_size, last_id_key, id_field, embed in passes
+        ):
+            pass
+        report_progress(job, "catch_up", "done")
+
+    if cutover:
+        report_progress(job, "cutover")
+        activate_index(target_name)
+        report_progress(job, "cutover", "done")
+        print(f"Active vector index is now '{target_name}' ({version})")
+
+    return {
+        "index_name": target_name,
+        "embedding_version": version,
+        "messages": checkpoint.get("messages_done", 0),
+        "images": checkpoint.get("images_done", 0),
+        "active": cutover,
+    }
@@ -0,0 +1,199 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dotenv import load_dotenv
+from utils import metrics
+from utils.compact_embeddings import encode
+from utils.lru_cache import LRUCache
+from utils.vector_ids import user_vector_ids
+
+load_dotenv()
+
+'''
+Per-user hot cache of vectors for retrieval.
+
+One user has at most a few thousand vectors, so instead of a filtered query
+against the shared index, a search of a cached user is one matrix-vector
+product over that user's normalized embeddings (kept as a compact matrix,
+see utils/compact_embeddings.py) followed by a top-k selection.
+
+A user is loaded in the background after their first search misses (that
+search goes to the index): their vector ids are listed from Postgres
+(utils/vector_ids.py) and fetched from the namespaces that hold them.
+Entries are evicted by LRU within USER_MATRIX_CACHE_MAX_BYTES and expire
+after USER_MATRIX_CACHE_TTL. Writes through utils/pinecone_db append to the
+entry of their user in this process; vectors written by another process (a
+separate job worker) show up once the entry expires.
+
+Entries are immutable: appends build a new entry, so a search in flight keeps
+a consistent snapshot.
+'''
+
+USER_MATRIX_CACHE = os.getenv("USER_MATRIX_CACHE", "1") == "1"
+USER_MATRIX_CACHE_MAX_BYTES = int(os.getenv("USER_MATRIX_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+USER_MATRIX_CACHE_TTL = int(os.getenv("USER_MATRIX_CACHE_TTL", 300))
+# Larger tenants are left to the index
+USER_MATRIX_CACHE_MAX_VECTORS = int(os.getenv("USER_MATRIX_CACHE_MAX_VECTORS", 50000))
+USER_MATRIX_CACHE_ENCODING = os.getenv("USER_MATRIX_CACHE_ENCODING", "float32")
+
+_cache = LRUCache(
+    "user_matrix_cache", maxsize=100000, ttl=USER_MATRIX_CACHE_TTL,
+    max_bytes=USER_MATRIX_CACHE_MAX_BYTES, sizeof=lambda entry: entry.nbytes,
+)
+_too_large = LRUCache("user_matrix_cache.too_large", maxsize=10000, ttl=USER_MATRIX_CACHE_TTL)
+_loader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="user-matrix")
+_loading = set()
+# Users written to while their load was running; that load may predate the write
+_stale = set()
+_loading_lock = threading.Lock()
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class UserMatrix:
+    """The vectors of one user: ids, metadata and a compact embedding matrix, row-aligned."""
+
+    def __init__(self, ids, metadata, matrix):
+        self.ids = ids
+        self.metadata = metadata
+        self.matrix = matrix
+        self.types = np.asarray([record.get("type", "") for record in metadata], dtype=str)
+
+    @classmethod
+    def from_vectors(cls, vectors):
+        vectors = list({vector["id"]: vector for vector in vectors}.values())
+        if vectors:
+            values = np.asarray([vector["values"] for vector in vectors], dtype=np.float32).reshape(len(vectors), -1)
+        else:
+            # A user without vectors is cached too, or every search would reload them
+            values = np.empty((0, 0), dtype=np.float32)
+        return cls(
+            [vector["id"] for vector in vectors],
+            [dict(vector["metadata"]) for vector in vectors],
+            encode(_normalize(values), USER_MATRIX_CACHE_ENCODING),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        # Metadata dicts are estimated, they are small next to the matrix
+        return self.matrix.nbytes + 512 * len(self.ids)
+
+    def appended(self, vectors):
+        """A copy with `vectors` added, replacing rows with the same id."""
+        if not len(self):
+            return UserMatrix.from_vectors(vectors)
+        replaced = {vector["id"] for vector in vectors}
+        keep = np.asarray([vector_id not in replaced for vector_id in self.ids], dtype=bool)
+        added = UserMatrix.from_vectors(vectors)
+        rows = np.flatnonzero(keep)
+        return UserMatrix(
+            [self.ids[row] for row in rows] + added.ids,
+            [self.metadata[row] for row in rows] + added.metadata,
+            encode(np.concatenate([self.matrix.decode(rows), added.matrix.decode()]), USER_MATRIX_CACHE_ENCODING),
+        )
+
+    def query(self, vector, top_k, types):
+        """Same result shape as VectorStore.query, restricted to `types`."""
+        if not len(self):
+            return {"matches": []}
+        query = _normalize(np.asarray(vector, dtype=np.float32).reshape(-1))
+        scores = self.matrix.scores(query)
+        scores = np.where(np.isin(self.types, list(types)), scores, -np.inf)
+        top_k = min(top_k, int(np.isfinite(scores).sum()))
+        if top_k <= 0:
+            return {"matches": []}
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return {
+            "matches": [
+                {"id": self.ids[row], "score": round(float(scores[row]), 6), "metadata": self.metadata[row]}
+                for row in best
+            ]
+        }
+
+
+def load_user_matrix(store, index_name, user_id):
+    with metrics.timer("user_matrix_cache.load"):
+        ids = user_vector_ids(user_id)
+        if len(ids) > USER_MATRIX_CACHE_MAX_VECTORS:
+            _too_large.put((index_name, user_id), True)
+            return None
+        records = store.fetch_user(user_id, ids)
+        vectors = [
+            {"id": vector_id, "values": record["values"], "metadata": record["metadata"]}
+            for vector_id, record in records.items()
+            # Ids are filenames, which different users can share in the default namespace
+            if record["metadata"].get("user_id") == user_id
+        ]
+        entry = UserMatrix.from_vectors(vectors)
+    _cache.put((index_name, user_id), entry)
+    return entry
+
+
+def _load_in_background(store, index_name, user_id):
+    key = (index_name, user_id)
+    try:
+        load_user_matrix(store, index_name, user_id)
+    except Exception as e:
+        print(f"Error loading vectors of user {user_id} into the matrix cache: {e}")
+    finally:
+        with _loading_lock:
+            _loading.discard(key)
+            if key in _stale:
+                _stale.discard(key)
+                _cache.pop(key)
+
+
+def get_user_matrix(store, index_name, user_id):
+    """
+    The cached vectors of a user in `index_name`, or None. A miss schedules a
+    background load, so the caller should search the index this time.
+    """
+    if not USER_MATRIX_CACHE:
+        return None
+    entry = _cache.get((index_name, user_id))
+    if entry is not None:
+        return entry
+
+    key = (index_name, user_id)
+    if _too_large.get(key):
+        return None
+    with _loading_lock:
+        if key in _loading:
+            return None
+        _loading.add(key)
+    _loader.submit(_load_in_background, store, index_name, user_id)
+    return None
+
+
+def add_user_vectors(index_name, vectors):
+    """Appends freshly written vectors to the cached entries of their users."""
+    by_user = {}
+    for vector in vectors:
+        if "values" in vector:
+            by_user.setdefault(vector["metadata"].get("user_id"), []).append(vector)
+    for user_id, user_vectors in by_user.items():
+        with _loading_lock:
+            if (index_name, user_id) in _loading:
+                _stale.add((index_name, user_id))
+        entry = _cache.get((index_name, user_id))
+        if entry is not None:
+            _cache.put((index_name, user_id), entry.appended(user_vectors))
+            metrics.increment("user_matrix_cache.appended", len(user_vectors))
+
+
+def invalidate_user(user_id, index_name=None):
+    """Drops a user's entry, in one index or in all of them."""
+    with _loading_lock:
+        # A load in flight may have read vectors that are now deleted
+        _stale.update(key for key in _loading if key[1] == user_id and (index_name is None or key[0] == index_name))
+    for key in list(_cache.keys()):
+        if key[1] == user_id and (index_name is None or key[0] == index_name):
+            _cache.pop(key)
@@ -0,0 +1,85 @@
+from dotenv import load_dotenv
+from database.database import get_connection
+
+load_dotenv()
+
+'''
+Ids of the vectors written for Postgres rows.
+
+Vector ids are built from the rows they index (see utils/pinecone_db): a
+message is "<chat_title>_<message_id>", a photo "<filename>_<image_id>" and
+each of its detected objects "<filename>_<image_id>_r<n>". Deletes and cache
+loads list ids from here instead of filtering the index by metadata, which
+serverless Pinecone indexes do not support.
+'''
+
+# Upper bound on region vectors of a photo whose cached inference is gone
+# (matches MAX_REGIONS_PER_IMAGE's default)
+UNKNOWN_REGION_COUNT = 20
+
+MESSAGE_IDS_QUERY = """
+    SELECT c.chat_title, m.message_id
+    FROM messages m
+    JOIN chat_logs c ON c.chat_id = m.chat_id
+    WHERE {where}
+"""
+
+# Region vectors are numbered per photo; the cached inference says how many there can be
+IMAGE_IDS_QUERY = """
+    SELECT i.image_id, i.filename, jsonb_array_length(c.regions) AS regions
+    FROM images i
+    LEFT JOIN image_inference_cache c ON c.content_hash = i.content_hash
+    WHERE {where}
+"""
+
+
+def _message_vector_ids(rows):
+    return [row["chat_title"] + '_' + str(row["message_id"]) for row in rows]
+
+
+def _image_vector_ids(rows, unknown_regions):
+    ids = []
+    for row in rows:
+        image_vector_id = row["filename"] + '_' + str(row["image_id"])
+        regions = row["regions"] if row["regions"] is not None else unknown_regions
+        ids.append(image_vector_id)
+        ids.extend(image_vector_id + '_r' + str(i) for i in range(regions))
+    return ids
+
+
+def _vector_ids(queries, unknown_regions):
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor()
+        ids = []
+        for kind, query, params in queries:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            ids.extend(_message_vector_ids(rows) if kind == "message" else _image_vector_ids(rows, unknown_regions))
+        return ids
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def user_vector_ids(user_id, unknown_regions=0):
+    """Ids of every vector of a user."""
+    return _vector_ids([
+        ("message", MESSAGE_IDS_QUERY.format(where="c.user_id = %s"), (user_id,)),
+        ("image", IMAGE_IDS_QUERY.format(where="i.user_id = %s"), (user_id,)),
+    ], unknown_regions)
+
+
+def chat_vector_ids(chat_id):
+    """Ids of the message vectors of a chat log."""
+    return _vector_ids([("message", MESSAGE_IDS_QUERY.format(where="m.chat_id = %s"), (chat_id,))], 0)
+
+
+def image_vector_ids(image_id, unknown_regions=UNKNOWN_REGION_COUNT):
+    """Ids of a photo's vector and its region vectors."""
+    return _vector_ids([("image", IMAGE_IDS_QUERY.format(where="i.image_id = %s"), (image_id,))], unknown_regions)
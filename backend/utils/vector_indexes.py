@@ -0,0 +1,140 @@
+import hashlib
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from database.database import get_connection
+from utils import metrics
+
+load_dotenv()
+
+'''
+Registry of vector indexes and the embedding version each one holds.
+
+Every vector is tagged with the embedding version that produced it (CLIP
+checkpoint plus the text format of message vectors, see
+utils/pinecone_db.embedding_version). Moving to a new version never rewrites
+the serving index in place: the re-embed job (utils/reembed.py) registers a
+new index as "building", fills it while ingest dual-writes to it, then
+activates it in one transaction. Every process re-reads the active index
+every VECTOR_INDEX_REFRESH_SECONDS, so the cutover needs no restart and the
+previous index stays intact (status "retired") for a rollback.
+
+Without any registered index, BASE_INDEX_NAME is the active one.
+'''
+
+BASE_INDEX_NAME = "item-context-embeddings-512"
+VECTOR_INDEX_REFRESH_SECONDS = float(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", 30))
+
+_state = {"active": None, "building": None, "loaded_at": None}
+_state_lock = threading.Lock()
+
+
+def versioned_index_name(version):
+    """Index name for an embedding version; Pinecone names allow only [a-z0-9-]."""
+    return f"{BASE_INDEX_NAME}-{hashlib.sha1(version.encode()).hexdigest()[:8]}"
+
+
+def _load_state():
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT index_name, embedding_version, status
+            FROM vector_indexes
+            WHERE status IN ('active', 'building')
+            ORDER BY created_at DESC
+        """)
+        rows = cursor.fetchall()
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+    state = {"active": None, "building": None}
+    for row in rows:
+        if state[row["status"]] is None:
+            state[row["status"]] = dict(row)
+    return state
+
+
+def index_state(refresh=False):
+    """
+    The active and the building index, each {"index_name", "embedding_version",
+    "status"} or None, cached for VECTOR_INDEX_REFRESH_SECONDS.
+    """
+    with _state_lock:
+        stale = _state["loaded_at"] is None or time.monotonic() - _state["loaded_at"] > VECTOR_INDEX_REFRESH_SECONDS
+        if refresh or stale:
+            try:
+                _state.update(_load_state())
+            except Exception as e:
+                # Keep serving from the last known state (or the base index)
+                print("Error reading vector index registry:", e)
+            _state["loaded_at"] = time.monotonic()
+        return {"active": _state["active"], "building": _state["building"]}
+
+
+def active_index_name():
+    active = index_state()["active"]
+    return active["index_name"] if active else BASE_INDEX_NAME
+
+
+def register_index(index_name, embedding_version):
+    """Records `index_name` as building, unless it is already registered."""
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO vector_indexes (index_name, embedding_version, status)
+            VALUES (%s, %s, 'building')
+            ON CONFLICT (index_name) DO NOTHING
+        """, (index_name, embedding_version))
+        conn.commit()
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+    index_state(refresh=True)
+
+
+def activate_index(index_name):
+    """Atomically makes `index_name` the active index and retires the previous one."""
+    conn = get_connection()
+    cursor = None
+
+    try:
+        cursor = conn.cursor()
+        # Serializes concurrent cutovers
+        cursor.execute("LOCK TABLE vector_indexes IN EXCLUSIVE MODE")
+        cursor.execute("""
+            UPDATE vector_indexes SET status = 'retired', retired_at = NOW()
+            WHERE status = 'active' AND index_name <> %s
+        """, (index_name,))
+        cursor.execute("""
+            UPDATE vector_indexes SET status = 'active', activated_at = NOW()
+            WHERE index_name = %s
+        """, (index_name,))
+        if cursor.rowcount != 1:
+            raise ValueError(f"Vector index '{index_name}' is not registered")
+        conn.commit()
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+    metrics.increment("vector_indexes.cutover")
+    index_state(refresh=True)
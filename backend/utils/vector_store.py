@@ -0,0 +1,717 @@
+import json
+import os
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from utils import metrics
+from utils.compact_embeddings import encode, load
+
+load_dotenv()
+
+'''
+Vector storage behind utils/pinecone_db.py.
+
+VECTOR_STORE picks the backend:
+
+  pinecone  the Pinecone serverless index (default)
+  local     an in-process store persisted under VECTOR_STORE_DIR, for on-prem
+            deployments, offline benchmarks and running without network access
+
+Both take Pinecone-style records ({"id", "values", "metadata"}) and filters
+({"user_id": 3, "type": {"$in": ["image", "region"]}}) and return
+{"matches": [{"id", "score", "metadata"}]} with cosine scores, so callers do
+not care which one is configured.
+
+Each user's vectors live in their own namespace ("user-<id>", see
+VECTOR_NAMESPACES), so a user's data can be dropped in one call and queries
+never scan other tenants. Vectors from before namespaces sit in the default
+namespace ("") until scripts/migrate_namespaces.py moves them. In the local
+store a namespace is a child store under namespaces/.
+
+The local store keeps vectors L2-normalized in append-only segments: every
+upsert writes one .npy matrix plus a .json file of ids and metadata, and
+deletes are logged as tombstones. Matrices are stored as VECTOR_STORE_ENCODING
+(float32, float16 or int8, see utils/compact_embeddings.py) and scored in that
+form; segments written with another encoding are still read, and converted
+when compacted. Segments are memory-mapped on load, and
+small segments are merged once there are more than VECTOR_STORE_MAX_SEGMENTS.
+Queries filtered to a user with at most VECTOR_STORE_ANN_THRESHOLD vectors are
+an exact NumPy matrix product over that user's rows; larger tenants get an
+HNSW index (hnswlib, optional) persisted next to the segments and kept up to
+date incrementally.
+'''
+
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone")
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "vector_store")
+VECTOR_STORE_ANN_THRESHOLD = int(os.getenv("VECTOR_STORE_ANN_THRESHOLD", 20000))
+VECTOR_STORE_MAX_SEGMENTS = int(os.getenv("VECTOR_STORE_MAX_SEGMENTS", 16))
+VECTOR_STORE_ENCODING = os.getenv("VECTOR_STORE_ENCODING", "float32")
+# off: every vector in the default namespace, tenants separated by user_id filters
+# migrating: writes go to per-user namespaces, reads also cover the default one
+# on: per-user namespaces only, once scripts/migrate_namespaces.py has run
+VECTOR_NAMESPACES = os.getenv("VECTOR_NAMESPACES", "migrating")
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 128))
+ANN_OVERFETCH = 4
+
+
+def user_namespace(user_id):
+    return f"user-{user_id}"
+
+
+def write_namespace(user_id):
+    """Namespace new vectors of a user go to ("" is the default namespace)."""
+    if VECTOR_NAMESPACES == "off" or user_id is None:
+        return ""
+    return user_namespace(user_id)
+
+
+def read_namespaces(user_id):
+    """Namespaces that can hold vectors of a user under VECTOR_NAMESPACES."""
+    if VECTOR_NAMESPACES == "off":
+        return [""]
+    if VECTOR_NAMESPACES == "on":
+        return [user_namespace(user_id)]
+    return [user_namespace(user_id), ""]
+
+
+class VectorStore:
+    """
+    Interface every vector backend implements. Every call works on one
+    namespace, the default one ("") unless given.
+    """
+
+    def upsert(self, vectors, namespace=""):
+        """Inserts or replaces records ({"id", "values", "metadata"})."""
+        raise NotImplementedError
+
+    def query(self, vector, top_k, filter=None, include_metadata=True, namespace=""):
+        """Returns {"matches": [{"id", "score", "metadata"}]}, best match first."""
+        raise NotImplementedError
+
+    def delete(self, ids=None, delete_all=False, filter=None, namespace=""):
+        raise NotImplementedError
+
+    def fetch(self, ids, namespace=""):
+        """Returns {id: {"values", "metadata"}} for the ids that exist."""
+        raise NotImplementedError
+
+    def fetch_metadata(self, ids, namespace=""):
+        """Returns {id: metadata} for the ids that exist."""
+        return {vector_id: record["metadata"] for vector_id, record in self.fetch(ids, namespace).items()}
+
+    def fetch_user(self, user_id, ids):
+        """`fetch` across every namespace that can hold the user's vectors."""
+        found = {}
+        for namespace in reversed(read_namespaces(user_id)):
+            # The user's own namespace is read last so its copy wins
+            found.update(self.fetch(ids, namespace))
+        return found
+
+    def describe_index_stats(self):
+        """Returns at least {"total_vector_count", "dimension", "namespaces"} (vectors per namespace)."""
+        raise NotImplementedError
+
+
+class PineconeVectorStore(VectorStore):
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, vectors, namespace=""):
+        self.index.upsert(vectors=vectors, namespace=namespace)
+
+    def query(self, vector, top_k, filter=None, include_metadata=True, namespace=""):
+        result = self.index.query(
+            vector=list(vector), top_k=top_k, include_metadata=include_metadata, filter=filter, namespace=namespace,
+        )
+        return {
+            "matches": [
+                {"id": match["id"], "score": match["score"], "metadata": match["metadata"] or {}}
+                for match in result["matches"]
+            ]
+        }
+
+    def delete(self, ids=None, delete_all=False, filter=None, namespace=""):
+        if delete_all:
+            self.index.delete(delete_all=True, namespace=namespace)
+        elif filter is not None:
+            # Only pod-based indexes support this; serverless ones delete by id
+            self.index.delete(filter=filter, namespace=namespace)
+        elif ids:
+            ids = list(ids)
+            for start in range(0, len(ids), 1000):
+                self.index.delete(ids=ids[start:start + 1000], namespace=namespace)
+
+    def fetch(self, ids, namespace=""):
+        found = {}
+        ids = list(ids)
+        # Fetch ids travel in the URL, so they are sent in small chunks
+        for start in range(0, len(ids), 100):
+            response = self.index.fetch(ids=ids[start:start + 100], namespace=namespace)
+            for vector_id, vector in response.vectors.items():
+                found[vector_id] = {"values": vector.values, "metadata": dict(vector.metadata or {})}
+        return found
+
+    def describe_index_stats(self):
+        stats = self.index.describe_index_stats()
+        return {
+            "total_vector_count": stats["total_vector_count"],
+            "dimension": stats["dimension"],
+            "namespaces": {name: summary["vector_count"] for name, summary in (stats.get("namespaces") or {}).items()},
+        }
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _atomic_write(path, write):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _condition_matches(condition, value):
+    if not isinstance(condition, dict):
+        return value == condition
+    for op, operand in condition.items():
+        if op == "$eq" and not value == operand:
+            return False
+        if op == "$ne" and not value != operand:
+            return False
+        if op == "$in" and value not in operand:
+            return False
+        if op == "$nin" and value in operand:
+            return False
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            if value is None:
+                return False
+            if op == "$gt" and not value > operand:
+                return False
+            if op == "$gte" and not value >= operand:
+                return False
+            if op == "$lt" and not value < operand:
+                return False
+            if op == "$lte" and not value <= operand:
+                return False
+    return True
+
+
+def metadata_matches(filter, metadata):
+    """Evaluates a Pinecone metadata filter against one record's metadata."""
+    if not filter:
+        return True
+    for field, condition in filter.items():
+        if field == "$and":
+            if not all(metadata_matches(clause, metadata) for clause in condition):
+                return False
+        elif field == "$or":
+            if not any(metadata_matches(clause, metadata) for clause in condition):
+                return False
+        elif not _condition_matches(condition, metadata.get(field)):
+            return False
+    return True
+
+
+def _filter_user(filter):
+    """The single user_id a filter selects, or None."""
+    if not filter or "user_id" not in filter:
+        return None
+    condition = filter["user_id"]
+    if isinstance(condition, dict):
+        return condition.get("$eq") if list(condition) == ["$eq"] else None
+    return condition
+
+
+class _Segment:
+    def __init__(self, seq, keys, ids, metadata, vectors):
+        self.seq = seq
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.ids = ids
+        self.metadata = metadata
+        self.vectors = vectors
+        self.alive = np.ones(len(ids), dtype=bool)
+        self._columns = {}
+        self._users = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, field):
+        """Values of a metadata field as an array, typed when every row has a str or int."""
+        if field not in self._columns:
+            values = [metadata.get(field) for metadata in self.metadata]
+            if values and all(isinstance(value, str) for value in values):
+                column = np.asarray(values)
+            elif values and all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+                column = np.asarray(values, dtype=np.int64)
+            else:
+                column = np.empty(len(values), dtype=object)
+                column[:] = values
+            self._columns[field] = column
+        return self._columns[field]
+
+    def user_rows(self, user_id):
+        if self._users is None:
+            users = {}
+            for row, metadata in enumerate(self.metadata):
+                users.setdefault(metadata.get("user_id"), []).append(row)
+            self._users = {user: np.asarray(rows, dtype=np.int64) for user, rows in users.items()}
+        return self._users.get(user_id, np.empty(0, dtype=np.int64))
+
+    def mask(self, filter, rows):
+        """Vectorized filter over `rows`, for the equality / $in filters used by search."""
+        mask = np.ones(len(rows), dtype=bool)
+        for field, condition in (filter or {}).items():
+            if field.startswith("$"):
+                mask &= np.fromiter((metadata_matches({field: condition}, self.metadata[row]) for row in rows), bool, len(rows))
+                continue
+            values = self.column(field)[rows]
+            if not isinstance(condition, dict):
+                mask &= values == condition
+            elif list(condition) == ["$in"] and values.dtype != object:
+                mask &= np.isin(values, condition["$in"])
+            elif list(condition) == ["$in"]:
+                allowed = set(condition["$in"])
+                mask &= np.fromiter((value in allowed for value in values), bool, len(rows))
+            else:
+                mask &= np.fromiter((_condition_matches(condition, value) for value in values), bool, len(rows))
+        return mask
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store persisted to `path` (see the module docstring).
+    """
+
+    def __init__(self, path, ann_threshold=VECTOR_STORE_ANN_THRESHOLD, max_segments=VECTOR_STORE_MAX_SEGMENTS, encoding=VECTOR_STORE_ENCODING):
+        if encoding not in ("float32", "float16", "int8"):
+            # PQ needs a trained codebook, which append-only segments don't have
+            raise ValueError(f"Unknown VECTOR_STORE_ENCODING '{encoding}', expected float32, float16 or int8")
+        self.path = path
+        self.encoding = encoding
+        self.ann_threshold = ann_threshold
+        self.max_segments = max_segments
+        self._segments_dir = os.path.join(path, "segments")
+        self._ann_dir = os.path.join(path, "ann")
+        self._tombstones_path = os.path.join(path, "tombstones.jsonl")
+        self._lock = threading.RLock()
+        self._ann = {}
+        self._ann_lock = threading.Lock()
+        self._namespaces = {}
+        self._namespaces_dir = os.path.join(path, "namespaces")
+        os.makedirs(self._segments_dir, exist_ok=True)
+        os.makedirs(self._ann_dir, exist_ok=True)
+        self._load()
+
+    # Persistence
+
+    def _segment_path(self, seq, extension):
+        # "matrix" is the prefix of the segment's .npy files
+        if extension == "matrix":
+            return os.path.join(self._segments_dir, f"{seq:08d}")
+        return os.path.join(self._segments_dir, f"{seq:08d}.{extension}")
+
+    def _load(self):
+        self._segments = []
+        self._locations = {}
+        self._key_locations = {}
+        self._next_seq = 0
+        self._next_key = 0
+
+        names = sorted(name for name in os.listdir(self._segments_dir) if name.endswith(".json"))
+        for name in names:
+            seq = int(name.split(".")[0])
+            with open(os.path.join(self._segments_dir, name)) as f:
+                info = json.load(f)
+            vectors = load(self._segment_path(seq, "matrix"))
+            self._add_segment(_Segment(seq, info["keys"], info["ids"], info["metadata"], vectors))
+            self._next_seq = seq + 1
+            if info["keys"]:
+                self._next_key = max(self._next_key, max(info["keys"]) + 1)
+
+        if os.path.exists(self._tombstones_path):
+            with open(self._tombstones_path) as f:
+                for line in f:
+                    tombstone = json.loads(line)
+                    location = self._locations.get(tombstone["id"])
+                    if location and location[0].seq <= tombstone["seq"]:
+                        self._kill(tombstone["id"])
+
+    def _add_segment(self, segment):
+        for row, vector_id in enumerate(segment.ids):
+            self._kill(vector_id)
+            self._locations[vector_id] = (segment, row)
+            self._key_locations[int(segment.keys[row])] = (segment, row)
+        self._segments.append(segment)
+
+    def _kill(self, vector_id):
+        location = self._locations.pop(vector_id, None)
+        if location is None:
+            return
+        segment, row = location
+        segment.alive[row] = False
+        key = int(segment.keys[row])
+        self._key_locations.pop(key, None)
+        ann = self._ann.get(segment.metadata[row].get("user_id"))
+        if ann is not None:
+            try:
+                ann.mark_deleted(key)
+            except RuntimeError:
+                pass
+
+    def _write_segment(self, seq, keys, ids, metadata, vectors):
+        vectors.save(self._segment_path(seq, "matrix"))
+        # The .json is written last, a segment without it is ignored on load
+        payload = json.dumps({"keys": [int(key) for key in keys], "ids": ids, "metadata": metadata}).encode()
+        _atomic_write(self._segment_path(seq, "json"), lambda f: f.write(payload))
+
+    # Namespaces are child stores under namespaces/, the default one is this store
+
+    def _namespace(self, namespace):
+        with self._lock:
+            store = self._namespaces.get(namespace)
+            if store is None:
+                store = LocalVectorStore(
+                    os.path.join(self._namespaces_dir, namespace),
+                    ann_threshold=self.ann_threshold, max_segments=self.max_segments, encoding=self.encoding,
+                )
+                self._namespaces[namespace] = store
+            return store
+
+    def _existing_namespace(self, namespace):
+        # Reads and deletes of a namespace never written to don't create it
+        if namespace in self._namespaces or os.path.isdir(os.path.join(self._namespaces_dir, namespace)):
+            return self._namespace(namespace)
+        return None
+
+    def namespace_names(self):
+        names = set(self._namespaces)
+        if os.path.isdir(self._namespaces_dir):
+            names.update(os.listdir(self._namespaces_dir))
+        return sorted(names)
+
+    # VectorStore
+
+    def upsert(self, vectors, namespace=""):
+        if namespace:
+            return self._namespace(namespace).upsert(vectors)
+        # Last record wins when an id repeats within the batch, as with Pinecone
+        records = list({vector["id"]: vector for vector in vectors}.values())
+        if not records:
+            return
+
+        ids = [record["id"] for record in records]
+        metadata = [record.get("metadata", {}) for record in records]
+        matrix = encode(_normalize(np.asarray([record["values"] for record in records], dtype=np.float32)), self.encoding)
+
+        with self._lock:
+            seq = self._next_seq
+            keys = list(range(self._next_key, self._next_key + len(records)))
+            self._write_segment(seq, keys, ids, metadata, matrix)
+            segment = _Segment(seq, keys, ids, metadata, matrix)
+            self._add_segment(segment)
+            self._next_seq += 1
+            self._next_key += len(records)
+            self._ann_add(segment, np.arange(len(segment)))
+            if len(self._segments) > self.max_segments:
+                self._compact()
+        metrics.increment("vector_store.upserted", len(records))
+
+    def delete(self, ids=None, delete_all=False, filter=None, namespace=""):
+        if namespace:
+            store = self._existing_namespace(namespace)
+            return store.delete(ids=ids, delete_all=delete_all, filter=filter) if store else None
+        with self._lock:
+            if delete_all:
+                for directory in (self._segments_dir, self._ann_dir):
+                    for name in os.listdir(directory):
+                        os.remove(os.path.join(directory, name))
+                if os.path.exists(self._tombstones_path):
+                    os.remove(self._tombstones_path)
+                self._ann = {}
+                self._load()
+                return
+
+            if filter is not None:
+                ids = [
+                    segment.ids[row]
+                    for segment in self._segments
+                    for row in np.flatnonzero(segment.alive)
+                    if metadata_matches(filter, segment.metadata[row])
+                ]
+            ids = [vector_id for vector_id in (ids or []) if vector_id in self._locations]
+            if not ids:
+                return
+
+            with open(self._tombstones_path, "a") as f:
+                for vector_id in ids:
+                    f.write(json.dumps({"id": vector_id, "seq": self._next_seq - 1}) + "\n")
+            for vector_id in ids:
+                self._kill(vector_id)
+        metrics.increment("vector_store.deleted", len(ids))
+
+    def query(self, vector, top_k, filter=None, include_metadata=True, namespace=""):
+        if namespace:
+            store = self._existing_namespace(namespace)
+            return store.query(vector, top_k, filter=filter, include_metadata=include_metadata) if store else {"matches": []}
+        query = _normalize(np.asarray(vector, dtype=np.float32).reshape(-1))
+        user_id = _filter_user(filter)
+
+        with metrics.timer("vector_store.query"):
+            with self._lock:
+                segments = list(self._segments)
+
+            candidates = [
+                (segment, segment.user_rows(user_id) if user_id is not None else np.arange(len(segment)))
+                for segment in segments
+            ]
+            candidates = [(segment, rows[segment.alive[rows]]) for segment, rows in candidates]
+            candidate_count = sum(len(rows) for _, rows in candidates)
+
+            if user_id is not None and candidate_count > self.ann_threshold and self._ann_available():
+                hits = self._ann_query(user_id, query, top_k, filter)
+            else:
+                hits = self._exact_query(candidates, query, top_k, filter)
+
+        return {
+            "matches": [
+                {
+                    "id": segment.ids[row],
+                    "score": round(float(score), 6),
+                    "metadata": dict(segment.metadata[row]) if include_metadata else {},
+                }
+                for segment, row, score in hits
+            ]
+        }
+
+    def _exact_query(self, candidates, query, top_k, filter):
+        hits = []
+        for segment, rows in candidates:
+            rows = rows[segment.mask(filter, rows)]
+            if not len(rows):
+                continue
+            # Gathering rows copies them, scanning the whole segment is cheaper past ~1/4
+            if len(rows) * 4 > len(segment):
+                scores = segment.vectors.scores(query)[rows]
+            else:
+                scores = segment.vectors.scores(query, rows)
+            if len(rows) > top_k:
+                best = np.argpartition(-scores, top_k - 1)[:top_k]
+                rows, scores = rows[best], scores[best]
+            hits.extend(zip([segment] * len(rows), rows, scores))
+        return sorted(hits, key=lambda hit: -hit[2])[:top_k]
+
+    def fetch(self, ids, namespace=""):
+        if namespace:
+            store = self._existing_namespace(namespace)
+            return store.fetch(ids) if store else {}
+        with self._lock:
+            locations = [(vector_id, self._locations[vector_id]) for vector_id in ids if vector_id in self._locations]
+        return {
+            vector_id: {
+                "values": segment.vectors.decode(np.array([row]))[0],
+                "metadata": dict(segment.metadata[row]),
+            }
+            for vector_id, (segment, row) in locations
+        }
+
+    def describe_index_stats(self):
+        with self._lock:
+            dimension = next((segment.vectors.dimension for segment in self._segments if len(segment)), 0)
+            namespaces = {"": len(self._locations)}
+        for name in self.namespace_names():
+            namespaces[name] = len(self._namespace(name)._locations)
+        with self._lock:
+            return {
+                "total_vector_count": sum(namespaces.values()),
+                "namespaces": namespaces,
+                "dimension": dimension,
+                "encoding": self.encoding,
+                "vector_bytes": sum(segment.vectors.nbytes for segment in self._segments),
+                "segments": len(self._segments),
+                "ann_users": len(self._ann),
+            }
+
+    # Segment merging
+
+    def _compact(self):
+        """
+        Merges every segment after the first into one. When that tail has
+        grown as large as the first segment, or many rows are dead, the first
+        is merged too and the tombstone log cleared. Row keys are kept so
+        HNSW indexes stay valid.
+        """
+        first = self._segments[0]
+        tail_rows = sum(len(segment) for segment in self._segments[1:])
+        dead_rows = sum(len(segment) - int(segment.alive.sum()) for segment in self._segments)
+        full = tail_rows >= len(first) or dead_rows > 0.3 * sum(len(segment) for segment in self._segments)
+        merging = self._segments if full else self._segments[1:]
+
+        keys, ids, metadata, vectors = [], [], [], []
+        for segment in merging:
+            rows = np.flatnonzero(segment.alive)
+            keys.extend(int(key) for key in segment.keys[rows])
+            ids.extend(segment.ids[row] for row in rows)
+            metadata.extend(segment.metadata[row] for row in rows)
+            vectors.append(segment.vectors.decode(rows))
+        matrix = encode(np.concatenate(vectors), self.encoding)
+
+        # A fresh seq, so no file of a live segment is overwritten: until the
+        # merged .json exists the old segments load as before, and after it the
+        # merged rows (newest seq) win over any old files left by a crash
+        seq = self._next_seq
+        self._write_segment(seq, keys, ids, metadata, matrix)
+        self._next_seq += 1
+        for segment in merging:
+            for extension in ("json", "npy", "scales.npy", "codebook.npy"):
+                if os.path.exists(self._segment_path(segment.seq, extension)):
+                    os.remove(self._segment_path(segment.seq, extension))
+        if full and os.path.exists(self._tombstones_path):
+            os.remove(self._tombstones_path)
+
+        merged = _Segment(seq, keys, ids, metadata, load(self._segment_path(seq, "matrix")))
+        self._segments = [segment for segment in self._segments if segment not in merging]
+        for row, vector_id in enumerate(ids):
+            self._locations[vector_id] = (merged, row)
+            self._key_locations[keys[row]] = (merged, row)
+        self._segments.append(merged)
+        self._ann_save_all()
+        metrics.increment("vector_store.compactions")
+
+    # HNSW for large tenants
+
+    def _ann_available(self):
+        try:
+            import hnswlib  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def _ann_path(self, user_id):
+        return os.path.join(self._ann_dir, f"user_{user_id}.bin")
+
+    def _user_rows(self, user_id):
+        keys, vectors = [], []
+        for segment in self._segments:
+            rows = segment.user_rows(user_id)
+            rows = rows[segment.alive[rows]]
+            keys.append(segment.keys[rows])
+            vectors.append(segment.vectors.decode(rows))
+        return np.concatenate(keys), np.concatenate(vectors)
+
+    def _get_ann(self, user_id):
+        """Loads or builds the user's HNSW index, catching up with changes since it was saved."""
+        import hnswlib
+
+        with self._ann_lock:
+            ann = self._ann.get(user_id)
+            if ann is not None:
+                return ann
+
+            with self._lock:
+                keys, vectors = self._user_rows(user_id)
+                dimension = vectors.shape[1]
+                ann = hnswlib.Index(space="ip", dim=dimension)
+                path = self._ann_path(user_id)
+                if os.path.exists(path):
+                    ann.load_index(path, max_elements=len(keys))
+                    indexed = set(ann.get_ids_list())
+                    alive = set(keys.tolist())
+                    missing = np.isin(keys, list(alive - indexed))
+                    if missing.any():
+                        ann.resize_index(max(ann.get_max_elements(), ann.get_current_count() + int(missing.sum())))
+                        ann.add_items(vectors[missing], keys[missing])
+                    for key in indexed - alive:
+                        try:
+                            ann.mark_deleted(key)
+                        except RuntimeError:
+                            pass
+                else:
+                    ann.init_index(max_elements=len(keys), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+                    ann.add_items(vectors, keys)
+                    metrics.increment("vector_store.ann_builds")
+                ann.set_ef(HNSW_EF_SEARCH)
+                ann.save_index(path)
+                self._ann[user_id] = ann
+            return ann
+
+    def _ann_add(self, segment, rows):
+        for user_id, ann in self._ann.items():
+            user_rows = np.intersect1d(segment.user_rows(user_id), rows)
+            if not len(user_rows):
+                continue
+            if ann.get_current_count() + len(user_rows) > ann.get_max_elements():
+                ann.resize_index(2 * (ann.get_current_count() + len(user_rows)))
+            ann.add_items(segment.vectors.decode(user_rows), segment.keys[user_rows])
+
+    def _ann_save_all(self):
+        for user_id, ann in self._ann.items():
+            ann.save_index(self._ann_path(user_id))
+
+    def _ann_query(self, user_id, query, top_k, filter):
+        ann = self._get_ann(user_id)
+        rest = {field: condition for field, condition in filter.items() if field != "user_id"}
+
+        def allowed(key):
+            location = self._key_locations.get(key)
+            return location is not None and metadata_matches(rest, location[0].metadata[location[1]])
+
+        def search(k, filter_fn):
+            k = min(k, ann.get_current_count())
+            if k == 0:
+                return []
+            # Upserts may resize the index, which is not safe during a search
+            with self._lock:
+                ann.set_ef(max(HNSW_EF_SEARCH, k))
+                labels, distances = ann.knn_query(query, k=k, filter=filter_fn)
+            hits = []
+            for key, distance in zip(labels[0], distances[0]):
+                location = self._key_locations.get(int(key))
+                if location is not None and (filter_fn is not None or allowed(int(key))):
+                    hits.append((location[0], location[1], 1.0 - float(distance)))
+            return hits[:top_k]
+
+        metrics.increment("vector_store.ann_queries")
+        # A filter callback runs in Python for every visited node, so first try
+        # over-fetching without it and filtering the results
+        hits = search(top_k * ANN_OVERFETCH if rest else top_k, None)
+        if len(hits) < top_k and rest:
+            metrics.increment("vector_store.ann_filtered_queries")
+            hits = search(top_k, allowed)
+        return hits
+
+    def save(self):
+        """Persists in-memory HNSW updates; segments are always written on upsert."""
+        with self._lock:
+            self._ann_save_all()
+
+
+def build_vector_store(index_name):
+    """Creates the store selected by VECTOR_STORE for `index_name`."""
+    if VECTOR_STORE == "local":
+        return LocalVectorStore(os.path.join(VECTOR_STORE_DIR, index_name))
+    if VECTOR_STORE != "pinecone":
+        raise ValueError(f"Unknown VECTOR_STORE '{VECTOR_STORE}', expected pinecone or local")
+
+    from pinecone import Pinecone, ServerlessSpec
+
+    pc = Pinecone(api_key=os.environ.get("PINECONE_API_KEY"))
+
+    # Create the index if it doesn't exist
+    if index_name not in pc.list_indexes().names():
+        pc.create_index(
+            name=index_name,
+            dimension=512,
+            spec=ServerlessSpec(
+                cloud="aws",  # Specify your cloud provider
+                region="us-east-1"  # Specify your region
+            ),
+            metric="cosine"  # You can use 'cosine', 'euclidean', or 'dotproduct'
+        )
+
+    # Connect to the index
+    return PineconeVectorStore(pc.Index(index_name))
@@ -0,0 +1,153 @@
+import os
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+Keyframe selection and cross-frame deduplication for walkthrough videos.
+
+Running the detector on every frame of a 5 minute 1080p video (~9000 frames)
+would take hours on CPU and store the same sofa hundreds of times. Instead:
+
+  1. Frames are decoded sequentially and only VIDEO_SAMPLE_FPS candidates per
+     second are converted. Each candidate is shrunk to a small grayscale
+     thumbnail and compared with the last keyframe; it becomes a keyframe when
+     the scene changed by more than VIDEO_SCENE_THRESHOLD, or when
+     VIDEO_MAX_GAP_SECONDS passed without one (slow pans).
+  2. At most VIDEO_MAX_KEYFRAMES are kept (evenly spread), so the detection
+     cost is bounded whatever the video length.
+  3. After detection, regions with the same label whose CLIP embeddings are
+     closer than VIDEO_DEDUP_SIMILARITY are treated as the same object seen
+     from several frames, and only the most confident view is kept.
+
+opencv-python is only needed for video ingestion and is imported lazily.
+'''
+
+VIDEO_SAMPLE_FPS = float(os.getenv("VIDEO_SAMPLE_FPS", 2))
+VIDEO_SCENE_THRESHOLD = float(os.getenv("VIDEO_SCENE_THRESHOLD", 18))
+VIDEO_MAX_GAP_SECONDS = float(os.getenv("VIDEO_MAX_GAP_SECONDS", 10))
+VIDEO_MAX_KEYFRAMES = int(os.getenv("VIDEO_MAX_KEYFRAMES", 48))
+VIDEO_MAX_SECONDS = float(os.getenv("VIDEO_MAX_SECONDS", 600))
+VIDEO_DEDUP_SIMILARITY = float(os.getenv("VIDEO_DEDUP_SIMILARITY", 0.88))
+
+# Side of the grayscale thumbnail used for scene-change detection
+SCENE_THUMBNAIL_SIDE = 64
+
+
+class VideoTooLongError(ValueError):
+    pass
+
+
+def scene_thumbnail(cv2, frame_bgr):
+    small = cv2.resize(frame_bgr, (SCENE_THUMBNAIL_SIDE, SCENE_THUMBNAIL_SIDE), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+
+def to_pil(cv2, frame_bgr, max_side):
+    image = Image.fromarray(cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB))
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.BICUBIC)
+    return image
+
+
+def sample_keyframes(video_path, max_side, max_keyframes=VIDEO_MAX_KEYFRAMES):
+    """
+    Picks representative frames of a video by scene change.
+
+    Args:
+        video_path (str): Local path of the video file.
+        max_side (int): Longest side of the returned frames.
+        max_keyframes (int): Upper bound on the number of frames returned.
+
+    Returns:
+        list of tuple: (timestamp_seconds, RGB PIL image), in video order.
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError("Could not open the video.")
+
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+        if frame_count and frame_count / fps > VIDEO_MAX_SECONDS:
+            raise VideoTooLongError(f"Videos longer than {VIDEO_MAX_SECONDS:.0f} seconds are not supported.")
+
+        stride = max(int(round(fps / VIDEO_SAMPLE_FPS)), 1)
+        keyframes = []
+        last_thumbnail = None
+        last_time = None
+        index = 0
+        while True:
+            # grab() skips the colour conversion for frames that are not candidates
+            if not capture.grab():
+                break
+            if index % stride == 0:
+                timestamp = index / fps
+                if timestamp > VIDEO_MAX_SECONDS:
+                    raise VideoTooLongError(f"Videos longer than {VIDEO_MAX_SECONDS:.0f} seconds are not supported.")
+                ok, frame = capture.retrieve()
+                if ok:
+                    thumbnail = scene_thumbnail(cv2, frame)
+                    changed = last_thumbnail is None or np.abs(thumbnail - last_thumbnail).mean() > VIDEO_SCENE_THRESHOLD
+                    if changed or timestamp - last_time >= VIDEO_MAX_GAP_SECONDS:
+                        keyframes.append((round(timestamp, 2), to_pil(cv2, frame, max_side)))
+                        last_thumbnail = thumbnail
+                        last_time = timestamp
+            index += 1
+    finally:
+        capture.release()
+
+    if len(keyframes) > max_keyframes:
+        keep = np.linspace(0, len(keyframes) - 1, max_keyframes).round().astype(int)
+        keyframes = [keyframes[i] for i in keep]
+    return keyframes
+
+
+def collapse_regions(per_frame_regions, similarity=VIDEO_DEDUP_SIMILARITY):
+    """
+    Deduplicates objects detected in several frames.
+
+    Regions are visited from the most confident down; a region joins an
+    object already kept when it has the same label and its embedding's cosine
+    similarity with that object is at least `similarity`.
+
+    Args:
+        per_frame_regions (list of list of dict): Regions (with "label",
+            "score" and "embedding") of each frame.
+
+    Returns:
+        list of list of dict: For each frame, the regions kept as the
+        representative view of their object, each with a "seen_in" count.
+    """
+    candidates = [
+        (frame, region)
+        for frame, regions in enumerate(per_frame_regions)
+        for region in regions
+    ]
+    candidates.sort(key=lambda candidate: candidate[1]["score"], reverse=True)
+
+    kept = [[] for _ in per_frame_regions]
+    objects = {}  # label -> list of (unit embedding, kept region)
+    for frame, region in candidates:
+        embedding = np.asarray(region["embedding"], dtype=np.float32)
+        embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+
+        match = None
+        for other_embedding, other_region in objects.get(region["label"], []):
+            if float(embedding @ other_embedding) >= similarity:
+                match = other_region
+                break
+
+        if match is not None:
+            match["seen_in"] += 1
+            continue
+
+        region = {**region, "seen_in": 1}
+        objects.setdefault(region["label"], []).append((embedding, region))
+        kept[frame].append(region)
+
+    return kept
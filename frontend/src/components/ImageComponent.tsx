@@ -12,7 +12,7 @@ const ImageComponent: React.FC<ImageComponentProps> = ({ imageId }) => {
     const fetchImage = async () => {
       try {
         // Include the imageId directly in the URL path
-        const response = await axios.get(`http://localhost:8000/api/get_image/${imageId}`, {
+        const response = await axios.get(`http://localhost:8000/api/get_image/${imageId}?w=256`, {
           responseType: 'blob', // Set the response type to 'blob' to handle image data
         });
         // Create an object URL for the image data and set it as the src